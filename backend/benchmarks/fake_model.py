@@ -0,0 +1,205 @@
+"""Local stand-in for the OpenAI models, for offline benchmarks.
+
+`FakeModelProvider` plugs into the Agents SDK (see
+`flowagents.base.set_model_provider`) and answers every request locally:
+
+* requests with an output schema (the Conductor) get a scripted structured
+  output, by default a `ConductorResponse` plan;
+* other requests get `output_tokens` words of filler text;
+* each response waits for a first-token latency drawn from a log-normal
+  distribution, then streams its tokens at `tokens_per_second`.
+
+No network access is needed and runs are reproducible with a fixed `seed`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import random
+import time
+from typing import Any, AsyncIterator, Callable, Optional
+
+from agents import Model, ModelProvider, ModelResponse, ModelSettings, ModelTracing, Usage
+from openai.types.responses import (
+    Response,
+    ResponseCompletedEvent,
+    ResponseCreatedEvent,
+    ResponseOutputMessage,
+    ResponseOutputText,
+    ResponseTextDeltaEvent,
+    ResponseUsage,
+)
+from openai.types.responses.response_usage import InputTokensDetails, OutputTokensDetails
+
+from flowagents.conductor import ConductorResponse
+
+DEFAULT_PLAN = ConductorResponse.model_validate(
+    {
+        "message": "I've prepared a plan: read the expense and the policies, then draft the approval email.",
+        "flow": {
+            "agents": [
+                {"name": "read_expense", "type": "filesystem", "instructions": "Read `expense.txt`.", "depends_on": []},
+                {"name": "read_policies", "type": "filesystem", "instructions": "Read `policies.txt`.", "depends_on": []},
+                {
+                    "name": "draft_email",
+                    "type": "assistant",
+                    "instructions": "Decide if an approval is needed and draft the email.",
+                    "depends_on": ["read_expense", "read_policies"],
+                },
+            ]
+        },
+    }
+)
+
+
+class LatencyProfile:
+    """First-token latency and streaming rate of a fake model."""
+
+    def __init__(
+        self,
+        first_token_ms: float = 300,
+        jitter: float = 0.3,
+        tokens_per_second: float = 200,
+        output_tokens: int = 200,
+        seed: Optional[int] = None,
+    ):
+        self.first_token_ms = first_token_ms
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self._random = random.Random(seed)
+
+    def first_token_delay(self) -> float:
+        """Seconds before the first token, log-normally distributed around the median."""
+        if self.first_token_ms <= 0:
+            return 0.0
+        return self._random.lognormvariate(0, self.jitter) * self.first_token_ms / 1000
+
+    def token_delay(self) -> float:
+        return 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+
+def _chunks(text: str) -> list[str]:
+    """Split text in word-sized pieces, roughly one token each."""
+    pieces, current = [], ""
+    for char in text:
+        current += char
+        if char in " ,:{}[]":
+            pieces.append(current)
+            current = ""
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+class FakeModel(Model):
+    """Model answering from a script, with simulated latency."""
+
+    _ids = itertools.count()
+
+    def __init__(self, name: str, profile: LatencyProfile, structured_output: Callable[[], str]):
+        self.name = name
+        self.profile = profile
+        self.structured_output = structured_output
+
+    def _text(self, output_schema: Any) -> str:
+        if output_schema is not None and not output_schema.is_plain_text():
+            return self.structured_output()
+        return " ".join(f"meow{i}" for i in range(self.profile.output_tokens))
+
+    def _response(self, text: str, input: Any) -> Response:
+        message = ResponseOutputMessage(
+            id=f"msg_{next(self._ids)}",
+            type="message",
+            role="assistant",
+            status="completed",
+            content=[ResponseOutputText(type="output_text", text=text, annotations=[], logprobs=[])],
+        )
+        input_tokens = len(json.dumps(input, default=str)) // 4
+        return Response(
+            id=f"resp_{next(self._ids)}",
+            created_at=time.time(),
+            model=self.name,
+            object="response",
+            output=[message],
+            parallel_tool_calls=False,
+            tool_choice="auto",
+            tools=[],
+            # Built without validation: the detail fields vary between openai versions.
+            usage=ResponseUsage.model_construct(
+                input_tokens=input_tokens,
+                input_tokens_details=InputTokensDetails.model_construct(cached_tokens=0),
+                output_tokens=len(_chunks(text)),
+                output_tokens_details=OutputTokensDetails.model_construct(reasoning_tokens=0),
+                total_tokens=input_tokens + len(_chunks(text)),
+            ),
+        )
+
+    async def get_response(
+        self,
+        system_instructions,
+        input,
+        model_settings: ModelSettings,
+        tools,
+        output_schema,
+        handoffs,
+        tracing: ModelTracing,
+        **kwargs,
+    ) -> ModelResponse:
+        text = self._text(output_schema)
+        await asyncio.sleep(self.profile.first_token_delay() + self.profile.token_delay() * len(_chunks(text)))
+        response = self._response(text, input)
+        usage = Usage(
+            requests=1,
+            input_tokens=response.usage.input_tokens,
+            output_tokens=response.usage.output_tokens,
+            total_tokens=response.usage.total_tokens,
+        )
+        return ModelResponse(output=response.output, usage=usage, response_id=response.id)
+
+    async def stream_response(
+        self,
+        system_instructions,
+        input,
+        model_settings: ModelSettings,
+        tools,
+        output_schema,
+        handoffs,
+        tracing: ModelTracing,
+        **kwargs,
+    ) -> AsyncIterator[Any]:
+        text = self._text(output_schema)
+        response = self._response(text, input)
+        sequence = itertools.count()
+        yield ResponseCreatedEvent(type="response.created", response=response, sequence_number=next(sequence))
+
+        await asyncio.sleep(self.profile.first_token_delay())
+        item_id = response.output[0].id
+        for piece in _chunks(text):
+            yield ResponseTextDeltaEvent(
+                type="response.output_text.delta",
+                item_id=item_id,
+                output_index=0,
+                content_index=0,
+                delta=piece,
+                logprobs=[],
+                sequence_number=next(sequence),
+            )
+            delay = self.profile.token_delay()
+            if delay:
+                await asyncio.sleep(delay)
+
+        yield ResponseCompletedEvent(type="response.completed", response=response, sequence_number=next(sequence))
+
+
+class FakeModelProvider(ModelProvider):
+    """Hand out `FakeModel`s sharing one latency profile and script."""
+
+    def __init__(self, profile: Optional[LatencyProfile] = None, plan: ConductorResponse = DEFAULT_PLAN):
+        self.profile = profile or LatencyProfile()
+        self.plan_json = plan.model_dump_json()
+
+    def get_model(self, model_name: Optional[str]) -> Model:
+        return FakeModel(model_name or "fake", self.profile, lambda: self.plan_json)
@@ -0,0 +1,325 @@
+"""Offline load and latency benchmarks for the CatGPT backend.
+
+Every model call is answered by `benchmarks.fake_model.FakeModelProvider`,
+so the numbers reflect the Python path (FastAPI, the Agents SDK, our
+agents and pools) without network access or API spend. Run from
+`backend/`:
+
+    python -m benchmarks.run --scenario all --requests 200 --concurrency 20
+
+Scenarios:
+
+* `conductor` – `ConductorAgent.plan_stream`, as used by /chat/stream;
+* `agent:<type>` – `execute_stream` of a registered agent type
+  (`assistant`, `filesystem`, `websearch`; filesystem steps talk to an
+  in-process fake MCP server, computeruse needs a real browser and is not
+  covered);
+* `http:/chat`, `http:/chat/stream`, `http:/run` – the FastAPI app served by
+  an in-process uvicorn, driven over HTTP with httpx.
+
+For each scenario the report gives p50/p95/p99 latency, time to first
+token (first streamed chunk; the full latency for non-streaming calls),
+throughput and memory (peak RSS, plus the tracemalloc peak with
+`--trace-memory`).
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import time
+import tracemalloc
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional
+
+# Keep the app away from real browsers and cached plans and steps before it is imported.
+os.environ.setdefault("BROWSER_POOL_SIZE", "0")
+os.environ.setdefault("PLAN_CACHE_SIZE", "0")
+os.environ.setdefault("STEP_CACHE_SIZE", "0")
+
+from agents import set_tracing_disabled
+from agents.mcp import MCPServer
+from mcp.types import CallToolResult, GetPromptResult, ListPromptsResult
+from openai.types.responses import ResponseTextDeltaEvent
+from pydantic import BaseModel
+
+from benchmarks.fake_model import DEFAULT_PLAN, FakeModelProvider, LatencyProfile
+from flowagents.base import set_model_provider
+from flowagents.conductor import ConductorAgent
+from flowagents.filesystem import filesystem_pool
+from flowagents.registry import registry
+
+logger = logging.getLogger(__name__)
+
+USER_MESSAGE = {
+    "role": "user",
+    "content": "I have an expense (file expense.txt). Based on the file policies.txt, decide if an approval is needed. If so, draft an email to ask for approval.",
+}
+
+# An operation performs one request and returns its time to first token in
+# seconds, or `None` when it doesn't stream.
+Operation = Callable[[], Awaitable[Optional[float]]]
+
+
+class FakeMCPServer(MCPServer):
+    """MCP server without tools, standing in for the filesystem server."""
+
+    def __init__(self):
+        super().__init__()
+
+    @property
+    def name(self) -> str:
+        return "fake-filesystem"
+
+    async def connect(self):
+        pass
+
+    async def cleanup(self):
+        pass
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.cleanup()
+
+    async def list_tools(self, run_context=None, agent=None):
+        return []
+
+    async def call_tool(self, tool_name, arguments, meta=None):
+        # A plan calling a tool gets an empty result rather than a benchmark error.
+        return CallToolResult(content=[])
+
+    async def list_prompts(self):
+        return ListPromptsResult(prompts=[])
+
+    async def get_prompt(self, name, arguments=None):
+        return GetPromptResult(messages=[])
+
+
+class ScenarioReport(BaseModel):
+    scenario: str
+    requests: int
+    concurrency: int
+    errors: int
+    duration_s: float
+    throughput_rps: float
+    latency_ms: Dict[str, float]
+    ttft_ms: Dict[str, float]
+    peak_rss_mb: float
+    traced_peak_mb: Optional[float] = None
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def at(p: float) -> float:
+        index = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))
+        return round(ordered[index] * 1000, 2)
+
+    return {"p50": at(50), "p95": at(95), "p99": at(99), "max": round(ordered[-1] * 1000, 2)}
+
+
+async def run_load(scenario: str, operation: Operation, requests: int, concurrency: int, trace_memory: bool) -> ScenarioReport:
+    """Run `requests` operations, at most `concurrency` at a time."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    ttfts: List[float] = []
+    errors = 0
+
+    async def one() -> None:
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                ttft = await operation()
+            except Exception:
+                errors += 1
+                logger.exception(f"{scenario}: request failed")
+                return
+            latency = time.perf_counter() - started
+            latencies.append(latency)
+            ttfts.append(ttft if ttft is not None else latency)
+
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    duration = time.perf_counter() - started
+    traced_peak = None
+    if trace_memory:
+        traced_peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+
+    return ScenarioReport(
+        scenario=scenario,
+        requests=requests,
+        concurrency=concurrency,
+        errors=errors,
+        duration_s=round(duration, 3),
+        throughput_rps=round(len(latencies) / duration, 2) if duration else 0.0,
+        latency_ms=percentiles(latencies),
+        ttft_ms=percentiles(ttfts),
+        # ru_maxrss is in kilobytes on Linux.
+        peak_rss_mb=round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        traced_peak_mb=round(traced_peak, 1) if traced_peak is not None else None,
+    )
+
+
+# ---------------------------------------------------------------------------
+# Scenarios
+# ---------------------------------------------------------------------------
+
+
+def conductor_operation() -> Operation:
+    conductor = ConductorAgent()
+
+    async def operation() -> Optional[float]:
+        started = time.perf_counter()
+        ttft = None
+        async for kind, _ in conductor.plan_stream([USER_MESSAGE]):
+            if ttft is None and kind != "done":
+                ttft = time.perf_counter() - started
+        return ttft
+
+    return operation
+
+
+def agent_operation(type: str) -> Operation:
+    async def operation() -> Optional[float]:
+        started = time.perf_counter()
+        ttft = None
+        async with registry.create(type, f"bench-{type}") as agent:
+            result = await agent.execute_stream([USER_MESSAGE])
+            async for event in result.stream_events():
+                if ttft is None and event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
+                    ttft = time.perf_counter() - started
+        return ttft
+
+    return operation
+
+
+def http_operation(client, path: str) -> Operation:
+    async def operation() -> Optional[float]:
+        session = {"session_id": uuid.uuid4().hex, "message": USER_MESSAGE}
+        if path == "/chat":
+            response = await client.post(path, json=session)
+            response.raise_for_status()
+            return None
+
+        body = DEFAULT_PLAN.flow.model_dump() if path == "/run" else session
+        started = time.perf_counter()
+        ttft = None
+        async with client.stream("POST", path, json=body) as response:
+            response.raise_for_status()
+            async for _ in response.aiter_raw():
+                if ttft is None:
+                    ttft = time.perf_counter() - started
+        return ttft
+
+    return operation
+
+
+async def serve_app():
+    """Start the FastAPI app on a free local port; return (server, task, base URL)."""
+    import uvicorn
+
+    from main import app
+
+    # main configures INFO logging, which would log every step of every request.
+    logging.getLogger().setLevel(logging.WARNING)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning", lifespan="on"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return server, task, f"http://127.0.0.1:{port}"
+
+
+SCENARIOS = ["conductor", "agent:assistant", "agent:filesystem", "agent:websearch", "http:/chat", "http:/chat/stream", "http:/run"]
+
+
+async def main(args: argparse.Namespace) -> List[ScenarioReport]:
+    set_tracing_disabled(True)
+    set_model_provider(
+        FakeModelProvider(
+            LatencyProfile(
+                first_token_ms=args.first_token_ms,
+                jitter=args.jitter,
+                tokens_per_second=args.tokens_per_second,
+                output_tokens=args.output_tokens,
+                seed=args.seed,
+            )
+        )
+    )
+    if filesystem_pool is not None:
+        filesystem_pool.factory = FakeMCPServer
+
+    scenarios = SCENARIOS if args.scenario == "all" else args.scenario.split(",")
+    reports: List[ScenarioReport] = []
+
+    for scenario in [s for s in scenarios if not s.startswith("http:")]:
+        operation = conductor_operation() if scenario == "conductor" else agent_operation(scenario.split(":", 1)[1])
+        reports.append(await run_load(scenario, operation, args.requests, args.concurrency, args.trace_memory))
+
+    http_scenarios = [s for s in scenarios if s.startswith("http:")]
+    if http_scenarios:
+        import httpx
+
+        server, task, base_url = await serve_app()
+        try:
+            limits = httpx.Limits(max_connections=args.concurrency)
+            async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as client:
+                for scenario in http_scenarios:
+                    operation = http_operation(client, scenario.split(":", 1)[1])
+                    reports.append(await run_load(scenario, operation, args.requests, args.concurrency, args.trace_memory))
+        finally:
+            server.should_exit = True
+            await task
+
+    if filesystem_pool is not None:
+        await filesystem_pool.close()
+    return reports
+
+
+def print_reports(reports: List[ScenarioReport]) -> None:
+    header = f"{'scenario':<20} {'ok/err':>9} {'rps':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'ttft50':>9} {'ttft95':>9} {'rss MB':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in reports:
+        print(
+            f"{r.scenario:<20} {f'{r.requests - r.errors}/{r.errors}':>9} {r.throughput_rps:>8} "
+            f"{r.latency_ms.get('p50', 0):>9} {r.latency_ms.get('p95', 0):>9} {r.latency_ms.get('p99', 0):>9} "
+            f"{r.ttft_ms.get('p50', 0):>9} {r.ttft_ms.get('p95', 0):>9} {r.peak_rss_mb:>8}"
+        )
+    print("(latencies in ms)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", default="all", help=f"'all' or a comma-separated list of: {', '.join(SCENARIOS)}")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--first-token-ms", type=float, default=300, help="median first-token latency of the fake model")
+    parser.add_argument("--jitter", type=float, default=0.3, help="sigma of the log-normal first-token latency")
+    parser.add_argument("--tokens-per-second", type=float, default=200, help="streaming rate of the fake model (0 = instant)")
+    parser.add_argument("--output-tokens", type=int, default=200, help="length of plain-text answers")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--trace-memory", action="store_true", help="also report the tracemalloc peak (slower)")
+    parser.add_argument("--json", dest="json_path", help="write the reports to this file as JSON")
+    args = parser.parse_args()
+
+    reports = asyncio.run(main(args))
+    print_reports(reports)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump([r.model_dump() for r in reports], f, indent=2)
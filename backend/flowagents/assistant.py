@@ -1,8 +1,13 @@
-from flowagents.base import BaseAgent
+import time
+
+from flowagents.base import BaseAgent, run_config
+from flowagents.metrics import record_run
 from agents import RunResult, Runner
 
 
 class AssistantAgent(BaseAgent):
+    display_name = "Assistant"
+
     def __init__(self, name: str):
         super().__init__(
             name = name,
@@ -12,4 +17,7 @@ class AssistantAgent(BaseAgent):
     async def execute(self, instruction: str) -> RunResult:
         """Executes a given task."""
         # Implement task execution logic here
-        return await Runner.run(starting_agent=self.agent, input=instruction)
+        started = time.perf_counter()
+        result = await Runner.run(starting_agent=self.agent, input=instruction, run_config=run_config())
+        record_run(self.agent_type, result, started)
+        return result
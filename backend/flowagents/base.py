@@ -1,20 +1,117 @@
-from agents import Agent, ModelSettings, RunConfig, RunResult, RunResultStreaming, Runner, TResponseInputItem
+import asyncio
+import json
+import time
+from typing import AsyncIterator
+
+from agents import Agent, ModelProvider, ModelSettings, MultiProvider, RunConfig, RunResult, RunResultStreaming, Runner, TResponseInputItem
+from agents.result import RunResultBase
 from pydantic import BaseModel
 
+from flowagents.metrics import observe_stream, record_run
+from flowagents.rate_limit import RateLimitedModelProvider, rate_limiter
+
 class AgentExecutionResult(BaseModel):
+    """State of a workflow run, keyed by step name; checkpointed after every step."""
     status: dict[str, str] = {}
-    response: dict[str, str] = {}
+    response: dict[str, str | None] = {}
+    # Conversation each step was started with (the instructions and outputs it consumed).
+    input: dict[str, list[dict]] = {}
+    # Outputs of the completed items of batch steps, by item index, so a
+    # resumed batch only runs the others.
+    items: dict[str, dict[int, str]] = {}
 
-class BaseAgent:
-    def __init__(self, name: str, instructions: str, tools=None, mcp_servers=None, model="gpt-4.1", model_settings: ModelSettings=ModelSettings()):
-        self.agent = Agent(
+# Model provider used by every run; `None` means the SDK default (OpenAI).
+# Swapped for a fake provider by the benchmarks.
+_model_provider: ModelProvider | None = None
+# The provider above behind the shared rate limiter, built on first use.
+_limited_provider: ModelProvider | None = None
+
+def set_model_provider(provider: ModelProvider | None) -> None:
+    global _model_provider, _limited_provider
+    _model_provider = provider
+    _limited_provider = None
+
+def run_config(**kwargs) -> RunConfig:
+    """`RunConfig` for a run, using the configured model provider behind the rate limiter."""
+    global _limited_provider
+    if _limited_provider is None:
+        _limited_provider = RateLimitedModelProvider(_model_provider or MultiProvider(), rate_limiter)
+    kwargs["model_provider"] = _limited_provider
+    return RunConfig(**kwargs)
+
+# Immutable SDK `Agent` definitions, shared by every step (of every request)
+# that uses the same settings. Never mutate them: per-run resources are
+# attached to a clone, see `BaseAgent.attach`.
+_definitions: dict[tuple, Agent] = {}
+
+def agent_definition(name: str, instructions: str, tools=None, model="gpt-4.1", model_settings: ModelSettings=None) -> Agent:
+    """Return the shared `Agent` for these settings, building it on first use."""
+    model_settings = model_settings or ModelSettings()
+    key = (
+        name,
+        instructions,
+        tuple(id(tool) for tool in tools or []),
+        model,
+        json.dumps(model_settings.to_json_dict(), sort_keys=True, default=str),
+    )
+    agent = _definitions.get(key)
+    if agent is None:
+        agent = _definitions[key] = Agent(
             name=name,
             instructions=instructions + " Result should follow markdown syntax.",
-            tools=tools or [],
-            mcp_servers=mcp_servers or [],
+            tools=list(tools or []),
             model=model,
             model_settings=model_settings
         )
+    return agent
+
+class BaseAgent:
+    # Name of the SDK agent; the same for every step of this type.
+    display_name = "Agent"
+    # Whether running the agent changes the outside world (submits forms...).
+    side_effects = False
+    # Step type the agent was created for (set by the registry); labels metrics.
+    agent_type = "agent"
+    # Items of a batch step (`AgentDefinition.for_each`) run at most this many at a time.
+    batch_parallelism = 4
+    # Run the first item of a batch alone, so the others can reuse what it
+    # recorded (see `replay`).
+    batch_warm_up = False
+    # Pooled resources held for the duration of a step ("browser", "mcp_server").
+    resources: tuple[str, ...] = ()
+
+    def __init__(self, name: str, instructions: str, tools=None, mcp_servers=None, model="gpt-4.1", model_settings: ModelSettings=None):
+        self.name = name
+        self.definition = agent_definition(self.display_name, instructions, tools, model, model_settings)
+        self.agent = self.definition
+        if mcp_servers:
+            self.attach(mcp_servers=mcp_servers)
+
+    def attach(self, tools=None, mcp_servers=None) -> None:
+        """Use per-run resources (browsers, MCP servers...) for this step only."""
+        self.agent = self.definition.clone(
+            tools=[*self.definition.tools, *(tools or [])],
+            mcp_servers=[*self.definition.mcp_servers, *(mcp_servers or [])],
+        )
+
+    def detach(self) -> None:
+        """Drop the per-run resources attached with `attach`."""
+        self.agent = self.definition
+
+    def cache_dependencies(self, result: RunResultBase) -> list[str] | None:
+        """Files the output of a finished run depends on, for the step cache.
+
+        `None` means the output must not be cached at all.
+        """
+        return None if self.side_effects else []
+
+    async def replay(self, instruction: str | list[TResponseInputItem]) -> str | None:
+        """Complete a step without calling the model, if the agent knows how.
+
+        Called with the agent's resources acquired, before `execute_stream`.
+        Returns the step's output, or `None` to run the model as usual.
+        """
+        return None
 
     def __enter__(self):
         return self
@@ -29,7 +126,54 @@ class BaseAgent:
         pass
 
     async def execute(self, instruction: str | list[TResponseInputItem]) -> RunResult:
-        return await Runner.run(starting_agent=self.agent, input=instruction, max_turns=100)
+        started = time.perf_counter()
+        result = await Runner.run(starting_agent=self.agent, input=instruction, max_turns=100, run_config=run_config())
+        record_run(self.agent_type, result, started)
+        return result
 
     async def execute_stream(self, instruction: str | list[TResponseInputItem]) -> RunResultStreaming:
-        return Runner.run_streamed(starting_agent=self.agent, input=instruction, max_turns=100, run_config=RunConfig(tracing_disabled=True))
\ No newline at end of file
+        result = Runner.run_streamed(starting_agent=self.agent, input=instruction, max_turns=100, run_config=run_config(tracing_disabled=True))
+        return observe_stream(self.agent_type, result)
+
+    async def execute_batch(
+        self, instructions: list[str | list[TResponseInputItem]], parallelism: int | None = None
+    ) -> AsyncIterator[tuple[int, str | None, Exception | None]]:
+        """Run a new instance of this agent per input, concurrently, each with its own resources.
+
+        Yields `(index, output, error)` as the items complete. A failed item
+        doesn't stop the others.
+        """
+        semaphore = asyncio.Semaphore(max(1, parallelism or self.batch_parallelism))
+
+        async def run_item(index: int) -> tuple[int, str | None, Exception | None]:
+            async with semaphore:
+                agent = type(self)(f"{self.name}[{index}]")
+                agent.agent_type = self.agent_type
+                try:
+                    async with agent:
+                        output = await agent.replay(instructions[index])
+                        if output is None:
+                            result = await agent.execute_stream(instructions[index])
+                            try:
+                                async for _ in result.stream_events():
+                                    pass
+                            except BaseException:
+                                result.cancel()
+                                raise
+                            output = result.final_output
+                    return index, output, None
+                except Exception as exc:
+                    return index, None, exc
+
+        first = [0] if self.batch_warm_up and len(instructions) > 1 else []
+        rest = [index for index in range(len(instructions)) if index not in first]
+        tasks: list[asyncio.Task] = []
+        try:
+            for group in (first, rest):
+                tasks = [asyncio.create_task(run_item(index)) for index in group]
+                for done in asyncio.as_completed(tasks):
+                    yield await done
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
\ No newline at end of file
@@ -0,0 +1,131 @@
+"""Pool of long-lived Chromium processes for computer-use runs.
+
+Launching a browser is the largest fixed cost of a computeruse step. The
+pool starts Playwright once, keeps `size` Chromium processes running and
+gives every run its own `BrowserContext` and `Page`. Contexts don't share
+cookies, storage or cache, so runs stay isolated while sharing a process.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import List, Optional, Tuple
+
+from playwright.async_api import Browser, BrowserContext, Page, Playwright, async_playwright
+
+logger = logging.getLogger(__name__)
+
+
+class BrowserPool:
+    """Keep a few Chromium processes warm and lend out isolated pages."""
+
+    def __init__(
+        self,
+        size: int = 2,
+        headless: bool = False,
+        max_contexts_per_browser: int = 4,
+        launch_args: Optional[List[str]] = None,
+    ):
+        self.size = max(1, size)
+        self.headless = headless
+        self.max_contexts_per_browser = max(1, max_contexts_per_browser)
+        self.launch_args = launch_args or []
+
+        self._playwright: Optional[Playwright] = None
+        self._browsers: List[Browser] = []
+        self._contexts: dict[int, int] = {}
+        self._owners: dict[int, Browser] = {}
+        self._lock: Optional[asyncio.Lock] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    @property
+    def slots(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size * self.max_contexts_per_browser)
+        return self._slots
+
+    async def start(self) -> None:
+        """Start Playwright and launch every browser of the pool."""
+        async with self.lock:
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+            started = time.monotonic()
+            missing = self.size - len(self._browsers)
+            if missing > 0:
+                self._browsers.extend(await asyncio.gather(*(self._launch() for _ in range(missing))))
+                logger.info(f"Launched {missing} browser(s) in {time.monotonic() - started:.2f}s")
+
+    async def close(self) -> None:
+        """Close every browser and stop Playwright."""
+        async with self.lock:
+            browsers, self._browsers = self._browsers, []
+            await asyncio.gather(*(browser.close() for browser in browsers), return_exceptions=True)
+            self._contexts.clear()
+            if self._playwright is not None:
+                await self._playwright.stop()
+                self._playwright = None
+
+    @property
+    def playwright(self) -> Playwright:
+        assert self._playwright is not None
+        return self._playwright
+
+    async def new_page(self, width: int, height: int, url: Optional[str] = None) -> Tuple[BrowserContext, Page]:
+        """Open a fresh context and page on the least busy browser.
+
+        Waits while every browser already hosts `max_contexts_per_browser`
+        contexts. Hand the context back with `release` once done.
+        """
+        await self.slots.acquire()
+        try:
+            browser = await self._pick_browser()
+            context = await browser.new_context(viewport={"width": width, "height": height})
+        except BaseException:
+            self.slots.release()
+            raise
+
+        self._contexts[id(browser)] = self._contexts.get(id(browser), 0) + 1
+        self._owners[id(context)] = browser
+        try:
+            page = await context.new_page()
+            if url:
+                await page.goto(url)
+        except BaseException:
+            await self.release(context)
+            raise
+        return context, page
+
+    async def release(self, context: BrowserContext) -> None:
+        """Close a context obtained from `new_page` and free its slot."""
+        browser = self._owners.pop(id(context), None)
+        if browser is None:
+            return
+        try:
+            await context.close()
+        except Exception as exc:
+            logger.warning(f"Failed to close pooled browser context: {exc}")
+        self._contexts[id(browser)] = max(0, self._contexts.get(id(browser), 0) - 1)
+        self.slots.release()
+
+    async def _launch(self) -> Browser:
+        return await self.playwright.chromium.launch(headless=self.headless, args=self.launch_args)
+
+    async def _pick_browser(self) -> Browser:
+        if len(self._browsers) < self.size or self._playwright is None:
+            await self.start()
+        async with self.lock:
+            # Replace browsers that crashed or were closed behind our back.
+            for index, browser in enumerate(self._browsers):
+                if not browser.is_connected():
+                    logger.warning("Relaunching disconnected pooled browser")
+                    self._contexts.pop(id(browser), None)
+                    self._browsers[index] = await self._launch()
+            return min(self._browsers, key=lambda browser: self._contexts.get(id(browser), 0))
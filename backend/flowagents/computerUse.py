@@ -1,11 +1,29 @@
-from flowagents.base import BaseAgent
+from flowagents.base import BaseAgent, agent_definition, run_config
+from flowagents.browser_pool import BrowserPool
+from flowagents.metrics import BROWSER_ACTION_SECONDS, RESOURCE_ACQUIRE_SECONDS, TRAJECTORY_ACTIONS_REPLAYED, TRAJECTORY_REPLAYS, timed
+from flowagents.page_settle import PageSettler, SettleStats
+from flowagents.screenshots import ScreenshotEncoder, ScreenshotStats
+from flowagents.trajectories import (
+    Action,
+    TrajectoryRecorder,
+    TrajectoryStore,
+    RESULT_INSTRUCTIONS,
+    SUCCESS_INSTRUCTIONS,
+    build_trajectory,
+    create_trajectory_store,
+    page_text,
+    replay_trajectory,
+    result_input,
+    task_text,
+)
 from agents import ComputerTool, RunResult, Runner
 
 import asyncio
-import base64
-from typing import Literal, Union
+import logging
+import os
+from typing import Any, List, Literal, Optional, Union
 
-from playwright.async_api import Browser, Page, Playwright, async_playwright
+from playwright.async_api import Browser, BrowserContext, Page, Playwright, async_playwright
 
 from agents import (
     AsyncComputer,
@@ -13,28 +31,163 @@ from agents import (
     ComputerTool,
     Environment,
     ModelSettings,
+    RunResultStreaming,
+    TResponseInputItem,
     trace,
 )
 
+logger = logging.getLogger(__name__)
+
+START_URL = "http://localhost:3000/submit"
+
+# Long-lived browsers shared by every ComputerUseAgent. Set BROWSER_POOL_SIZE=0
+# to go back to launching a dedicated browser per step.
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "2"))
+browser_pool: Optional[BrowserPool] = BrowserPool(
+    size=BROWSER_POOL_SIZE,
+    headless=os.getenv("BROWSER_HEADLESS", "0") == "1",
+    max_contexts_per_browser=int(os.getenv("BROWSER_POOL_MAX_CONTEXTS", "4")),
+) if BROWSER_POOL_SIZE > 0 else None
+
+# Recorded action sequences of successful runs, replayed for repeated tasks
+# (opt-in with TRAJECTORY_REPLAY=1). See `flowagents.trajectories`.
+trajectory_store: Optional[TrajectoryStore] = create_trajectory_store()
+
+
+async def prewarm() -> None:
+    """Launch the pooled browsers (see `flowagents.registry`)."""
+    if browser_pool is not None:
+        await browser_pool.start()
+
+
+async def shutdown() -> None:
+    if browser_pool is not None:
+        await browser_pool.close()
+
+
 class ComputerUseAgent(BaseAgent):
-    def __init__(self, name: str):
-        self.computer = LocalPlaywrightComputer()
+    display_name = "Computer Use Assistant"
+    side_effects = True
+    resources = ("browser",)
+    # Items of a batch run in their own browser contexts, as many as the
+    # node has cores by default (the browser pool's slots also bound them).
+    batch_parallelism = int(os.getenv("COMPUTERUSE_BATCH_PARALLELISM", str(os.cpu_count() or 4)))
+    # Once the first item has recorded its trajectory, the others replay it.
+    batch_warm_up = True
+
+    def __init__(self, name: str, pool: Optional[BrowserPool] = browser_pool, trajectories: Optional[TrajectoryStore] = trajectory_store):
+        self.computer = LocalPlaywrightComputer(pool=pool)
+        self.trajectories = trajectories
+        # Actions replayed before the replay diverged from the page.
+        self._replayed: List[Action] = []
         super().__init__(
             name=name,
             instructions="You are a helpful agent with computer use capabilities. Do not ask for confirmation to submit a form.",
-            tools=[ComputerTool(self.computer)],  # Will be set in __aenter__
             model="computer-use-preview",
             model_settings=ModelSettings(truncation="auto"),
         )
 
     async def __aenter__(self):
         await self.computer.__aenter__()
+        # The computer tool is bound to this run's browser page.
+        self.attach(tools=[ComputerTool(self.computer)])
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.detach()
         if self.computer:
             await self.computer.__aexit__(exc_type, exc_val, exc_tb)
 
+    async def replay(self, instruction: Union[str, List[TResponseInputItem]]) -> Optional[str]:
+        """Replay the recorded trajectory of this task, if there is one."""
+        self._replayed = []
+        if self.trajectories is None:
+            return None
+        found = self.trajectories.find(task_text(instruction))
+        if found is None:
+            return None
+        trajectory, params = found
+        outcome = await replay_trajectory(self.computer.page, trajectory, params, lambda page: self.computer.settle("replay"))
+        TRAJECTORY_ACTIONS_REPLAYED.inc(len(outcome.replayed))
+        if outcome.completed:
+            output = await self._read_result(task_text(instruction))
+            if output is not None:
+                TRAJECTORY_REPLAYS.labels("completed").inc()
+                self.trajectories.used(trajectory)
+                logger.info(f"Agent {self.name!r} replayed {len(outcome.replayed)} recorded actions")
+                return output
+            TRAJECTORY_REPLAYS.labels("unread").inc()
+            logger.info(f"Result of {self.name!r}'s replay couldn't be read from the page, handing over to the model")
+        else:
+            TRAJECTORY_REPLAYS.labels("diverged").inc()
+            logger.info(f"Replay of {self.name!r} diverged after {len(outcome.replayed)} actions ({outcome.reason}), handing over to the model")
+        self._replayed = outcome.replayed
+        return None
+
+    async def _ask_page(self, name: str, instructions: str, task: str, answer: Optional[str] = None) -> Optional[str]:
+        """One model turn over the current page (screenshot and text); None if it fails."""
+        try:
+            screenshot = await self.computer.screenshot()
+            text = await page_text(self.computer.page)
+            result = await Runner.run(
+                agent_definition(name, instructions),
+                input=result_input(task, screenshot, f"image/{self.computer.encoder.format}", text, answer),
+                max_turns=1,
+                run_config=run_config(),
+            )
+        except Exception as exc:
+            logger.warning(f"{name} failed: {exc}")
+            return None
+        return result.final_output if isinstance(result.final_output, str) else None
+
+    async def _read_result(self, task: str) -> Optional[str]:
+        """Answer of a replayed task, read from the final page by one model turn; None if it can't be."""
+        output = await self._ask_page("Replay result reader", RESULT_INSTRUCTIONS, task)
+        if output is None or output.strip(" *_`\n") in ("", "INCOMPLETE"):
+            return None
+        return output
+
+    async def _succeeded(self, task: str, answer: str) -> bool:
+        """Whether a model run completed its task, judged from its answer and the final page."""
+        verdict = await self._ask_page("Run verifier", SUCCESS_INSTRUCTIONS, task, answer)
+        return verdict is not None and verdict.strip(" *_`.\n").upper() == "SUCCEEDED"
+
+    async def execute_stream(self, instruction: Union[str, List[TResponseInputItem]]) -> RunResultStreaming:
+        """Run the model, recording its actions; a successful run becomes the task's trajectory."""
+        if self.trajectories is None:
+            return await super().execute_stream(instruction)
+        task = task_text(instruction)
+        recorder = self.computer.recorder = TrajectoryRecorder()
+        if self._replayed:
+            recorder.actions.extend(self._replayed)
+            done = "; ".join(action.describe() for action in self._replayed)
+            messages = [{"role": "user", "content": instruction}] if isinstance(instruction, str) else list(instruction)
+            instruction = messages + [{
+                "role": "user",
+                "content": f"These actions were already performed on the current page, replaying an earlier run of this task: {done}. Take a screenshot and complete the task from there, or report its result if it is already done.",
+            }]
+
+        result = await super().execute_stream(instruction)
+        stream_events = result.stream_events
+
+        async def recorded() -> Any:
+            async for event in stream_events():
+                yield event
+            if not isinstance(result.final_output, str) or not recorder.actions:
+                return
+            if not await self._succeeded(task, result.final_output):
+                logger.info(f"Run of {self.name!r} didn't complete its task, not recording it")
+                return
+            trajectory = build_trajectory(task, recorder.actions, self.computer.page.url)
+            if trajectory is None:
+                logger.info(f"Task of {self.name!r} is too generic to record a trajectory for")
+                return
+            self.trajectories.save(trajectory)
+            logger.info(f"Recorded a trajectory of {len(recorder.actions)} actions for {self.name!r}")
+
+        result.stream_events = recorded  # type: ignore[method-assign]
+        return result
+
 CUA_KEY_TO_PLAYWRIGHT_KEY = {
     "/": "Divide",
     "\\": "Backslash",
@@ -65,30 +218,94 @@ CUA_KEY_TO_PLAYWRIGHT_KEY = {
 
 
 class LocalPlaywrightComputer(AsyncComputer):
-    """A computer, implemented using a local Playwright browser."""
-
-    def __init__(self):
+    """A computer, implemented using a local Playwright browser.
+
+    With a `BrowserPool` the computer borrows a fresh context and page from
+    one of the pool's long-lived browsers; otherwise it starts its own
+    Playwright instance and browser.
+
+    Actions return once the page has settled (see `PageSettler`); `wait()`
+    waits for that too, with a longer timeout.
+
+    Screenshots go through a `ScreenshotEncoder`. When it downscales, the
+    model sees (and sends coordinates in) the scaled `dimensions`, which
+    are mapped back to the `viewport` before acting on the page.
+    """
+
+    def __init__(
+        self,
+        pool: Optional[BrowserPool] = None,
+        encoder: Optional[ScreenshotEncoder] = None,
+        wait_timeout_ms: int = int(os.getenv("BROWSER_WAIT_TIMEOUT_MS", "10000")),
+    ):
+        self.pool = pool
+        self.encoder = encoder or ScreenshotEncoder()
+        self.wait_timeout = wait_timeout_ms / 1000
+        self.settler: Optional[PageSettler] = None
         self._playwright: Union[Playwright, None] = None
         self._browser: Union[Browser, None] = None
+        self._context: Union[BrowserContext, None] = None
         self._page: Union[Page, None] = None
+        # Set to record the actions performed (see `ComputerUseAgent.execute_stream`).
+        self.recorder: Optional[TrajectoryRecorder] = None
 
     async def _get_browser_and_page(self) -> tuple[Browser, Page]:
-        width, height = self.dimensions
+        width, height = self.viewport
         launch_args = [f"--window-size={width},{height}"]
         browser = await self.playwright.chromium.launch(headless=False, args=launch_args)
         page = await browser.new_page()
         await page.set_viewport_size({"width": width, "height": height})
         # await page.goto("http://bing.com")
-        await page.goto("http://localhost:3000/submit")
+        await page.goto(START_URL)
         return browser, page
 
+    @timed(RESOURCE_ACQUIRE_SECONDS, "browser")
     async def __aenter__(self):
-        # Start Playwright and call the subclass hook for getting browser/page
-        self._playwright = await async_playwright().start()
-        self._browser, self._page = await self._get_browser_and_page()
+        if self.pool is not None:
+            width, height = self.viewport
+            self._context, self._page = await self.pool.new_page(width, height, START_URL)
+            self._browser = self._context.browser
+            self._playwright = self.pool.playwright
+        else:
+            # Start Playwright and call the subclass hook for getting browser/page
+            self._playwright = await async_playwright().start()
+        try:
+            if self.pool is None:
+                self._browser, self._page = await self._get_browser_and_page()
+            self.settler = PageSettler(self._page)
+            await self.settler.attach()
+        except BaseException:
+            # `__aexit__` won't run: close the context (freeing its pool slot) or browser now.
+            self.settler = None
+            await self._close()
+            raise
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
+        stats = self.screenshot_stats
+        if stats.captured:
+            logger.info(
+                f"Screenshots: {stats.captured} captured, {stats.reused} reused, "
+                f"{stats.bytes_avg / 1024:.1f} KiB on average, {stats.encode_ms_avg:.1f} ms to encode "
+                f"({self.encoder.format}, quality {self.encoder.quality}, scale {self.encoder.scale})"
+            )
+        settle = self.settle_stats
+        if settle.waits:
+            logger.info(
+                f"Page settling: {settle.waits} waits, {settle.avg_ms:.0f} ms on average, "
+                f"{settle.max_ms:.0f} ms at most, {settle.timeouts} timed out"
+            )
+        self.settler = None
+        await self._close()
+
+    async def _close(self) -> None:
+        if self.pool is not None:
+            # The browser and Playwright belong to the pool; only drop our context.
+            if self._context:
+                await self.pool.release(self._context)
+            self._context = self._page = self._browser = self._playwright = None
+            return
+
         if self._browser:
             await self._browser.close()
         if self._playwright:
@@ -114,14 +331,42 @@ class LocalPlaywrightComputer(AsyncComputer):
         return "browser"
 
     @property
-    def dimensions(self) -> tuple[int, int]:
+    def viewport(self) -> tuple[int, int]:
         return (1024, 768)
 
+    @property
+    def dimensions(self) -> tuple[int, int]:
+        return self.encoder.scaled(*self.viewport)
+
+    @property
+    def screenshot_stats(self) -> ScreenshotStats:
+        return self.encoder.stats
+
+    @property
+    def settle_stats(self) -> SettleStats:
+        return self.settler.stats if self.settler is not None else SettleStats()
+
+    async def settle(self, action: str, timeout: Optional[float] = None) -> None:
+        """Wait for the page to settle after `action`."""
+        if self.settler is not None:
+            await self.settler.settle(action, timeout)
+
+    async def _record(self, kind: str, **args: Any) -> None:
+        if self.recorder is not None:
+            await self.recorder.record(self.page, kind, args)
+
+    def _to_page(self, x: int, y: int) -> tuple[int, int]:
+        """Map screenshot coordinates back to viewport coordinates."""
+        if self.encoder.scale == 1:
+            return x, y
+        return round(x / self.encoder.scale), round(y / self.encoder.scale)
+
+    @timed(BROWSER_ACTION_SECONDS, "screenshot")
     async def screenshot(self) -> str:
         """Capture only the viewport (not full_page)."""
-        png_bytes = await self.page.screenshot(full_page=False)
-        return base64.b64encode(png_bytes).decode("utf-8")
+        return await self.encoder.capture(self.page)
 
+    @timed(BROWSER_ACTION_SECONDS, "click")
     async def click(self, x: int, y: int, button: Button = "left") -> None:
         playwright_button: Literal["left", "middle", "right"] = "left"
 
@@ -129,39 +374,67 @@ class LocalPlaywrightComputer(AsyncComputer):
         if button in ("left", "right", "middle"):
             playwright_button = button  # type: ignore
 
+        x, y = self._to_page(x, y)
+        await self._record("click", x=x, y=y, button=playwright_button)
         await self.page.mouse.click(x, y, button=playwright_button)
+        await self.settle("click")
 
+    @timed(BROWSER_ACTION_SECONDS, "double_click")
     async def double_click(self, x: int, y: int) -> None:
+        x, y = self._to_page(x, y)
+        await self._record("double_click", x=x, y=y)
         await self.page.mouse.dblclick(x, y)
+        await self.settle("double_click")
 
+    @timed(BROWSER_ACTION_SECONDS, "scroll")
     async def scroll(self, x: int, y: int, scroll_x: int, scroll_y: int) -> None:
+        x, y = self._to_page(x, y)
+        scroll_x, scroll_y = self._to_page(scroll_x, scroll_y)
+        await self._record("scroll", x=x, y=y, scroll_x=scroll_x, scroll_y=scroll_y)
         await self.page.mouse.move(x, y)
         await self.page.evaluate(f"window.scrollBy({scroll_x}, {scroll_y})")
+        await self.settle("scroll")
 
+    @timed(BROWSER_ACTION_SECONDS, "type")
     async def type(self, text: str) -> None:
+        await self._record("type", text=text)
         await self.page.keyboard.type(text)
+        await self.settle("type")
 
+    @timed(BROWSER_ACTION_SECONDS, "wait")
     async def wait(self) -> None:
-        await asyncio.sleep(1)
+        await self._record("wait")
+        await self.settle("wait", self.wait_timeout)
 
+    @timed(BROWSER_ACTION_SECONDS, "move")
     async def move(self, x: int, y: int) -> None:
+        x, y = self._to_page(x, y)
+        await self._record("move", x=x, y=y)
         await self.page.mouse.move(x, y)
+        await self.settle("move")
 
+    @timed(BROWSER_ACTION_SECONDS, "keypress")
     async def keypress(self, keys: list[str]) -> None:
         mapped_keys = [CUA_KEY_TO_PLAYWRIGHT_KEY.get(key.lower(), key) for key in keys]
+        await self._record("keypress", keys=mapped_keys)
         for key in mapped_keys:
             await self.page.keyboard.down(key)
         for key in reversed(mapped_keys):
             await self.page.keyboard.up(key)
+        await self.settle("keypress")
 
+    @timed(BROWSER_ACTION_SECONDS, "drag")
     async def drag(self, path: list[tuple[int, int]]) -> None:
         if not path:
             return
-        await self.page.mouse.move(path[0][0], path[0][1])
+        path = [self._to_page(px, py) for px, py in path]
+        await self._record("drag", path=[list(point) for point in path])
+        await self.page.mouse.move(*path[0])
         await self.page.mouse.down()
         for px, py in path[1:]:
             await self.page.mouse.move(px, py)
         await self.page.mouse.up()
+        await self.settle("drag")
 
 
 async def main():
@@ -172,5 +445,8 @@ async def main():
             result = await agent.execute("search for msft stock price")
             print(f"Agent Result: {result.final_output}")
 
+    if browser_pool is not None:
+        await browser_pool.close()
+
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -6,10 +6,22 @@ environment-dependent configuration (API key, model, system prompt).
 
 from __future__ import annotations
 
-from typing import Any, Dict, List
-from agents import Agent, RunResult, Runner
+import logging
+import time
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Optional, Tuple
+from agents import Agent, RunResult, RunResultStreaming, Runner
+from openai.types.responses import ResponseTextDeltaEvent
 from pydantic import BaseModel
 
+from flowagents.base import run_config
+from flowagents.metrics import observe_stream, record_run
+from flowagents.plan_stream import PlanStreamParser
+
+if TYPE_CHECKING:
+    from flowagents.plan_cache import PlanCache
+
+logger = logging.getLogger(__name__)
+
 # Enable auto-tracing for OpenAI
 # server needs to be started: mlflow server --host 127.0.0.1 --port 8080
 
@@ -17,18 +29,43 @@ class AgentDefinition(BaseModel):
     name: str
     type: str
     instructions: str
+    # Names of the agents whose output this one needs. `None` means "the
+    # previous agent in the list", which keeps plain lists running in order.
+    depends_on: Optional[List[str]] = None
+    # Names of the agents whose output is handed to this one. `None` means
+    # all of its (transitive) dependencies; consumed agents are waited for
+    # as well.
+    consumes: Optional[List[str]] = None
+    # JSON Schemas (serialized) of the fields this agent reads from the
+    # outputs it consumes, and of the JSON object it produces.
+    input_schema: Optional[str] = None
+    output_schema: Optional[str] = None
+    # Name of an agent whose output lists items (a JSON array, or one per
+    # line). This agent then runs once per item, concurrently (batch mode).
+    for_each: Optional[str] = None
 
 class AgentWorkflow(BaseModel):
     agents: List[AgentDefinition]
 
 class ConductorResponse(BaseModel):
-    flow: AgentWorkflow
+    # Structured outputs follow the field order, so when streaming the
+    # friendly message arrives before the (longer) flow.
     message: str
+    flow: AgentWorkflow
+
+class PlanResult(BaseModel):
+    """Outcome of `ConductorAgent.plan`."""
+
+    response: ConductorResponse
+    # Items produced by this turn, to append to the session history.
+    new_items: List[Dict[str, Any]]
+    cache_hit: bool = False
 
 class ConductorAgent:
     """Create and run a CatGPT Agent using the Agents SDK."""
 
-    def __init__(self):
+    def __init__(self, plan_cache: Optional["PlanCache"] = None):
+        self.plan_cache = plan_cache
 
         # Create the Agent immediately (no lazy init).
         self.agent: Agent = Agent(
@@ -40,6 +77,10 @@ class ConductorAgent:
             "3. 'computeruse': agent capable of using a computer to do any generic task on a computer, such as accessing the web and searching for information, or using any app. If there's a repetitve task, " \
             "4. 'websearch': agent capable of searching the web." \
             "You can have multiple instances of each agent, with specific instructions to help them focus on a particular topic or sub task." \
+            "For each agent, set depends_on to the names of the agents whose results it needs, or to an empty list if it can start right away. Agents that don't depend on each other run in parallel." \
+            "An agent only receives the results of the agents listed in consumes (set it to null to receive the results of all the agents it depends on, directly or not), so list every agent whose result it reads, even indirectly." \
+            "When an agent's result is structured, describe it with output_schema, a JSON schema serialized as a string, and give the agents reading it an input_schema naming the properties they need. Leave both empty for free text." \
+            "When the same task must be repeated for several items (e.g. submitting each expense of a list), use a single agent with for_each set to the name of the agent that outputs the items, as a JSON array or one per line: it runs once per item, in parallel, with the item added to its instructions. Otherwise set for_each to null." \
             "Keep the result field empty. Set the field status to 'planned'. Instructions for each agent should follow markdown syntax" \
             "Include a friendly message to explained what you've done.",
             # "Output the plan using json. You must return a valid json object. The plan must include the following properties:" \
@@ -60,4 +101,66 @@ class ConductorAgent:
     async def run_async(self, messages: List[Dict[str, str]]) -> RunResult:
         """Run the given message list through the Agent asynchronously."""
         # Uses the async Runner API; must be called within an event loop
-        return await Runner.run(self.agent, input=messages)
+        started = time.perf_counter()
+        result = await Runner.run(self.agent, input=messages, run_config=run_config())
+        record_run("conductor", result, started)
+        return result
+
+    async def plan(self, messages: List[Dict[str, Any]]) -> PlanResult:
+        """Plan for the given messages, serving identical requests from the plan cache."""
+        key = None
+        if self.plan_cache is not None:
+            key = self.plan_cache.key(messages)
+            cached = self.plan_cache.get(key)
+            if cached is not None:
+                logger.info(f"Plan cache hit ({key[:12]})")
+                return PlanResult(
+                    response=cached,
+                    new_items=[{"role": "assistant", "content": cached.model_dump_json()}],
+                    cache_hit=True,
+                )
+
+        result = await self.run_async(messages)
+        response: ConductorResponse = result.final_output
+        if key is not None:
+            self.plan_cache.set(key, response)
+        return PlanResult(response=response, new_items=result.to_input_list()[len(messages):])
+
+    def run_streamed(self, messages: List[Dict[str, Any]]) -> RunResultStreaming:
+        """Run the given message list through the Agent, streaming the output."""
+        return observe_stream("conductor", Runner.run_streamed(self.agent, input=messages, run_config=run_config()))
+
+    async def plan_stream(self, messages: List[Dict[str, Any]]) -> AsyncIterator[Tuple[str, Any]]:
+        """Like `plan`, but yield the plan while the model is still writing it.
+
+        Yields ("message", str) as soon as the friendly message is complete,
+        ("agent", AgentDefinition) for every completed step, and finally
+        ("done", PlanResult).
+        """
+        key = None
+        if self.plan_cache is not None:
+            key = self.plan_cache.key(messages)
+            cached = self.plan_cache.get(key)
+            if cached is not None:
+                logger.info(f"Plan cache hit ({key[:12]})")
+                yield "message", cached.message
+                for step in cached.flow.agents:
+                    yield "agent", step
+                yield "done", PlanResult(
+                    response=cached,
+                    new_items=[{"role": "assistant", "content": cached.model_dump_json()}],
+                    cache_hit=True,
+                )
+                return
+
+        result = self.run_streamed(messages)
+        parser = PlanStreamParser()
+        async for event in result.stream_events():
+            if event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
+                for kind, value in parser.feed(event.data.delta):
+                    yield kind, AgentDefinition.model_validate(value) if kind == "agent" else value
+
+        response: ConductorResponse = result.final_output
+        if key is not None:
+            self.plan_cache.set(key, response)
+        yield "done", PlanResult(response=response, new_items=result.to_input_list()[len(messages):])
@@ -1,38 +1,139 @@
+import json
 import os
+from typing import Optional
 
+from agents.result import RunResultBase
 from agents.mcp import MCPServerStdio
 from flowagents.base import BaseAgent
+from flowagents.fs_tools import ContentCache, FileSystemTools
+from flowagents.mcp_pool import MCPServerPool
+from flowagents.retrieval import create_corpus_index
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+samples_dir = os.path.join(current_dir, "../agent-files")
+
+# Tools of the filesystem server that change files; runs using them aren't cached.
+WRITE_TOOLS = {"write_file", "edit_file", "create_directory", "move_file"}
+PATH_ARGUMENTS = ("path", "paths", "source", "destination")
+# Tool answering from the whole document index rather than named files.
+SEARCH_TOOL = "search_documents"
+
+
+def resolve_path(path: str) -> str:
+    """Absolute path of a file named in a tool call (relative to the backend or `agent-files`)."""
+    if os.path.isabs(path):
+        return path
+    backend_dir = os.path.dirname(current_dir)
+    candidate = os.path.normpath(os.path.join(backend_dir, path))
+    if os.path.exists(candidate):
+        return candidate
+    return os.path.normpath(os.path.join(samples_dir, path))
+
+
+def create_filesystem_server() -> MCPServerStdio:
+    """Start-up parameters of the filesystem MCP server lent out by the pool."""
+    return MCPServerStdio(
+        name="filesystem",
+        params={
+            "command": "npx",
+            "args": ["-y", "@modelcontextprotocol/server-filesystem", samples_dir],
+        },
+        # The tool list of a pooled server never changes, no need to ask again on every turn.
+        cache_tools_list=True,
+    )
+
+
+# "mcp" runs the filesystem MCP server (Node, via npx); "native" uses the
+# in-process tools of `flowagents.fs_tools` instead.
+FILESYSTEM_BACKEND = os.getenv("FILESYSTEM_BACKEND", "mcp")
+if FILESYSTEM_BACKEND not in ("mcp", "native"):
+    raise ValueError(f"Unknown FILESYSTEM_BACKEND: {FILESYSTEM_BACKEND}")
+
+# Server-lifetime pool shared by every FileSystemAgent (MCP backend only).
+filesystem_pool: Optional[MCPServerPool] = MCPServerPool(
+    create_filesystem_server,
+    max_size=int(os.getenv("FILESYSTEM_POOL_MAX_SIZE", "4")),
+    min_size=int(os.getenv("FILESYSTEM_POOL_MIN_SIZE", "1")),
+    idle_timeout=float(os.getenv("FILESYSTEM_POOL_IDLE_TIMEOUT", "300")),
+) if FILESYSTEM_BACKEND == "mcp" else None
+
+# Tools shared by every FileSystemAgent (native backend only).
+filesystem_tools = FileSystemTools(
+    samples_dir,
+    cache=ContentCache(max_bytes=int(os.getenv("FILESYSTEM_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))),
+    mmap_threshold=int(os.getenv("FILESYSTEM_MMAP_THRESHOLD", str(1024 * 1024))),
+).tools() if FILESYSTEM_BACKEND == "native" else None
+
+# BM25 index of agent-files behind the `search_documents` tool, kept
+# current once `prewarm` or the first search started it (RETRIEVAL_INDEX=0 disables it).
+document_index = create_corpus_index(samples_dir)
+_document_tools = [document_index.tool(int(os.getenv("RETRIEVAL_TOP_K", "5")))] if document_index is not None else []
+
+
+async def prewarm() -> None:
+    """Start the pool's warm servers and index agent-files (see `flowagents.registry`)."""
+    if filesystem_pool is not None:
+        await filesystem_pool.start()
+    if document_index is not None:
+        await document_index.start()
+
+
+async def shutdown() -> None:
+    if filesystem_pool is not None:
+        await filesystem_pool.close()
+    if document_index is not None:
+        await document_index.close()
+
 
 class FileSystemAgent(BaseAgent):
-    def __init__(self, name: str):
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        samples_dir = os.path.join(current_dir, "../agent-files")
+    display_name = "File System Assistant"
 
-        self.server = MCPServerStdio(
-            name=name,
-            params={
-                "command": "npx",
-                "args": ["-y", "@modelcontextprotocol/server-filesystem", samples_dir],
-            },
-        )
+    def __init__(self, name: str, pool: Optional[MCPServerPool] = filesystem_pool):
+        self.pool = pool
+        self.server = None
+        self.resources = ("mcp_server",) if pool is not None else ()
         super().__init__(
-            name="File System Assistant",
-            instructions="Use the tools to read the filesystem and answer questions based on those files. Assume that any requested file is a relative path and if it doesn't start with 'agent-files/' add prefix that to the path.",
-            mcp_servers=[self.server],
+            name=name,
+            instructions="Use the tools to read the filesystem and answer questions based on those files. Assume that any requested file is a relative path and if it doesn't start with 'agent-files/' add prefix that to the path."
+            + (" To find specific information in the documents, search them with search_documents and only read whole files when the passages aren't enough." if _document_tools else ""),
+            # Without a pool, the in-process tools are part of the definition.
+            tools=(filesystem_tools if pool is None else []) + _document_tools,
         )
 
-    def __enter__(self):
-        self.server.__enter__()
-        return super().__enter__()
-
-    def __exit__(self, exc_type, exc_value, traceback):
-        self.server.__exit__(exc_type, exc_value, traceback)
-        super().__exit__(exc_type, exc_value, traceback)
+    def cache_dependencies(self, result: RunResultBase) -> list[str] | None:
+        """Every path the run passed to a filesystem tool."""
+        paths: list[str] = []
+        for item in result.new_items:
+            if item.type != "tool_call_item":
+                continue
+            if getattr(item.raw_item, "name", None) in WRITE_TOOLS:
+                return None
+            if getattr(item.raw_item, "name", None) == SEARCH_TOOL:
+                # Results (and their scores) depend on every indexed file: the
+                # fingerprint of the indexed directory covers them all.
+                paths.append(samples_dir)
+                continue
+            try:
+                arguments = json.loads(getattr(item.raw_item, "arguments", None) or "{}")
+            except ValueError:
+                return None
+            for name in PATH_ARGUMENTS:
+                value = arguments.get(name)
+                for path in value if isinstance(value, list) else [value]:
+                    if isinstance(path, str):
+                        paths.append(resolve_path(path))
+        return paths
 
     async def __aenter__(self):
-        await self.server.__aenter__()
+        if self.pool is not None:
+            # Borrow a running server instead of spawning one for this step.
+            self.server = await self.pool.acquire()
+            self.attach(mcp_servers=[self.server])
         return await super().__aenter__()
 
     async def __aexit__(self, exc_type, exc_value, traceback):
-        await self.server.__aexit__(exc_type, exc_value, traceback)
+        if self.server is not None:
+            await self.pool.release(self.server, healthy=exc_type is None)
+            self.server = None
+            self.detach()
         await super().__aexit__(exc_type, exc_value, traceback)
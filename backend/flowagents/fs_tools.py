@@ -0,0 +1,279 @@
+"""In-process filesystem tools, an alternative to the filesystem MCP server.
+
+The MCP server runs on Node, is downloaded by `npx` on a cold cache, and
+every file read is a round trip to a subprocess. These function tools
+provide the read-only operations the filesystem agent uses (read, list,
+search, stat) in the backend process instead, sandboxed to one directory:
+
+* paths are resolved like the agent names them (relative to the backend
+  or to the sandbox) and must stay inside the sandbox once symlinks are
+  followed;
+* file contents are kept in a size-bounded LRU, validated against the
+  file's mtime and size on every read;
+* files above `mmap_threshold` are memory-mapped, so reading the first
+  or last lines of a large file only touches those pages.
+
+The tool names and arguments follow the MCP server, so plans and step
+cache dependencies (`FileSystemAgent.cache_dependencies`) work the same
+with either backend. Select it with `FILESYSTEM_BACKEND=native`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import fnmatch
+import logging
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from agents import FunctionTool, function_tool
+
+logger = logging.getLogger(__name__)
+
+
+class SandboxError(ValueError):
+    """Raised for paths outside the sandbox."""
+
+
+class ContentCache:
+    """LRU of decoded file contents, keyed by path and validated by (mtime, size)."""
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # path -> (mtime_ns, size, text)
+        self._entries: OrderedDict[str, Tuple[int, int, str]] = OrderedDict()
+        self._bytes = 0
+        # Tools run in worker threads.
+        self._lock = threading.Lock()
+
+    def get(self, path: str, stat: os.stat_result) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry[:2] != (stat.st_mtime_ns, stat.st_size):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(path)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, path: str, stat: os.stat_result, text: str) -> None:
+        if stat.st_size > self.max_bytes // 4:
+            # Large files would evict everything else; they are mapped instead.
+            return
+        with self._lock:
+            previous = self._entries.pop(path, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[path] = (stat.st_mtime_ns, stat.st_size, text)
+            self._bytes += stat.st_size
+            while self._bytes > self.max_bytes:
+                _, (_, size, _) = self._entries.popitem(last=False)
+                self._bytes -= size
+
+
+class FileSystemTools:
+    """Read-only file operations confined to `root`."""
+
+    def __init__(self, root: str, cache: Optional[ContentCache] = None, mmap_threshold: int = 1024 * 1024):
+        self.root = os.path.realpath(root)
+        self.cache = cache or ContentCache()
+        self.mmap_threshold = mmap_threshold
+
+    # ------------------------------------------------------------------
+    # Paths
+    # ------------------------------------------------------------------
+
+    def resolve(self, path: str) -> str:
+        """Real path of `path`, which may be absolute, relative to the sandbox or to its parent."""
+        path = os.path.expanduser(path.strip())
+        if not os.path.isabs(path):
+            # "agent-files/x.txt" (as the agent is told to write) or "x.txt".
+            parent = os.path.join(os.path.dirname(self.root), path)
+            path = parent if self._inside(os.path.realpath(parent)) else os.path.join(self.root, path)
+        real = os.path.realpath(path)
+        if not self._inside(real):
+            raise SandboxError(f"Access denied: {path} is outside {self.root}")
+        return real
+
+    def _inside(self, real: str) -> bool:
+        return real == self.root or real.startswith(self.root + os.sep)
+
+    def display(self, real: str) -> str:
+        return os.path.relpath(real, os.path.dirname(self.root))
+
+    # ------------------------------------------------------------------
+    # Operations
+    # ------------------------------------------------------------------
+
+    def read(self, path: str, head: Optional[int] = None, tail: Optional[int] = None) -> str:
+        real = self.resolve(path)
+        stat = os.stat(real)
+        if head and stat.st_size >= self.mmap_threshold:
+            return self._mapped_lines(real, head, from_end=False)
+        if tail and stat.st_size >= self.mmap_threshold:
+            return self._mapped_lines(real, tail, from_end=True)
+
+        text = self.cache.get(real, stat)
+        if text is None:
+            text = self._read(real, stat.st_size)
+            self.cache.set(real, stat, text)
+        if head:
+            return "".join(text.splitlines(keepends=True)[:head])
+        if tail:
+            return "".join(text.splitlines(keepends=True)[-tail:])
+        return text
+
+    def _read(self, real: str, size: int) -> str:
+        with open(real, "rb") as f:
+            if size < self.mmap_threshold or size == 0:
+                data = f.read()
+            else:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    data = mapped[:]
+        return data.decode("utf-8", errors="replace")
+
+    def _mapped_lines(self, real: str, count: int, from_end: bool) -> str:
+        """First or last `count` lines of a large file, touching only the pages they are on."""
+        with open(real, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if from_end:
+                end = len(mapped)
+                position = end - 1 if mapped[end - 1 : end] == b"\n" else end
+                for _ in range(count):
+                    position = mapped.rfind(b"\n", 0, position)
+                    if position < 0:
+                        break
+                data = mapped[position + 1 : end]
+            else:
+                position = -1
+                for _ in range(count):
+                    position = mapped.find(b"\n", position + 1)
+                    if position < 0:
+                        position = len(mapped) - 1
+                        break
+                data = mapped[: position + 1]
+        return data.decode("utf-8", errors="replace")
+
+    def list(self, path: str) -> str:
+        real = self.resolve(path)
+        with os.scandir(real) as entries:
+            lines = [
+                f"{'[DIR]' if entry.is_dir() else '[FILE]'} {entry.name}"
+                for entry in sorted(entries, key=lambda entry: entry.name)
+            ]
+        return "\n".join(lines) or "Empty directory"
+
+    def search(self, path: str, pattern: str, exclude_patterns: Optional[List[str]] = None, limit: int = 500) -> str:
+        """Paths under `path` whose name matches `pattern` (a glob, or a case-insensitive substring)."""
+        real = self.resolve(path)
+        glob = any(char in pattern for char in "*?[")
+        needle = pattern.lower()
+        matches: List[str] = []
+        for directory, dirs, files in os.walk(real):
+            relative = os.path.relpath(directory, real)
+            dirs[:] = [
+                d for d in sorted(dirs)
+                if not any(fnmatch.fnmatch(os.path.join(relative, d), p) or fnmatch.fnmatch(d, p) for p in exclude_patterns or [])
+            ]
+            for name in sorted(dirs) + sorted(files):
+                if (fnmatch.fnmatch(name.lower(), needle) if glob else needle in name.lower()):
+                    matches.append(self.display(os.path.join(directory, name)))
+                    if len(matches) >= limit:
+                        return "\n".join(matches + [f"(stopped after {limit} matches)"])
+        return "\n".join(matches) or "No matches found"
+
+    def stat(self, path: str) -> str:
+        real = self.resolve(path)
+        stat = os.stat(real)
+
+        def timestamp(value: float) -> str:
+            return datetime.fromtimestamp(value, timezone.utc).isoformat()
+
+        return "\n".join([
+            f"size: {stat.st_size}",
+            f"created: {timestamp(stat.st_ctime)}",
+            f"modified: {timestamp(stat.st_mtime)}",
+            f"accessed: {timestamp(stat.st_atime)}",
+            f"isDirectory: {os.path.isdir(real)}",
+            f"isFile: {os.path.isfile(real)}",
+            f"permissions: {oct(stat.st_mode & 0o777)[2:]}",
+        ])
+
+    # ------------------------------------------------------------------
+    # Agent tools
+    # ------------------------------------------------------------------
+
+    def tools(self) -> List[FunctionTool]:
+        """Function tools named like those of the filesystem MCP server."""
+        fs = self
+
+        @function_tool
+        async def read_text_file(path: str, head: Optional[int] = None, tail: Optional[int] = None) -> str:
+            """Read the contents of a text file.
+
+            Args:
+                path: Path of the file.
+                head: If set, only return the first N lines.
+                tail: If set, only return the last N lines.
+            """
+            return await asyncio.to_thread(fs.read, path, head, tail)
+
+        @function_tool
+        async def read_multiple_files(paths: List[str]) -> str:
+            """Read several text files at once. Files that can't be read are reported inline.
+
+            Args:
+                paths: Paths of the files.
+            """
+
+            def read_all() -> str:
+                parts = []
+                for path in paths:
+                    try:
+                        parts.append(f"{path}:\n{fs.read(path)}")
+                    except (OSError, SandboxError) as exc:
+                        parts.append(f"{path}: Error - {exc}")
+                return "\n---\n".join(parts)
+
+            return await asyncio.to_thread(read_all)
+
+        @function_tool
+        async def list_directory(path: str) -> str:
+            """List the files and directories in a directory, prefixed with [FILE] or [DIR].
+
+            Args:
+                path: Path of the directory.
+            """
+            return await asyncio.to_thread(fs.list, path)
+
+        @function_tool
+        async def search_files(path: str, pattern: str, exclude_patterns: Optional[List[str]] = None) -> str:
+            """Recursively search for files and directories whose name matches a pattern.
+
+            Args:
+                path: Directory to search from.
+                pattern: Glob pattern (e.g. "*.txt"), or text the name contains (case-insensitive).
+                exclude_patterns: Glob patterns of paths to skip.
+            """
+            return await asyncio.to_thread(fs.search, path, pattern, exclude_patterns)
+
+        @function_tool
+        async def get_file_info(path: str) -> str:
+            """Get the metadata of a file or directory: size, times, type and permissions.
+
+            Args:
+                path: Path of the file or directory.
+            """
+            return await asyncio.to_thread(fs.stat, path)
+
+        @function_tool
+        async def list_allowed_directories() -> str:
+            """List the directories the tools are allowed to access."""
+            return f"Allowed directories:\n{fs.root}"
+
+        return [read_text_file, read_multiple_files, list_directory, search_files, get_file_info, list_allowed_directories]
@@ -0,0 +1,278 @@
+"""Warm pool of MCP servers shared across requests.
+
+Starting an MCP stdio server means spawning a subprocess (for the
+filesystem agent: Node plus `npx` package resolution), which easily costs
+seconds. `MCPServerPool` keeps connected servers around for the lifetime of
+the process and lends them out to agents:
+
+* `acquire()` / `release()` (or the `checkout()` context manager) hand out
+  an idle server, starting a new one when none is idle and the pool is
+  below `max_size`, and waiting otherwise;
+* servers that sat idle for a while are pinged before being handed out and
+  replaced if they don't answer;
+* idle servers above `min_size` are shut down after `idle_timeout` seconds,
+  and the pool is topped back up to `min_size` in the background.
+
+`start()` prewarms `min_size` servers; without it, the first `acquire()`
+starts the background upkeep.
+
+The MCP client keeps its transport inside anyio task groups, which must be
+entered and exited from the same task. Each pooled server therefore lives
+in a dedicated owner task that connects it, waits until the pool retires
+it, and then cleans it up.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, List, Optional
+
+from agents.mcp import MCPServer
+
+from flowagents.metrics import MCP_SERVER_START_SECONDS, RESOURCE_ACQUIRE_SECONDS, timed
+
+logger = logging.getLogger(__name__)
+
+
+class _PooledServer:
+    """An MCP server together with the task that owns its connection."""
+
+    def __init__(self, server: MCPServer):
+        self.server = server
+        self.last_used = time.monotonic()
+        self.last_checked = time.monotonic()
+        self._ready: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._retire = asyncio.Event()
+        self._task = asyncio.create_task(self._own())
+
+    async def _own(self) -> None:
+        try:
+            async with self.server:
+                self._ready.set_result(None)
+                await self._retire.wait()
+        except BaseException as exc:
+            if not self._ready.done():
+                self._ready.set_exception(exc)
+            if not isinstance(exc, Exception):
+                raise
+            logger.warning(f"MCP server {self.server.name!r} stopped: {exc}")
+
+    async def wait_ready(self) -> None:
+        await self._ready
+
+    async def close(self) -> None:
+        self._retire.set()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+
+class MCPServerPool:
+    """Pool of connected MCP servers with checkout/return semantics."""
+
+    def __init__(
+        self,
+        factory: Callable[[], MCPServer],
+        max_size: int = 4,
+        min_size: int = 0,
+        idle_timeout: float = 300,
+        health_check_after: float = 30,
+        health_check_timeout: float = 5,
+    ):
+        self.factory = factory
+        self.max_size = max(1, max_size)
+        self.min_size = min(min_size, self.max_size)
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self.health_check_timeout = health_check_timeout
+
+        self._idle: List[_PooledServer] = []
+        self._in_use: dict[int, _PooledServer] = {}
+        self._starting = 0
+        self._condition: Optional[asyncio.Condition] = None
+        self._reaper: Optional[asyncio.Task] = None
+        self._closed = False
+
+    @property
+    def size(self) -> int:
+        return len(self._idle) + len(self._in_use) + self._starting
+
+    @property
+    def condition(self) -> asyncio.Condition:
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    async def start(self) -> None:
+        """Pre-start `min_size` servers and begin evicting idle ones."""
+        self._closed = False
+        results = await asyncio.gather(*(self._spawn() for _ in range(self.min_size - self.size)), return_exceptions=True)
+        async with self.condition:
+            for entry in results:
+                if isinstance(entry, _PooledServer):
+                    self._idle.append(entry)
+                else:
+                    logger.warning(f"Failed to prewarm MCP server: {entry}")
+            self.condition.notify_all()
+        self._start_reaper()
+        logger.info(f"MCP server pool started with {len(self._idle)} warm server(s)")
+
+    async def close(self) -> None:
+        """Shut down every server, including those currently checked out."""
+        self._closed = True
+        if self._reaper is not None:
+            self._reaper.cancel()
+            await asyncio.gather(self._reaper, return_exceptions=True)
+            self._reaper = None
+        entries = [*self._idle, *self._in_use.values()]
+        self._idle.clear()
+        self._in_use.clear()
+        await asyncio.gather(*(entry.close() for entry in entries))
+
+    # ------------------------------------------------------------------
+    # Checkout / return
+    # ------------------------------------------------------------------
+
+    @timed(RESOURCE_ACQUIRE_SECONDS, "mcp_server")
+    async def acquire(self) -> MCPServer:
+        """Borrow a connected server, starting one if the pool has room."""
+        self._start_reaper()
+        while True:
+            async with self.condition:
+                while not self._idle and self.size >= self.max_size:
+                    await self.condition.wait()
+                if self._idle:
+                    entry = self._idle.pop()
+                    self._in_use[id(entry.server)] = entry
+                else:
+                    entry = None
+                    self._starting += 1
+
+            if entry is None:
+                try:
+                    entry = await self._spawn()
+                except BaseException:
+                    async with self.condition:
+                        self._starting -= 1
+                        self.condition.notify_all()
+                    raise
+                async with self.condition:
+                    self._starting -= 1
+                    self._in_use[id(entry.server)] = entry
+                return entry.server
+
+            if await self._healthy(entry):
+                return entry.server
+            await self._discard(entry)
+
+    async def release(self, server: MCPServer, healthy: bool = True) -> None:
+        """Return a borrowed server. Unhealthy servers are checked on next use."""
+        entry = self._in_use.pop(id(server), None)
+        if entry is None:
+            return
+        if self._closed:
+            await entry.close()
+            return
+        entry.last_used = time.monotonic()
+        if not healthy:
+            entry.last_checked = float("-inf")
+        async with self.condition:
+            self._idle.append(entry)
+            self.condition.notify()
+
+    @asynccontextmanager
+    async def checkout(self) -> AsyncIterator[MCPServer]:
+        server = await self.acquire()
+        try:
+            yield server
+        except BaseException:
+            await self.release(server, healthy=False)
+            raise
+        else:
+            await self.release(server)
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    async def _spawn(self) -> _PooledServer:
+        entry = _PooledServer(self.factory())
+        started = time.monotonic()
+        try:
+            await entry.wait_ready()
+        except BaseException:
+            # Cancelled (the pool is closing) or failed: don't leave the owner task behind.
+            await entry.close()
+            raise
+        elapsed = time.monotonic() - started
+        MCP_SERVER_START_SECONDS.labels(entry.server.name).observe(elapsed)
+        logger.info(f"Started MCP server {entry.server.name!r} in {elapsed:.2f}s")
+        return entry
+
+    async def _healthy(self, entry: _PooledServer) -> bool:
+        if time.monotonic() - entry.last_checked < self.health_check_after:
+            return True
+        session = getattr(entry.server, "session", None)
+        try:
+            if session is not None:
+                await asyncio.wait_for(session.send_ping(), self.health_check_timeout)
+            else:
+                await asyncio.wait_for(entry.server.list_tools(), self.health_check_timeout)
+        except Exception as exc:
+            logger.warning(f"MCP server {entry.server.name!r} failed its health check: {exc}")
+            return False
+        entry.last_checked = time.monotonic()
+        return True
+
+    async def _discard(self, entry: _PooledServer) -> None:
+        self._in_use.pop(id(entry.server), None)
+        await entry.close()
+        async with self.condition:
+            self.condition.notify_all()
+
+    def _start_reaper(self) -> None:
+        if self._reaper is None and not self._closed and (self.idle_timeout > 0 or self.min_size > 0):
+            self._reaper = asyncio.create_task(self._reap())
+
+    async def _reap(self) -> None:
+        interval = max(1.0, self.idle_timeout / 4) if self.idle_timeout > 0 else 30.0
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            expired: List[_PooledServer] = []
+            async with self.condition:
+                # Oldest idle servers sit at the front of the list.
+                while (
+                    self.idle_timeout > 0
+                    and self._idle
+                    and self.size > self.min_size
+                    and now - self._idle[0].last_used > self.idle_timeout
+                ):
+                    expired.append(self._idle.pop(0))
+            for entry in expired:
+                logger.info(f"Evicting idle MCP server {entry.server.name!r}")
+                await entry.close()
+            await self._top_up()
+
+    async def _top_up(self) -> None:
+        """Start idle servers until the pool holds `min_size`."""
+        missing = self.min_size - self.size
+        if missing <= 0 or self._closed:
+            return
+        self._starting += missing
+        try:
+            results = await asyncio.gather(*(self._spawn() for _ in range(missing)), return_exceptions=True)
+        finally:
+            self._starting -= missing
+        async with self.condition:
+            for entry in results:
+                if isinstance(entry, _PooledServer):
+                    self._idle.append(entry)
+                elif not isinstance(entry, asyncio.CancelledError):
+                    logger.warning(f"Failed to start MCP server: {entry}")
+            self.condition.notify_all()
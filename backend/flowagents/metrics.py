@@ -0,0 +1,189 @@
+"""In-process instrumentation, exported in the Prometheus text format.
+
+Every agent run (workflow steps, the Conductor, the history summariser) is
+measured where it starts, in `BaseAgent.execute`/`execute_stream` and
+`ConductorAgent`, independently of SDK tracing (which `/run` disables):
+
+* wall time and time to the first text delta;
+* input/output tokens and tool calls per run;
+* step cache hits and misses;
+* background jobs queued, running and rejected;
+* time model requests wait for rate limit budget, and upstream 429s;
+* computer-use trajectory replays, completed, diverged or unread (the
+  result couldn't be read from the final page);
+* how long the browser page takes to settle after each action;
+* size of the computer-use screenshots and time spent encoding them;
+* runs and steps cancelled before completion (client disconnects, job
+  cancellations), with an estimate of the resource-seconds that saved;
+
+and so is the acquisition of the resources a step runs on (pooled MCP
+servers, browser contexts), MCP server start-up and each Playwright action.
+Metrics are labelled by agent type, so every type gets its own histograms.
+`main.py` serves them on `GET /metrics`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Optional
+
+from agents import RunResult, RunResultStreaming
+from openai.types.responses import ResponseTextDeltaEvent
+from prometheus_client import Counter, Gauge, Histogram
+
+# Model latencies range from sub-second (first delta) to minutes (computer use).
+_SECONDS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+_COUNTS = (0, 1, 2, 5, 10, 20, 50, 100)
+_SETTLE_SECONDS = (0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10)
+_TOKENS = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000)
+_BYTES = (16_384, 65_536, 131_072, 262_144, 524_288, 1_048_576, 2_097_152, 4_194_304)
+_ENCODE_SECONDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+AGENT_RUN_SECONDS = Histogram(
+    "catgpt_agent_run_seconds", "Wall time of an agent run.", ["agent_type", "status"], buckets=_SECONDS
+)
+AGENT_FIRST_DELTA_SECONDS = Histogram(
+    "catgpt_agent_first_delta_seconds", "Time from the start of a streamed run to its first text delta.", ["agent_type"], buckets=_SECONDS
+)
+AGENT_TOKENS = Histogram(
+    "catgpt_agent_tokens", "Tokens used by an agent run.", ["agent_type", "direction"], buckets=_TOKENS
+)
+AGENT_TOOL_CALLS = Histogram(
+    "catgpt_agent_tool_calls", "Tool calls made during an agent run.", ["agent_type"], buckets=_COUNTS
+)
+STEP_CACHE_REQUESTS = Counter(
+    "catgpt_step_cache_requests", "Workflow step cache lookups.", ["agent_type", "result"]
+)
+
+JOBS_QUEUED = Gauge("catgpt_jobs_queued", "Background jobs waiting for a worker.")
+JOBS_RUNNING = Gauge("catgpt_jobs_running", "Background jobs being executed.")
+JOBS_REJECTED = Counter("catgpt_jobs_rejected", "Jobs rejected because the queue was full.")
+
+MODEL_QUEUE_WAIT_SECONDS = Histogram(
+    "catgpt_model_queue_wait_seconds", "Time a model request waited for rate limit budget.", ["model", "lane"], buckets=(0, *_SECONDS)
+)
+MODEL_RATE_LIMITED = Counter("catgpt_model_rate_limited", "Model requests answered with HTTP 429.", ["model"])
+
+RUNS_CANCELLED = Counter("catgpt_runs_cancelled", "Workflow runs cancelled before completion.", ["reason"])
+STEPS_CANCELLED = Counter("catgpt_steps_cancelled", "Workflow steps cancelled while running.", ["agent_type"])
+RESOURCE_SECONDS_SAVED = Counter(
+    "catgpt_resource_seconds_saved",
+    "Estimated resource-seconds not spent thanks to cancelled steps (typical duration of the step type minus the time already spent).",
+    ["resource"],
+)
+
+TRAJECTORY_REPLAYS = Counter(
+    "catgpt_trajectory_replays", "Computer-use steps replayed from a recorded trajectory.", ["outcome"]
+)
+TRAJECTORY_ACTIONS_REPLAYED = Counter(
+    "catgpt_trajectory_actions_replayed", "Computer-use actions replayed without calling the model."
+)
+
+RESOURCE_ACQUIRE_SECONDS = Histogram(
+    "catgpt_resource_acquire_seconds", "Time spent waiting for a pooled resource.", ["resource"], buckets=_SECONDS
+)
+MCP_SERVER_START_SECONDS = Histogram(
+    "catgpt_mcp_server_start_seconds", "Time to start and connect an MCP server.", ["server"], buckets=_SECONDS
+)
+BROWSER_ACTION_SECONDS = Histogram(
+    "catgpt_browser_action_seconds",
+    "Duration of a Playwright action of the computer-use agent, including the wait for the page to settle.",
+    ["action"],
+    buckets=_SECONDS,
+)
+BROWSER_SETTLE_SECONDS = Histogram(
+    "catgpt_browser_settle_seconds", "Time the page took to settle after a computer-use action.", ["action", "outcome"], buckets=_SETTLE_SECONDS
+)
+SCREENSHOT_BYTES = Histogram(
+    "catgpt_screenshot_bytes", "Size of a computer-use screenshot, base64-encoded.", ["format"], buckets=_BYTES
+)
+SCREENSHOT_ENCODE_SECONDS = Histogram(
+    "catgpt_screenshot_encode_seconds",
+    "Time spent encoding a computer-use screenshot, excluding its capture by the browser.",
+    ["format"],
+    buckets=_ENCODE_SECONDS,
+)
+
+
+# Moving average of the wall time of completed runs, per agent type. It
+# estimates how long a cancelled step would still have run.
+_typical_seconds: Dict[str, float] = {}
+
+
+def typical_run_seconds(agent_type: str) -> Optional[float]:
+    return _typical_seconds.get(agent_type)
+
+
+def record_run(agent_type: str, result: RunResult | RunResultStreaming, started: float, status: str = "completed") -> None:
+    """Record wall time, token usage and tool calls of a finished run."""
+    elapsed = time.perf_counter() - started
+    AGENT_RUN_SECONDS.labels(agent_type, status).observe(elapsed)
+    if status == "completed":
+        typical = _typical_seconds.get(agent_type)
+        _typical_seconds[agent_type] = elapsed if typical is None else 0.8 * typical + 0.2 * elapsed
+    usage = result.context_wrapper.usage
+    for direction, tokens in (("input", usage.input_tokens), ("output", usage.output_tokens)):
+        AGENT_TOKENS.labels(agent_type, direction).observe(tokens)
+    AGENT_TOOL_CALLS.labels(agent_type).observe(sum(1 for item in result.new_items if item.type == "tool_call_item"))
+
+
+def observe_stream(agent_type: str, result: RunResultStreaming) -> RunResultStreaming:
+    """Measure a streamed run while its caller consumes `stream_events()`.
+
+    The result is returned as is, with `stream_events` wrapped, so callers
+    don't need to know they are being measured.
+    """
+    started = time.perf_counter()
+    stream_events = result.stream_events
+
+    async def observed() -> AsyncIterator[Any]:
+        first_delta = True
+        status = "failed"
+        try:
+            async for event in stream_events():
+                if first_delta and event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
+                    AGENT_FIRST_DELTA_SECONDS.labels(agent_type).observe(time.perf_counter() - started)
+                    first_delta = False
+                yield event
+            status = "completed"
+        except (asyncio.CancelledError, GeneratorExit):
+            status = "cancelled"
+            raise
+        finally:
+            record_run(agent_type, result, started, status)
+
+    result.stream_events = observed  # type: ignore[method-assign]
+    return result
+
+
+def record_cancelled_step(agent_type: str, resources: Iterable[str], elapsed: float) -> float:
+    """Count a step cancelled after `elapsed` seconds; return the seconds it likely saved.
+
+    Every step holds a model run; `resources` are what else it held (a
+    browser, an MCP server). Nothing is counted as saved until a step of
+    the same type has completed.
+    """
+    STEPS_CANCELLED.labels(agent_type).inc()
+    typical = _typical_seconds.get(agent_type)
+    if typical is None:
+        return 0.0
+    saved = max(0.0, typical - elapsed)
+    for resource in ("model", *resources):
+        RESOURCE_SECONDS_SAVED.labels(resource).inc(saved)
+    return saved
+
+
+def timed(histogram: Histogram, *labels: str) -> Callable:
+    """Decorator timing an async function into `histogram`."""
+
+    def decorate(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with histogram.labels(*labels).time():
+                return await fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
@@ -0,0 +1,183 @@
+"""Waiting for a browser page to settle after an action.
+
+The computer-use model takes a screenshot after every action; taken too
+early it shows a half-rendered page, taken too late the step just idles.
+Rather than sleeping for a fixed time, `PageSettler` waits until three
+signals agree the page is stable, or until a timeout:
+
+* network idle – no request in flight (requests running longer than
+  `long_request_ms`, like long polls and streams, are ignored) and none
+  started or finished for `quiet_ms`;
+* DOM quiescence – a `MutationObserver` injected in every document has
+  seen no mutation for `quiet_ms`;
+* frame stability – the document's size, scroll position and element
+  count are the same across two animation frames, and no finite CSS
+  animation or transition is running.
+
+Every wait is observed in `catgpt_browser_settle_seconds` by action and
+outcome ("settled" or "timeout"), and summed up in `SettleStats`, to tune
+the thresholds (`BROWSER_SETTLE_QUIET_MS`, `BROWSER_SETTLE_TIMEOUT_MS`,
+`BROWSER_WAIT_TIMEOUT_MS`).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, Optional
+
+from playwright.async_api import Page, Request
+from pydantic import BaseModel
+
+from flowagents.metrics import BROWSER_SETTLE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Installed in every document of the page (and in the current one when the
+# settler attaches). `check()` resolves after two animation frames, or
+# 100 ms when frames are throttled.
+_SETTLE_SCRIPT = """
+(() => {
+  if (window.__catgptSettle) return;
+  const state = { lastMutation: performance.now() };
+  new MutationObserver(() => { state.lastMutation = performance.now(); })
+    .observe(document, { subtree: true, childList: true, attributes: true, characterData: true });
+  const signature = () => {
+    const root = document.documentElement;
+    if (!root) return "";
+    return [root.scrollWidth, root.scrollHeight, window.scrollX, window.scrollY,
+            document.getElementsByTagName("*").length].join(",");
+  };
+  const frame = () => new Promise(resolve => {
+    requestAnimationFrame(() => resolve());
+    setTimeout(resolve, 100);
+  });
+  const animating = () => {
+    if (!document.getAnimations) return 0;
+    return document.getAnimations().filter(animation => {
+      if (animation.playState !== "running" || !animation.effect) return false;
+      return isFinite(animation.effect.getComputedTiming().endTime);
+    }).length;
+  };
+  window.__catgptSettle = {
+    async check() {
+      const before = signature();
+      await frame();
+      await frame();
+      return {
+        quietMs: performance.now() - state.lastMutation,
+        loading: document.readyState === "loading",
+        stable: before === signature() && animating() === 0,
+      };
+    },
+  };
+})()
+"""
+
+
+class SettleStats(BaseModel):
+    """Settle waits of one computer, for the summary logged when it closes."""
+
+    waits: int = 0
+    timeouts: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+
+    @property
+    def avg_ms(self) -> float:
+        return self.total_ms / self.waits if self.waits else 0.0
+
+
+class PageSettler:
+    """Waits for `page` to be stable; `attach()` it before the first action."""
+
+    def __init__(
+        self,
+        page: Page,
+        quiet_ms: int = int(os.getenv("BROWSER_SETTLE_QUIET_MS", "300")),
+        timeout_ms: int = int(os.getenv("BROWSER_SETTLE_TIMEOUT_MS", "5000")),
+        long_request_ms: int = 2000,
+        poll_ms: int = 50,
+    ):
+        self.page = page
+        self.quiet = quiet_ms / 1000
+        self.timeout = timeout_ms / 1000
+        self.long_request = long_request_ms / 1000
+        self.poll = poll_ms / 1000
+        self.stats = SettleStats()
+        # Requests in flight -> when they started.
+        self._inflight: Dict[Request, float] = {}
+        self._last_network = time.monotonic()
+        # Set on network activity, so a wait on the network wakes up right away.
+        self._activity = asyncio.Event()
+
+    async def attach(self) -> None:
+        self.page.on("request", self._on_request)
+        self.page.on("requestfinished", self._on_request_done)
+        self.page.on("requestfailed", self._on_request_done)
+        await self.page.add_init_script(_SETTLE_SCRIPT)
+        await self._install()
+
+    def _on_request(self, request: Request) -> None:
+        self._inflight[request] = self._last_network = time.monotonic()
+        self._activity.set()
+
+    def _on_request_done(self, request: Request) -> None:
+        self._inflight.pop(request, None)
+        self._last_network = time.monotonic()
+        self._activity.set()
+
+    async def _install(self) -> None:
+        try:
+            await self.page.evaluate(_SETTLE_SCRIPT)
+        except Exception as exc:
+            # Navigating; the init script covers the next document.
+            logger.debug(f"Settle script not installed: {exc}")
+
+    def _network_quiet(self, now: float) -> bool:
+        if any(now - started < self.long_request for started in self._inflight.values()):
+            return False
+        return now - self._last_network >= self.quiet
+
+    async def _page_stable(self) -> bool:
+        try:
+            state: Optional[Dict[str, Any]] = await self.page.evaluate(
+                "() => window.__catgptSettle ? window.__catgptSettle.check() : null"
+            )
+        except Exception as exc:
+            # The execution context went away: a navigation is under way.
+            logger.debug(f"Settle check failed: {exc}")
+            return False
+        if state is None:
+            await self._install()
+            return False
+        return state["stable"] and not state["loading"] and state["quietMs"] >= self.quiet * 1000
+
+    async def settle(self, action: str, timeout: Optional[float] = None) -> float:
+        """Wait until the page is stable, at most `timeout` seconds; return the time waited."""
+        started = time.monotonic()
+        deadline = started + (self.timeout if timeout is None else timeout)
+        outcome = "timeout"
+        while True:
+            if self._network_quiet(time.monotonic()) and await self._page_stable():
+                outcome = "settled"
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._activity.clear()
+            try:
+                await asyncio.wait_for(self._activity.wait(), min(self.poll, remaining))
+            except asyncio.TimeoutError:
+                pass
+
+        elapsed = time.monotonic() - started
+        BROWSER_SETTLE_SECONDS.labels(action, outcome).observe(elapsed)
+        self.stats.waits += 1
+        self.stats.timeouts += outcome == "timeout"
+        self.stats.total_ms += elapsed * 1000
+        self.stats.max_ms = max(self.stats.max_ms, elapsed * 1000)
+        logger.debug(f"Page {outcome} {elapsed * 1000:.0f} ms after {action}")
+        return elapsed
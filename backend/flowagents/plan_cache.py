@@ -0,0 +1,142 @@
+"""Cache of Conductor plans keyed by the normalized conversation.
+
+Planning with o3 is the most expensive call of a `/chat` turn, and many
+users send the same request. `PlanCache` maps a hash of the normalized
+message list to the `ConductorResponse` it produced:
+
+* a memory tier with LRU eviction and a time-to-live;
+* an optional on-disk tier (one JSON file per plan) that survives restarts
+  and is shared by every worker pointing at the same directory.
+
+Normalization keeps only the role and the text of each message, casefolded
+with whitespace collapsed, so reasoning items, item ids and formatting
+differences don't defeat the cache.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+
+from flowagents.conductor import ConductorResponse
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _text(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return " ".join(_text(part.get("text", "")) for part in content if isinstance(part, dict))
+    return ""
+
+
+def normalize_messages(messages: List[dict]) -> List[Tuple[str, str]]:
+    """Reduce input items to (role, text) pairs, ignoring non-message items."""
+    normalized = []
+    for item in messages:
+        role = item.get("role")
+        if role is None or item.get("type", "message") != "message":
+            continue
+        text = _WHITESPACE.sub(" ", _text(item.get("content"))).strip().casefold()
+        normalized.append((role, text))
+    return normalized
+
+
+def plan_cache_key(messages: List[dict]) -> str:
+    payload = json.dumps(normalize_messages(messages), separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class PlanCache:
+    """Two-tier (memory, then optional disk) LRU + TTL cache of plans."""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600, directory: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, Tuple[ConductorResponse, float]] = OrderedDict()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(messages: List[dict]) -> str:
+        return plan_cache_key(messages)
+
+    def get(self, key: str) -> Optional[ConductorResponse]:
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] > time.time():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+        self._entries.pop(key, None)
+
+        response = self._read_disk(key)
+        if response is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return response
+
+    def set(self, key: str, response: ConductorResponse) -> None:
+        self._remember(key, response, time.time() + self.ttl)
+        if self.directory:
+            path = self._path(key)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump({"expires_at": time.time() + self.ttl, "response": response.model_dump()}, f)
+                os.replace(tmp, path)
+            except OSError as exc:
+                logger.warning(f"Failed to write plan cache entry {key}: {exc}")
+
+    def _remember(self, key: str, response: ConductorResponse, expires_at: float) -> None:
+        self._entries[key] = (response, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _read_disk(self, key: str) -> Optional[ConductorResponse]:
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data["expires_at"] <= time.time():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        response = ConductorResponse.model_validate(data["response"])
+        # Promote to the memory tier.
+        self._remember(key, response, data["expires_at"])
+        return response
+
+
+def create_plan_cache() -> Optional[PlanCache]:
+    """Build the plan cache configured through the environment, if enabled."""
+    size = int(os.getenv("PLAN_CACHE_SIZE", "1024"))
+    if size <= 0:
+        return None
+    return PlanCache(
+        max_entries=size,
+        ttl=float(os.getenv("PLAN_CACHE_TTL", "3600")),
+        directory=os.getenv("PLAN_CACHE_DIR") or None,
+    )
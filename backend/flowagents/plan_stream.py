@@ -0,0 +1,93 @@
+"""Incremental parsing of a streamed `ConductorResponse`.
+
+With structured outputs the Conductor streams its answer as JSON text.
+`PlanStreamParser` scans that text as it arrives and reports the parts the
+UI can show before the whole document is complete: the friendly `message`
+once its string is closed, and every entry of `flow.agents` once its
+object is closed.
+
+The scanner only tracks what it needs for that – nesting, object keys,
+array indexes and string boundaries – and leaves decoding of each
+completed value to `json.loads`.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Any, List, Optional, Tuple
+
+MESSAGE_PATH: Tuple[Any, ...] = ("message",)
+AGENTS_PATH: Tuple[Any, ...] = ("flow", "agents")
+
+
+class _Frame:
+    __slots__ = ("kind", "path", "start", "key", "index", "expecting_key")
+
+    def __init__(self, kind: str, path: Tuple[Any, ...], start: int):
+        self.kind = kind
+        self.path = path
+        self.start = start
+        self.key: Optional[str] = None
+        self.index = 0
+        self.expecting_key = kind == "object"
+
+
+class PlanStreamParser:
+    """Feed JSON text chunks, get back ("message", str) and ("agent", dict) events."""
+
+    def __init__(self):
+        self._text = ""
+        self._position = 0
+        self._stack: List[_Frame] = []
+        self._in_string = False
+        self._escaped = False
+        self._string_start = 0
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    def _path(self) -> Tuple[Any, ...]:
+        if not self._stack:
+            return ()
+        top = self._stack[-1]
+        return (*top.path, top.key if top.kind == "object" else top.index)
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        events: List[Tuple[str, Any]] = []
+        self._text += chunk
+        text = self._text
+        for i in range(self._position, len(text)):
+            char = text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    top = self._stack[-1] if self._stack else None
+                    value = text[self._string_start : i + 1]
+                    if top is not None and top.kind == "object" and top.expecting_key:
+                        top.key = json.loads(value)
+                        top.expecting_key = False
+                    elif self._path() == MESSAGE_PATH:
+                        events.append(("message", json.loads(value)))
+            elif char == '"':
+                self._in_string = True
+                self._string_start = i
+            elif char in "{[":
+                path = self._path() if self._stack else ()
+                self._stack.append(_Frame("object" if char == "{" else "array", path, i))
+            elif char in "}]":
+                frame = self._stack.pop()
+                if frame.kind == "object" and len(frame.path) == 3 and frame.path[:2] == AGENTS_PATH:
+                    events.append(("agent", json.loads(text[frame.start : i + 1])))
+            elif char == "," and self._stack:
+                top = self._stack[-1]
+                if top.kind == "object":
+                    top.expecting_key = True
+                else:
+                    top.index += 1
+        self._position = len(text)
+        return events
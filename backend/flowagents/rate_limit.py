@@ -0,0 +1,261 @@
+"""Client-side rate limiting of model requests.
+
+Bursts of runs exceed the per-model request and token limits of the API,
+and the 429s are retried blindly by the SDK. `RateLimitedModelProvider`
+wraps the model provider used by every run (see `flowagents.base.run_config`)
+so each model request first takes its share of a per-model budget:
+
+* a token bucket of requests per minute and one of tokens per minute. Token
+  usage is estimated from the input before the request (images at a flat
+  cost, not by the size of their data), then corrected with the actual
+  usage once the response is complete;
+* requests waiting for budget are served by priority lane, then in arrival
+  order: "interactive" (`/chat` planning) before "batch" (`/run` steps and
+  jobs) before "background" (history summaries). Set the lane of the
+  current task with `priority_lane`;
+* when the API answers 429 anyway, the model's request budget is emptied
+  so every caller backs off.
+
+Limits are configured with `MODEL_RATE_LIMITS`, e.g.
+`o3=500/800000,gpt-4.1=500/300000,*=100/100000` (requests/tokens per
+minute, `*` for unlisted models). Models without limits aren't throttled.
+Time spent waiting is exported on /metrics.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import os
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from agents import Model, ModelProvider, ModelResponse
+from openai import RateLimitError
+
+from flowagents.metrics import MODEL_QUEUE_WAIT_SECONDS, MODEL_RATE_LIMITED
+
+logger = logging.getLogger(__name__)
+
+LANES = ("interactive", "batch", "background")
+_lane: ContextVar[str] = ContextVar("model_lane", default="batch")
+
+
+@contextmanager
+def priority_lane(lane: str) -> Iterator[None]:
+    """Run the model requests made in this block (and the tasks it starts) in `lane`."""
+    if lane not in LANES:
+        raise ValueError(f"Unknown priority lane: {lane}")
+    token = _lane.set(lane)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+def current_lane() -> str:
+    return _lane.get()
+
+
+# Images (screenshots) are billed by size, not by the length of their base64
+# data URL: count a flat cost per image, about a 1024x768 screenshot's.
+IMAGE_TOKENS = 1000
+_DATA_URL = re.compile(r"data:[\w/+.-]+;base64,[A-Za-z0-9+/=]*")
+
+
+def estimate_tokens(system_instructions: Optional[str], input: Any, model_settings: Any) -> int:
+    """Rough token count of a request: 4 characters per token, `IMAGE_TOKENS` per image, plus the output cap."""
+    text = (system_instructions or "") + (input if isinstance(input, str) else json.dumps(input, default=str))
+    text, images = _DATA_URL.subn("", text)
+    return len(text) // 4 + images * IMAGE_TOKENS + (getattr(model_settings, "max_tokens", None) or 0)
+
+
+class TokenBucket:
+    """Continuously refilled budget of `capacity` units per minute."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float) -> float:
+        """Seconds until `amount` units are available (0 if they are now)."""
+        self.refill()
+        return max(0.0, (amount - self.level) / self.rate)
+
+
+class ModelLimiter:
+    """Request and token budgets of one model, shared by priority lanes."""
+
+    def __init__(self, model: str, requests_per_minute: float, tokens_per_minute: float):
+        self.model = model
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        # (lane index, arrival, tokens, future) of the requests waiting for budget.
+        self._waiters: List[Tuple[int, int, float, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, tokens: float, lane: str) -> float:
+        """Wait for budget for one request of `tokens`; return the time waited."""
+        started = time.monotonic()
+        # A request larger than the whole budget would never be served.
+        tokens = min(tokens, self.tokens.capacity)
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (LANES.index(lane), next(self._sequence), tokens, future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Budget was granted just before the cancellation: give it back.
+                self.requests.level += 1
+                self.tokens.level += tokens
+                self._dispatch()
+            else:
+                self._waiters = [w for w in self._waiters if w[3] is not future]
+                heapq.heapify(self._waiters)
+            raise
+        waited = time.monotonic() - started
+        MODEL_QUEUE_WAIT_SECONDS.labels(self.model, lane).observe(waited)
+        if waited > 1:
+            logger.info(f"Waited {waited:.1f}s for {self.model} budget ({lane} lane, {len(self._waiters)} still waiting)")
+        return waited
+
+    def settle(self, estimated: float, actual: Optional[int]) -> None:
+        """Correct the token bucket once the actual usage of a request is known."""
+        if actual is not None:
+            self.tokens.refill()
+            self.tokens.level -= actual - min(estimated, self.tokens.capacity)
+            self._dispatch()
+
+    def penalize(self) -> None:
+        """The API rate limited us: stop sending until the request budget refills."""
+        MODEL_RATE_LIMITED.labels(self.model).inc()
+        self.requests.refill()
+        self.requests.level = min(self.requests.level, 0)
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._waiters:
+            _, _, tokens, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            # Strict priority: nothing overtakes the request at the head.
+            delay = max(self.requests.delay(1), self.tokens.delay(tokens))
+            if delay > 0:
+                self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+            heapq.heappop(self._waiters)
+            self.requests.level -= 1
+            self.tokens.level -= tokens
+            future.set_result(None)
+
+
+class RateLimiter:
+    """Per-model limiters, built on first use from the configured limits."""
+
+    def __init__(self, limits: Dict[str, Tuple[float, float]]):
+        self.limits = limits
+        self._limiters: Dict[str, ModelLimiter] = {}
+
+    def get(self, model: str) -> Optional[ModelLimiter]:
+        limiter = self._limiters.get(model)
+        if limiter is None:
+            limit = self.limits.get(model) or self.limits.get("*")
+            if limit is None:
+                return None
+            limiter = self._limiters[model] = ModelLimiter(model, *limit)
+        return limiter
+
+
+def parse_limits(spec: str) -> Dict[str, Tuple[float, float]]:
+    """Parse `model=requests/tokens,...` (both per minute)."""
+    limits: Dict[str, Tuple[float, float]] = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        model, _, budget = entry.partition("=")
+        requests, _, tokens = budget.partition("/")
+        limits[model.strip()] = (float(requests), float(tokens))
+    return limits
+
+
+class RateLimitedModel(Model):
+    """Model whose requests wait for their model's budget first."""
+
+    def __init__(self, model: Model, limiter: ModelLimiter):
+        self.model = model
+        self.limiter = limiter
+
+    async def get_response(self, system_instructions, input, model_settings, *args, **kwargs) -> ModelResponse:
+        estimated = estimate_tokens(system_instructions, input, model_settings)
+        await self.limiter.acquire(estimated, current_lane())
+        try:
+            response = await self.model.get_response(system_instructions, input, model_settings, *args, **kwargs)
+        except RateLimitError:
+            self.limiter.penalize()
+            raise
+        self.limiter.settle(estimated, response.usage.total_tokens)
+        return response
+
+    async def stream_response(self, system_instructions, input, model_settings, *args, **kwargs) -> AsyncIterator[Any]:
+        estimated = estimate_tokens(system_instructions, input, model_settings)
+        await self.limiter.acquire(estimated, current_lane())
+        actual = None
+        try:
+            async for event in self.model.stream_response(system_instructions, input, model_settings, *args, **kwargs):
+                if event.type == "response.completed" and event.response.usage is not None:
+                    actual = event.response.usage.total_tokens
+                yield event
+        except RateLimitError:
+            self.limiter.penalize()
+            raise
+        finally:
+            self.limiter.settle(estimated, actual)
+
+    def get_retry_advice(self, request):
+        return self.model.get_retry_advice(request)
+
+    async def close(self) -> None:
+        await self.model.close()
+
+    async def _cleanup_on_run_end(self, owner: object) -> None:
+        await self.model._cleanup_on_run_end(owner)
+
+
+class RateLimitedModelProvider(ModelProvider):
+    """Wrap the models of a provider with the limiter of their model name."""
+
+    def __init__(self, provider: ModelProvider, limiter: "RateLimiter"):
+        self.provider = provider
+        self.limiter = limiter
+
+    def get_model(self, model_name: Optional[str]) -> Model:
+        model = self.provider.get_model(model_name)
+        limiter = self.limiter.get(model_name or "default")
+        return RateLimitedModel(model, limiter) if limiter is not None else model
+
+    async def aclose(self) -> None:
+        await self.provider.aclose()
+
+
+# Shared by every run of the process.
+rate_limiter = RateLimiter(parse_limits(os.getenv("MODEL_RATE_LIMITS", "")))
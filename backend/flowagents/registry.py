@@ -0,0 +1,94 @@
+"""Registry of the agent types a workflow step can use.
+
+The Conductor plans steps by type ("filesystem", "assistant", ...). The
+registry maps each type to the factory building its `BaseAgent`, so adding
+a type only takes a `registry.register(...)` call. Building an agent is
+cheap: the SDK `Agent` definitions are cached by `BaseAgent`, and per-run
+resources (MCP servers, browsers) are only attached when the agent is
+entered.
+
+Factories can be given as "module:attribute" paths, imported the first
+time an agent of that type is created. A worker that never runs a
+computeruse step never loads Playwright. An agent module may define:
+
+* `async def prewarm()` – start what its first step would otherwise wait
+  for (pools, indexes); see `prewarm` and `STARTUP_PREWARM`;
+* `async def shutdown()` – release it; `shutdown` only calls it for the
+  modules that were loaded.
+"""
+
+from __future__ import annotations
+
+import logging
+import sys
+from typing import Callable, Dict, List, Union
+
+from flowagents.base import BaseAgent
+from flowagents.startup import startup_report
+
+logger = logging.getLogger(__name__)
+
+AgentFactory = Callable[[str], BaseAgent]
+
+
+class AgentRegistry:
+    """Maps step types to the factories of the agents implementing them."""
+
+    def __init__(self):
+        self._factories: Dict[str, Union[AgentFactory, str]] = {}
+
+    def register(self, type: str, factory: Union[AgentFactory, str]) -> None:
+        """Register the factory of a type, or its "module:attribute" path to import on first use."""
+        self._factories[type] = factory
+
+    @property
+    def types(self) -> List[str]:
+        return list(self._factories)
+
+    def __contains__(self, type: str) -> bool:
+        return type in self._factories
+
+    def factory(self, type: str) -> AgentFactory:
+        try:
+            factory = self._factories[type]
+        except KeyError:
+            raise ValueError(f"Unknown agent type: {type}") from None
+        if isinstance(factory, str):
+            module, _, attribute = factory.partition(":")
+            factory = self._factories[type] = getattr(startup_report.import_module(module, phase="lazy"), attribute)
+        return factory
+
+    def module(self, type: str) -> str:
+        """Name of the module implementing a type."""
+        factory = self._factories[type]
+        return factory.partition(":")[0] if isinstance(factory, str) else factory.__module__
+
+    def create(self, type: str, name: str) -> BaseAgent:
+        """Instantiate the agent for a step of the given type."""
+        agent = self.factory(type)(name)
+        agent.agent_type = type
+        return agent
+
+    async def prewarm(self, type: str) -> None:
+        """Load the module of a type and run its `prewarm()` hook, if it has one."""
+        self.factory(type)
+        hook = getattr(sys.modules[self.module(type)], "prewarm", None)
+        if hook is not None:
+            await hook()
+
+    async def shutdown(self) -> None:
+        """Run the `shutdown()` hook of every agent module that was loaded."""
+        for module in dict.fromkeys(self.module(type) for type in self.types):
+            hook = getattr(sys.modules.get(module), "shutdown", None)
+            if hook is not None:
+                try:
+                    await hook()
+                except Exception:
+                    logger.exception(f"Shutdown of {module} failed")
+
+
+registry = AgentRegistry()
+registry.register("assistant", "flowagents.assistant:AssistantAgent")
+registry.register("filesystem", "flowagents.filesystem:FileSystemAgent")
+registry.register("computeruse", "flowagents.computerUse:ComputerUseAgent")
+registry.register("websearch", "flowagents.websearch:WebSearchAgent")
@@ -0,0 +1,340 @@
+"""Chunked full-text index over `agent-files`.
+
+Reading whole files into the model context doesn't scale past a handful of
+small documents. `CorpusIndex` splits every text file under a directory
+into overlapping chunks of lines and keeps a BM25 inverted index over
+them, so the filesystem agent can ask for the few chunks relevant to a
+question (the `search_documents` tool) and prompt size stays flat as the
+corpus grows:
+
+* the index is maintained incrementally: a refresh only re-reads files
+  whose mtime or size changed and drops the chunks of deleted files;
+* `start()` keeps it current in the background, watching the directory
+  with `watchfiles` when it's installed and polling it otherwise; the
+  `search_documents` tool starts it on first use when nothing did before;
+* BM25 statistics are computed at query time from the postings, so
+  adding or removing a file never rewrites the rest of the index.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from agents import FunctionTool, function_tool
+
+try:
+    from watchfiles import awatch
+except ImportError:  # pragma: no cover – watchfiles is optional (uvicorn[standard] ships it)
+    awatch = None
+
+logger = logging.getLogger(__name__)
+# It logs every batch of changes at INFO.
+logging.getLogger("watchfiles").setLevel(logging.WARNING)
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    return [token.lower() for token in _TOKEN.findall(text)]
+
+
+@dataclass
+class Chunk:
+    path: str
+    start_line: int
+    end_line: int
+    text: str
+
+
+def chunk_text(text: str, max_chars: int = 1200, overlap: int = 200) -> List[Tuple[int, int, str]]:
+    """Split text into (first line, last line, text) chunks of about `max_chars`.
+
+    Chunks end on line boundaries and repeat up to `overlap` characters of
+    the previous chunk, so a passage cut in two is still found whole.
+    """
+    lines: List[Tuple[int, str]] = []
+    for number, line in enumerate(text.splitlines(keepends=True), start=1):
+        # A single huge line (minified data...) is cut into pieces of its own.
+        for start in range(0, max(len(line), 1), max_chars):
+            lines.append((number, line[start : start + max_chars]))
+
+    chunks: List[Tuple[int, int, str]] = []
+    start = 0
+    while start < len(lines):
+        end, size = start, 0
+        while end < len(lines) and (end == start or size + len(lines[end][1]) <= max_chars):
+            size += len(lines[end][1])
+            end += 1
+        chunks.append((lines[start][0], lines[end - 1][0], "".join(line for _, line in lines[start:end])))
+        if end == len(lines):
+            break
+        # Step back over the last lines of this chunk, within the overlap.
+        next_start, carried = end, 0
+        while next_start - 1 > start and carried + len(lines[next_start - 1][1]) <= overlap:
+            next_start -= 1
+            carried += len(lines[next_start][1])
+        start = next_start
+    return [chunk for chunk in chunks if chunk[2].strip()]
+
+
+class BM25Index:
+    """Inverted index of chunks, scored with Okapi BM25."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.chunks: Dict[int, Chunk] = {}
+        # term -> {chunk id: term frequency}
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.lengths: Dict[int, int] = {}
+        self.total_length = 0
+        self._by_path: Dict[str, List[int]] = {}
+        self._next_id = 0
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def add(self, path: str, chunks: List[Tuple[int, int, str]]) -> None:
+        self.remove(path)
+        ids = self._by_path[path] = []
+        for start_line, end_line, text in chunks:
+            chunk_id = self._next_id
+            self._next_id += 1
+            terms = Counter(tokenize(text))
+            for term, frequency in terms.items():
+                self.postings.setdefault(term, {})[chunk_id] = frequency
+            self.chunks[chunk_id] = Chunk(path, start_line, end_line, text)
+            self.lengths[chunk_id] = sum(terms.values())
+            self.total_length += self.lengths[chunk_id]
+            ids.append(chunk_id)
+
+    def remove(self, path: str) -> None:
+        for chunk_id in self._by_path.pop(path, []):
+            for term in set(tokenize(self.chunks.pop(chunk_id).text)):
+                postings = self.postings[term]
+                del postings[chunk_id]
+                if not postings:
+                    del self.postings[term]
+            self.total_length -= self.lengths.pop(chunk_id)
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[float, Chunk]]:
+        count = len(self.chunks)
+        if not count:
+            return []
+        average = self.total_length / count or 1
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, frequency in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[chunk_id] / average)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(score, self.chunks[chunk_id]) for chunk_id, score in best]
+
+
+class CorpusIndex:
+    """BM25 index of the text files under `root`, kept in sync with the directory."""
+
+    def __init__(
+        self,
+        root: str,
+        chunk_chars: int = 1200,
+        overlap: int = 200,
+        max_file_bytes: int = 20 * 1024 * 1024,
+        poll_interval: float = 5,
+    ):
+        self.root = os.path.realpath(root)
+        self.chunk_chars = chunk_chars
+        self.overlap = overlap
+        self.max_file_bytes = max_file_bytes
+        self.poll_interval = poll_interval
+        self.index = BM25Index()
+        # path -> (mtime_ns, size) of the indexed version
+        self.files: Dict[str, Tuple[int, int]] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stop: Optional[asyncio.Event] = None
+        # Set once the initial refresh of `start()` is done.
+        self._ready: Optional[asyncio.Event] = None
+
+    @property
+    def watching(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def paths(self) -> List[str]:
+        with self._lock:
+            return sorted(self.files)
+
+    # ------------------------------------------------------------------
+    # Indexing
+    # ------------------------------------------------------------------
+
+    def _ignored(self, path: str) -> bool:
+        """Hidden files and directories (editor swap files, .git...) aren't indexed."""
+        return any(part.startswith(".") for part in os.path.relpath(path, self.root).split(os.sep))
+
+    def _walk(self) -> Iterator[str]:
+        for directory, dirs, files in os.walk(self.root):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for name in files:
+                if not name.startswith("."):
+                    yield os.path.join(directory, name)
+
+    def refresh(self) -> int:
+        """Bring the index up to date with the directory; return the number of files (re)indexed."""
+        seen = set()
+        changed = 0
+        for path in self._walk():
+            seen.add(path)
+            changed += self.refresh_file(path)
+        for path in set(self.paths()) - seen:
+            self.refresh_file(path)
+        return changed
+
+    def refresh_file(self, path: str) -> bool:
+        """(Re)index one file, or drop it if it's gone; return whether the index changed."""
+        try:
+            if self._ignored(path):
+                raise FileNotFoundError(path)
+            stat = os.stat(path)
+        except OSError:
+            with self._lock:
+                if self.files.pop(path, None) is None:
+                    return False
+                self.index.remove(path)
+            logger.info(f"Removed {os.path.relpath(path, self.root)} from the document index")
+            return True
+
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if self.files.get(path) == version:
+                return False
+        chunks = self._chunks(path, stat.st_size)
+        with self._lock:
+            self.index.add(path, chunks)
+            self.files[path] = version
+        logger.info(f"Indexed {os.path.relpath(path, self.root)} ({len(chunks)} chunks)")
+        return True
+
+    def _chunks(self, path: str, size: int) -> List[Tuple[int, int, str]]:
+        if size > self.max_file_bytes:
+            logger.warning(f"Not indexing {path}: {size} bytes is above the limit")
+            return []
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError as exc:
+            logger.warning(f"Not indexing {path}: {exc}")
+            return []
+        if b"\0" in data[:8192]:
+            # Binary file.
+            return []
+        return chunk_text(data.decode("utf-8", errors="replace"), self.chunk_chars, self.overlap)
+
+    # ------------------------------------------------------------------
+    # Search
+    # ------------------------------------------------------------------
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[float, Chunk]]:
+        if not self.watching:
+            # Nobody keeps the index current; a stat of every file is cheap.
+            self.refresh()
+        with self._lock:
+            return self.index.search(query, k)
+
+    def tool(self, default_k: int = 5) -> FunctionTool:
+        """`search_documents` function tool over this index."""
+        corpus = self
+
+        @function_tool
+        async def search_documents(query: str, k: Optional[int] = None) -> str:
+            """Search the documents in agent-files and return the passages most relevant to a query, with their file and line numbers.
+            Prefer this over reading whole files when looking for specific information.
+
+            Args:
+                query: Keywords or a question describing the information to find.
+                k: Number of passages to return (default 5).
+            """
+            await corpus.ensure_started()
+            results = await asyncio.to_thread(corpus.search, query, k or default_k)
+            if not results:
+                return "No matching passages"
+            parent = os.path.dirname(corpus.root)
+            return "\n\n".join(
+                f"[{os.path.relpath(chunk.path, parent)}:{chunk.start_line}-{chunk.end_line}] (score {score:.2f})\n{chunk.text.rstrip()}"
+                for score, chunk in results
+            )
+
+        return search_documents
+
+    # ------------------------------------------------------------------
+    # Watching
+    # ------------------------------------------------------------------
+
+    async def start(self) -> None:
+        """Index the directory, then keep the index current in the background."""
+        if self.watching:
+            return
+        # Watch first, so files changed while indexing aren't missed.
+        self._stop = asyncio.Event()
+        self._ready = asyncio.Event()
+        self._task = asyncio.create_task(self._watch())
+        try:
+            indexed = await asyncio.to_thread(self.refresh)
+        finally:
+            self._ready.set()
+        logger.info(f"Document index ready: {indexed} file(s), {len(self.index)} chunks")
+
+    async def ensure_started(self) -> None:
+        """Start watching if nothing did, and wait for the initial refresh."""
+        if not self.watching:
+            await self.start()
+        await self._ready.wait()
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._stop.set()
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _watch(self) -> None:
+        if awatch is not None:
+            try:
+                async for changes in awatch(self.root, stop_event=self._stop):
+                    for path in {path for _, path in changes}:
+                        if os.path.isdir(path):
+                            # A directory moved in or out: rescan.
+                            await asyncio.to_thread(self.refresh)
+                        else:
+                            await asyncio.to_thread(self.refresh_file, os.path.realpath(path))
+                return
+            except Exception as exc:
+                logger.warning(f"Watching {self.root} failed ({exc}), polling it instead")
+        while not self._stop.is_set():
+            await asyncio.sleep(self.poll_interval)
+            await asyncio.to_thread(self.refresh)
+
+
+def create_corpus_index(root: str) -> Optional[CorpusIndex]:
+    """Build the document index configured through the environment, if enabled."""
+    if os.getenv("RETRIEVAL_INDEX", "1") in ("0", "false", "no"):
+        return None
+    return CorpusIndex(
+        root,
+        chunk_chars=int(os.getenv("RETRIEVAL_CHUNK_CHARS", "1200")),
+        overlap=int(os.getenv("RETRIEVAL_CHUNK_OVERLAP", "200")),
+        max_file_bytes=int(os.getenv("RETRIEVAL_MAX_FILE_BYTES", str(20 * 1024 * 1024))),
+        poll_interval=float(os.getenv("RETRIEVAL_POLL_INTERVAL", "5")),
+    )
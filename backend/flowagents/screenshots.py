@@ -0,0 +1,143 @@
+"""Screenshot encoding for `LocalPlaywrightComputer`.
+
+Every computer-use turn uploads a screenshot, so their size drives both
+bandwidth and token cost. `ScreenshotEncoder` lets a deployment trade
+fidelity for size:
+
+* `format` – "png" (lossless, the default), "jpeg" or "webp";
+* `quality` – lossy quality, 1-100;
+* `scale` – downscaling factor applied to the viewport (e.g. 0.75).
+
+PNG and JPEG at full scale are encoded by the browser itself. WebP and
+downscaling go through Pillow, which is optional; without it the encoder
+falls back to what Playwright can produce.
+
+Frames are fingerprinted before encoding: when the viewport hasn't
+changed since the previous screenshot, the previous encoded frame is
+returned as is.
+
+Sizes and encoding times (transcoding and base64, not the capture by the
+browser) are exported as metrics as well as kept in `ScreenshotStats`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import hashlib
+import io
+import logging
+import os
+import time
+from typing import Optional
+
+from playwright.async_api import Page
+from pydantic import BaseModel
+
+from flowagents.metrics import SCREENSHOT_BYTES, SCREENSHOT_ENCODE_SECONDS
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover – Pillow is optional
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+
+class ScreenshotStats(BaseModel):
+    """Per-step counters, used to tune the encoder settings."""
+
+    captured: int = 0
+    reused: int = 0
+    encoded: int = 0
+    bytes_total: int = 0
+    bytes_last: int = 0
+    encode_ms_total: float = 0.0
+
+    @property
+    def bytes_avg(self) -> float:
+        return self.bytes_total / self.captured if self.captured else 0.0
+
+    @property
+    def encode_ms_avg(self) -> float:
+        return self.encode_ms_total / self.encoded if self.encoded else 0.0
+
+
+class ScreenshotEncoder:
+    """Capture the viewport and encode it according to the configured settings."""
+
+    def __init__(
+        self,
+        format: str = os.getenv("SCREENSHOT_FORMAT", "png"),
+        quality: int = int(os.getenv("SCREENSHOT_QUALITY", "75")),
+        scale: float = float(os.getenv("SCREENSHOT_SCALE", "1.0")),
+    ):
+        format = format.lower()
+        if format not in {"png", "jpeg", "webp"}:
+            raise ValueError(f"Unsupported screenshot format: {format}")
+        if not 0 < scale <= 1:
+            raise ValueError("Screenshot scale must be in (0, 1]")
+
+        if Image is None and (format == "webp" or scale != 1):
+            logger.warning("Pillow is not installed; screenshots fall back to full-size JPEG/PNG")
+            format = "jpeg" if format == "webp" else format
+            scale = 1.0
+
+        self.format = format
+        self.quality = max(1, min(100, quality))
+        self.scale = scale
+        self.stats = ScreenshotStats()
+
+        self._last_fingerprint: Optional[str] = None
+        self._last_encoded: Optional[str] = None
+
+    @property
+    def needs_pillow(self) -> bool:
+        return self.format == "webp" or self.scale != 1
+
+    def scaled(self, width: int, height: int) -> tuple[int, int]:
+        """Size of the encoded image for a viewport of the given size."""
+        return round(width * self.scale), round(height * self.scale)
+
+    async def capture(self, page: Page) -> str:
+        """Return the current viewport as a base64 string."""
+        if self.needs_pillow:
+            raw = await page.screenshot(full_page=False, type="png")
+        elif self.format == "jpeg":
+            raw = await page.screenshot(full_page=False, type="jpeg", quality=self.quality)
+        else:
+            raw = await page.screenshot(full_page=False, type="png")
+
+        fingerprint = hashlib.blake2b(raw, digest_size=16).hexdigest()
+        if fingerprint == self._last_fingerprint and self._last_encoded is not None:
+            self.stats.reused += 1
+            encoded = self._last_encoded
+        else:
+            started = time.perf_counter()
+            data = await asyncio.to_thread(self._transcode, raw) if self.needs_pillow else raw
+            encoded = base64.b64encode(data).decode("utf-8")
+            elapsed = time.perf_counter() - started
+            self._last_fingerprint = fingerprint
+            self._last_encoded = encoded
+            self.stats.encoded += 1
+            self.stats.encode_ms_total += elapsed * 1000
+            SCREENSHOT_ENCODE_SECONDS.labels(self.format).observe(elapsed)
+
+        self.stats.captured += 1
+        self.stats.bytes_last = len(encoded)
+        self.stats.bytes_total += len(encoded)
+        SCREENSHOT_BYTES.labels(self.format).observe(len(encoded))
+        return encoded
+
+    def _transcode(self, png_bytes: bytes) -> bytes:
+        image = Image.open(io.BytesIO(png_bytes))
+        if self.scale != 1:
+            image = image.resize(self.scaled(*image.size), Image.LANCZOS)
+        output = io.BytesIO()
+        if self.format == "png":
+            image.save(output, format="PNG", optimize=True)
+        elif self.format == "jpeg":
+            image.convert("RGB").save(output, format="JPEG", quality=self.quality)
+        else:
+            image.save(output, format="WEBP", quality=self.quality)
+        return output.getvalue()
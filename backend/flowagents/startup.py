@@ -0,0 +1,90 @@
+"""Start-up cost accounting for the backend.
+
+Worker boot time decides how fast a deployment scales out, so `main.py`
+measures it instead of guessing:
+
+* heavy dependencies are imported one at a time through
+  `startup_report.import_module`, which records the time each took and
+  how many modules it pulled in;
+* module-level initialisation (stores, pools...) and the prewarm hooks
+  run at startup (`STARTUP_PREWARM`) are wrapped in
+  `startup_report.measure`;
+* agent modules loaded on first use by the registry are recorded too,
+  under the "lazy" phase, since that cost lands on the first request.
+
+The report is logged once the application has started and served on
+`GET /startup`.
+"""
+
+from __future__ import annotations
+
+import importlib
+import logging
+import sys
+import time
+from contextlib import contextmanager
+from types import ModuleType
+from typing import Iterator, List, Optional
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+
+class StartupEntry(BaseModel):
+    phase: str
+    name: str
+    seconds: float
+    # Modules imported while measuring (dependencies included).
+    modules: int
+
+
+class StartupReport:
+    """Timings of the imports, initialisation and prewarm hooks of this process."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.ready: Optional[float] = None
+        self.entries: List[StartupEntry] = []
+
+    @contextmanager
+    def measure(self, phase: str, name: str) -> Iterator[None]:
+        started, modules = time.perf_counter(), len(sys.modules)
+        try:
+            yield
+        finally:
+            entry = StartupEntry(
+                phase=phase, name=name, seconds=time.perf_counter() - started, modules=len(sys.modules) - modules
+            )
+            self.entries.append(entry)
+            if self.ready is not None:
+                logger.info(f"{phase.capitalize()} {name} took {entry.seconds * 1000:.0f} ms ({entry.modules} modules)")
+
+    def import_module(self, name: str, phase: str = "import") -> ModuleType:
+        """Import `name`, recording its cost unless it was already loaded."""
+        module = sys.modules.get(name)
+        if module is not None:
+            return module
+        with self.measure(phase, name):
+            return importlib.import_module(name)
+
+    def mark_ready(self) -> None:
+        self.ready = time.perf_counter()
+
+    def summary(self) -> dict:
+        return {
+            "seconds_to_ready": None if self.ready is None else self.ready - self.started,
+            "entries": [entry.model_dump() for entry in self.entries],
+        }
+
+    def log(self) -> None:
+        total = (self.ready or time.perf_counter()) - self.started
+        lines = [
+            f"  {entry.phase:<8} {entry.name:<32} {entry.seconds * 1000:8.0f} ms  {entry.modules:5} modules"
+            for entry in sorted(self.entries, key=lambda entry: entry.seconds, reverse=True)
+        ]
+        logger.info("\n".join([f"Started in {total:.2f}s:", *lines]))
+
+
+# Created when `main.py` starts importing, so `started` is close to process start.
+startup_report = StartupReport()
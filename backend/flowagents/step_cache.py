@@ -0,0 +1,147 @@
+"""Memoization of workflow step results.
+
+Running a workflow again re-executes steps whose instructions and inputs
+haven't changed. `StepCache` maps a hash of the agent type, model,
+instructions and input list of a step to the output it produced, so the
+executor can replay it instead of calling the model:
+
+* entries are evicted least recently used first, above `max_entries` or
+  `max_bytes` of cached output;
+* an entry can depend on files (what a filesystem step read). Their
+  fingerprint (mtime, size and content hash) is recorded with the output,
+  and the entry is dropped as soon as one of them changes. Fingerprints are
+  computed and checked in a worker thread, off the event loop.
+
+Agents with side effects (computeruse) and network-backed ones whose
+answers go stale (websearch) are never cached; see
+`BaseAgent.cache_dependencies`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (mtime_ns, size, sha256) of a file, (mtime_ns, -1, hash of the recursive
+# listing) of a directory, or None when the path doesn't exist.
+Fingerprint = Optional[Tuple[int, int, str]]
+
+
+def fingerprint(path: str) -> Fingerprint:
+    try:
+        stat = os.stat(path)
+        if os.path.isdir(path):
+            return stat.st_mtime_ns, -1, _listing_hash(path)
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 16), b""):
+                digest.update(block)
+        return stat.st_mtime_ns, stat.st_size, digest.hexdigest()
+    except OSError:
+        return None
+
+
+def _listing_hash(path: str) -> str:
+    """Hash of the relative path, mtime and size of everything below a directory."""
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files) + dirs:
+            entry = os.path.join(root, name)
+            try:
+                stat = os.stat(entry)
+            except OSError:
+                continue
+            digest.update(f"{os.path.relpath(entry, path)}\0{stat.st_mtime_ns}\0{stat.st_size}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def unchanged(path: str, recorded: Fingerprint) -> bool:
+    """Whether a path still matches its fingerprint.
+
+    For a file, matching mtime and size are trusted; otherwise the content
+    is hashed again, so a file that was only touched stays valid. A
+    directory's own mtime misses changes deeper in the tree, so its listing
+    is always hashed again.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return recorded is None
+    if recorded is None:
+        return False
+    if os.path.isdir(path):
+        return recorded[1] == -1 and _listing_hash(path) == recorded[2]
+    if (stat.st_mtime_ns, stat.st_size) == recorded[:2]:
+        return True
+    current = fingerprint(path)
+    return current is not None and current[1:] == recorded[1:]
+
+
+def step_cache_key(agent_type: str, model: str, instructions: str, input: List[dict]) -> str:
+    payload = json.dumps([agent_type, model, instructions, input], separators=(",", ":"), sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class StepCache:
+    """Size-bounded LRU of step outputs, invalidated by file changes."""
+
+    def __init__(self, max_entries: int = 512, max_bytes: int = 32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # key -> (output, {path: fingerprint})
+        self._entries: OrderedDict[str, Tuple[str, Dict[str, Fingerprint]]] = OrderedDict()
+        self._bytes = 0
+
+    @staticmethod
+    def key(agent_type: str, model: str, instructions: str, input: List[dict]) -> str:
+        return step_cache_key(agent_type, model, instructions, input)
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        output, files = entry
+        if files and not await asyncio.to_thread(lambda: all(unchanged(path, recorded) for path, recorded in files.items())):
+            logger.info(f"Step cache entry {key[:12]} invalidated by a file change")
+            self._remove(key)
+            self.misses += 1
+            return None
+        if key not in self._entries:
+            # Replaced or evicted while the files were checked.
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return output
+
+    async def set(self, key: str, output: str, paths: List[str]) -> None:
+        files = await asyncio.to_thread(lambda: {path: fingerprint(path) for path in paths}) if paths else {}
+        self._remove(key)
+        self._entries[key] = (output, files)
+        self._bytes += len(output)
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[0])
+
+
+def create_step_cache() -> Optional[StepCache]:
+    """Build the step cache configured through the environment, if enabled."""
+    size = int(os.getenv("STEP_CACHE_SIZE", "512"))
+    if size <= 0:
+        return None
+    return StepCache(max_entries=size, max_bytes=int(os.getenv("STEP_CACHE_MAX_BYTES", str(32 * 1024 * 1024))))
@@ -0,0 +1,81 @@
+"""Bounded, coalescing channel between running agents and an HTTP stream.
+
+Producers (one per running workflow step) `put` events; the response
+generator `get`s them. The queue is bounded, so when the client reads
+slowly the generator stops pulling, the queue fills up and producers wait:
+the stream is paced by the client instead of by the wall clock.
+
+Consecutive text deltas from the same agent are merged on the way out. The
+merge is adaptive: when the client keeps up, deltas are forwarded as soon
+as they arrive (after at most `window` seconds of batching); when it falls
+behind, whatever piled up in the queue is sent as one chunk of up to
+`max_chars` characters.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+from typing import Optional, Tuple
+
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "64"))
+STREAM_COALESCE_MAX_CHARS = int(os.getenv("STREAM_COALESCE_MAX_CHARS", "512"))
+STREAM_COALESCE_WINDOW_MS = float(os.getenv("STREAM_COALESCE_WINDOW_MS", "10"))
+
+# (agent name, event kind, payload) – see `flowagents.workflow.WorkflowEvent`.
+Event = Tuple[str, str, object]
+
+
+class EventChannel:
+    """Bounded queue that merges consecutive deltas of the same agent."""
+
+    def __init__(
+        self,
+        maxsize: int = STREAM_QUEUE_SIZE,
+        max_chars: int = STREAM_COALESCE_MAX_CHARS,
+        window: float = STREAM_COALESCE_WINDOW_MS / 1000,
+    ):
+        self._queue: asyncio.Queue[Event] = asyncio.Queue(maxsize=maxsize)
+        self._held: Optional[Event] = None
+        self.max_chars = max_chars
+        self.window = window
+
+    async def put(self, event: Event) -> None:
+        """Enqueue an event, waiting while the consumer is behind."""
+        await self._queue.put(event)
+
+    async def get(self) -> Event:
+        """Return the next event, merging any deltas that can be merged."""
+        if self._held is not None:
+            first, self._held = self._held, None
+        else:
+            first = await self._queue.get()
+
+        name, kind, payload = first
+        if kind != "delta":
+            return first
+
+        chunks = [payload]
+        size = len(payload)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.window
+        while size < self.max_chars:
+            try:
+                following = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    following = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            if following[0] == name and following[1] == "delta":
+                chunks.append(following[2])
+                size += len(following[2])
+            else:
+                self._held = following
+                break
+
+        return name, kind, "".join(chunks)
@@ -0,0 +1,447 @@
+"""Record and replay of computer-use action trajectories.
+
+Repetitive computer-use tasks (submitting one expense after another) pay
+for a full screenshot → model → action loop every time. When a computer
+use step succeeds, the actions it performed on the page are saved as a
+`Trajectory`, and later steps asking for the same task replay them
+directly through Playwright:
+
+* a trajectory is parameterized: text the model typed that appears in the
+  step's input (an amount, a description) becomes a parameter, and the
+  rest of the input becomes a template. A later input matching the
+  template (with other values) replays the actions with its own values.
+  Most of the task must stay literal (`MIN_LITERAL_CHARS`,
+  `MIN_LITERAL_SHARE`), in the template and in the tasks it matches: a
+  task typed whole would otherwise become a template matching anything;
+* every action carries a DOM checkpoint: the page URL and the element
+  under the pointer (or focused, for keyboard actions) when it was
+  recorded. Before replaying an action the checkpoint is checked again.
+  An element that moved is found again by its id or name; anything else
+  is a divergence;
+* on divergence the replay stops and the model takes over from the
+  current page, told which actions were already done. The actions of that
+  run (replayed and new) then replace the trajectory;
+* a completed replay's result is read from the final page (a screenshot
+  and its text, see `result_input`) by a single model turn. The answer
+  of the recorded run is not kept: ids, totals and confirmations differ
+  from one run to the next.
+
+Only runs that a model turn over their final page judges successful are
+recorded. Replay is opt-in (`TRAJECTORY_REPLAY=1`). Trajectories are kept
+in a JSON file (`TRAJECTORY_STORE_PATH`), least recently used first out
+above `TRAJECTORY_MAX_ENTRIES`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+# Typed text shorter than this stays literal: single characters would turn
+# half of the task into parameters.
+MIN_PARAMETER_LENGTH = 2
+# Letters and digits a template keeps literal, at least, and their share of
+# the task it is matched against.
+MIN_LITERAL_CHARS = 12
+MIN_LITERAL_SHARE = 0.5
+
+# Signature of the element at a point (or the focused one when x is null).
+# Form fields are identified by their attributes, not by their value,
+# which changes from one run to the next.
+_ELEMENT_SCRIPT = """
+([x, y]) => {
+  const el = x === null ? document.activeElement : document.elementFromPoint(x, y);
+  if (!el || el === document.body) return null;
+  const tag = el.tagName.toLowerCase();
+  const field = ["input", "textarea", "select"].includes(tag);
+  const label = el.getAttribute("aria-label") || el.getAttribute("placeholder")
+    || (field ? "" : (el.innerText || "").trim().slice(0, 80));
+  const name = el.getAttribute("name");
+  let selector = null;
+  if (el.id) selector = "#" + CSS.escape(el.id);
+  else if (name) selector = `${tag}[name="${CSS.escape(name)}"]`;
+  return {tag, id: el.id || null, name, label, selector};
+}
+"""
+
+
+class Checkpoint(BaseModel):
+    url: str
+    element: Optional[Dict[str, Any]] = None
+
+
+class Action(BaseModel):
+    """One `AsyncComputer` action, in viewport coordinates."""
+
+    kind: str
+    args: Dict[str, Any] = {}
+    # For "type" actions whose text is a parameter: its index.
+    param: Optional[int] = None
+    checkpoint: Optional[Checkpoint] = None
+
+    def describe(self) -> str:
+        args = ", ".join(f"{key}={value!r}" for key, value in self.args.items())
+        return f"{self.kind}({args})"
+
+
+# A template is a list of literal strings and parameter indexes.
+Template = List[Union[str, int]]
+
+
+class Trajectory(BaseModel):
+    template: Template
+    actions: List[Action]
+    final_url: Optional[str] = None
+    created_at: float = 0
+    last_used: float = 0
+    replays: int = 0
+
+    @property
+    def key(self) -> str:
+        return json.dumps(self.template)
+
+    def match(self, task: str) -> Optional[List[str]]:
+        """Parameter values if `task` fits the template, else None."""
+        pattern, seen = "", set()
+        for segment in self.template:
+            if isinstance(segment, int):
+                pattern += f"(?P=p{segment})" if segment in seen else f"(?P<p{segment}>.+?)"
+                seen.add(segment)
+            else:
+                pattern += re.escape(segment)
+        found = re.fullmatch(pattern, task, re.DOTALL)
+        if found is None or not specific(self.template, task):
+            return None
+        return [found.group(f"p{index}") for index in range(len(seen))]
+
+
+def task_text(input: Union[str, List[dict]]) -> str:
+    """The text of a step's input, which identifies its task."""
+    if isinstance(input, str):
+        return input
+    return "\n\n".join(message["content"] for message in input if isinstance(message.get("content"), str))
+
+
+def _significant(text: str) -> int:
+    return sum(1 for char in text if char.isalnum())
+
+
+def specific(template: Template, task: str) -> bool:
+    """Whether enough of `task` is literal text of `template` for it to identify the task."""
+    literal = sum(_significant(segment) for segment in template if isinstance(segment, str))
+    return literal >= MIN_LITERAL_CHARS and literal >= MIN_LITERAL_SHARE * _significant(task)
+
+
+def parameterize(text: str, values: List[str]) -> Template:
+    """Split `text` on whole-word occurrences of `values` (parameter i for values[i])."""
+    if not values:
+        return [text]
+    order = sorted(range(len(values)), key=lambda index: -len(values[index]))
+    alternatives = []
+    for index in order:
+        value = re.escape(values[index])
+        # Don't split inside words or numbers: "20" isn't a parameter of "2020".
+        prefix = r"(?<!\w)" if values[index][0].isalnum() else ""
+        suffix = r"(?!\w)" if values[index][-1].isalnum() else ""
+        alternatives.append(f"(?P<v{index}>{prefix}{value}{suffix})")
+    template: Template = []
+    position = 0
+    for found in re.finditer("|".join(alternatives), text):
+        if found.start() > position:
+            template.append(text[position : found.start()])
+        template.append(int(found.lastgroup[1:]))
+        position = found.end()
+    if position < len(text):
+        template.append(text[position:])
+    return template
+
+
+def build_trajectory(task: str, actions: List[Action], final_url: Optional[str]) -> Optional[Trajectory]:
+    """Parameterize a recorded run: typed text found in the task becomes a parameter.
+
+    None when too little of the task would stay literal (see `specific`).
+    """
+    candidates: List[str] = []
+    for action in actions:
+        text = action.args.get("text") if action.kind == "type" else None
+        if text and len(text.strip()) >= MIN_PARAMETER_LENGTH and text in task and text not in candidates:
+            candidates.append(text)
+    # Text only found inside a word of the task ("20" in "2020") stays literal.
+    found = {segment for segment in parameterize(task, candidates) if isinstance(segment, int)}
+    values = [value for index, value in enumerate(candidates) if index in found]
+    for action in actions:
+        text = action.args.get("text") if action.kind == "type" else None
+        action.param = values.index(text) if text in values else None
+    template = parameterize(task, values)
+    if not specific(template, task):
+        return None
+    now = time.time()
+    return Trajectory(
+        template=template,
+        actions=actions,
+        final_url=final_url,
+        created_at=now,
+        last_used=now,
+    )
+
+
+# Instructions of the model turn reading a replay's result off the page.
+RESULT_INSTRUCTIONS = (
+    "The actions of a computer-use task were just performed in a browser. From the screenshot and the text of the "
+    "page they led to, write the final answer to the task as the agent that performed it would have. Report values "
+    "shown on the page (ids, totals, confirmations) exactly as they appear. If the page doesn't show that the task "
+    "was completed, answer exactly INCOMPLETE."
+)
+# Instructions of the model turn checking that a run succeeded before it is recorded.
+SUCCESS_INSTRUCTIONS = (
+    "An agent just performed a computer-use task in a browser. From its final answer, the screenshot and the text "
+    "of the page it ended on, tell whether it completed the task. Answer exactly SUCCEEDED if it did, and FAILED "
+    "otherwise, including when it gave up, reported an error or asked for more information."
+)
+# Page text beyond this is cut; the screenshot shows the viewport anyway.
+MAX_PAGE_TEXT = 8000
+
+
+async def page_text(page: Any) -> str:
+    text = await page.evaluate("() => document.body ? document.body.innerText : ''")
+    return text[:MAX_PAGE_TEXT]
+
+
+def result_input(task: str, screenshot: str, media_type: str, text: str, answer: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Input of a model turn over the final page: reading a replay's result, or checking a run's `answer`."""
+    if answer is not None:
+        task = f"{task}\n\nFinal answer of the agent:\n{answer}"
+    return [{
+        "role": "user",
+        "content": [
+            {"type": "input_text", "text": f"Task:\n{task}\n\nText of the page:\n{text}"},
+            {"type": "input_image", "image_url": f"data:{media_type};base64,{screenshot}", "detail": "auto"},
+        ],
+    }]
+
+
+class TrajectoryStore:
+    """Trajectories persisted in a JSON file, re-read when another process changes it."""
+
+    def __init__(self, path: str, max_entries: int = 200):
+        self.path = path
+        self.max_entries = max_entries
+        self._trajectories: Dict[str, Trajectory] = {}
+        self._loaded_mtime: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        self._load()
+        return len(self._trajectories)
+
+    def _load(self) -> None:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._loaded_mtime:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = [Trajectory.model_validate(entry) for entry in json.load(f)]
+        except (OSError, ValueError) as exc:
+            logger.warning(f"Ignoring unreadable trajectory store {self.path}: {exc}")
+            return
+        self._trajectories = {trajectory.key: trajectory for trajectory in entries}
+        self._loaded_mtime = mtime
+
+    def _write(self) -> None:
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump([trajectory.model_dump() for trajectory in self._trajectories.values()], f)
+        os.replace(temporary, self.path)
+        self._loaded_mtime = os.stat(self.path).st_mtime_ns
+
+    def find(self, task: str) -> Optional[Tuple[Trajectory, List[str]]]:
+        """The trajectory whose template matches `task` (the most specific one), with its parameters."""
+        with self._lock:
+            self._load()
+            candidates = sorted(
+                self._trajectories.values(),
+                key=lambda trajectory: -sum(len(segment) for segment in trajectory.template if isinstance(segment, str)),
+            )
+        for trajectory in candidates:
+            params = trajectory.match(task)
+            if params is not None:
+                return trajectory, params
+        return None
+
+    def save(self, trajectory: Trajectory) -> None:
+        with self._lock:
+            self._load()
+            self._trajectories.pop(trajectory.key, None)
+            self._trajectories[trajectory.key] = trajectory
+            while len(self._trajectories) > self.max_entries:
+                oldest = min(self._trajectories.values(), key=lambda entry: entry.last_used)
+                del self._trajectories[oldest.key]
+            try:
+                self._write()
+            except OSError as exc:
+                logger.warning(f"Failed to save trajectory store {self.path}: {exc}")
+
+    def used(self, trajectory: Trajectory) -> None:
+        trajectory.last_used = time.time()
+        trajectory.replays += 1
+        self.save(trajectory)
+
+
+# ---------------------------------------------------------------------------
+# Recording and replay on a Playwright page
+# ---------------------------------------------------------------------------
+
+
+async def element_at(page: Any, x: Optional[int] = None, y: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    try:
+        return await page.evaluate(_ELEMENT_SCRIPT, [x, y])
+    except Exception as exc:
+        # The page may be navigating.
+        logger.debug(f"DOM checkpoint failed: {exc}")
+        return None
+
+
+def _point(action: Action) -> Tuple[Optional[int], Optional[int]]:
+    if action.kind == "drag":
+        x, y = action.args["path"][0]
+        return x, y
+    return action.args.get("x"), action.args.get("y")
+
+
+def _same_element(recorded: Optional[Dict[str, Any]], current: Optional[Dict[str, Any]]) -> bool:
+    if recorded is None:
+        return True
+    if current is None:
+        return False
+    return all(recorded.get(field) == current.get(field) for field in ("tag", "id", "name", "label"))
+
+
+class TrajectoryRecorder:
+    """Collects the actions of a run with their DOM checkpoints."""
+
+    def __init__(self):
+        self.actions: List[Action] = []
+
+    async def record(self, page: Any, kind: str, args: Dict[str, Any]) -> None:
+        action = Action(kind=kind, args=args)
+        if kind != "wait":
+            x, y = _point(action)
+            action.checkpoint = Checkpoint(url=page.url, element=await element_at(page, x, y))
+        self.actions.append(action)
+
+
+class ReplayOutcome(BaseModel):
+    completed: bool
+    # Actions replayed before the divergence (all of them when completed).
+    replayed: List[Action] = []
+    reason: Optional[str] = None
+
+
+async def replay_trajectory(
+    page: Any, trajectory: Trajectory, params: List[str], settle: Callable[[Any], Awaitable[None]]
+) -> ReplayOutcome:
+    """Replay a trajectory on `page`, checking each action's checkpoint first.
+
+    `settle(page)` is awaited after every action, so the next checkpoint
+    sees the page the action produced.
+    """
+    replayed: List[Action] = []
+    for index, recorded in enumerate(trajectory.actions):
+        action = recorded.model_copy(deep=True)
+        if action.param is not None:
+            action.args["text"] = params[action.param]
+        checkpoint = action.checkpoint
+        if checkpoint is not None:
+            if page.url != checkpoint.url:
+                return ReplayOutcome(completed=False, replayed=replayed, reason=f"action {index}: at {page.url}, expected {checkpoint.url}")
+            x, y = _point(action)
+            current = await element_at(page, x, y)
+            if not _same_element(checkpoint.element, current):
+                if not await _retarget(page, action):
+                    return ReplayOutcome(completed=False, replayed=replayed, reason=f"action {index}: {current} instead of {checkpoint.element}")
+        await perform(page, action)
+        replayed.append(action)
+        await settle(page)
+
+    if trajectory.final_url is not None and page.url != trajectory.final_url:
+        return ReplayOutcome(completed=False, replayed=replayed, reason=f"ended at {page.url}, expected {trajectory.final_url}")
+    return ReplayOutcome(completed=True, replayed=replayed)
+
+
+async def _retarget(page: Any, action: Action) -> bool:
+    """Point an action at its recorded element again, if the element can be found elsewhere."""
+    element = action.checkpoint.element
+    if not element or not element.get("selector"):
+        return False
+    try:
+        locator = page.locator(element["selector"]).first
+        if action.kind in ("type", "keypress"):
+            await locator.focus(timeout=2000)
+            return _same_element(element, await element_at(page))
+        box = await locator.bounding_box(timeout=2000)
+    except Exception as exc:
+        logger.debug(f"Can't find {element['selector']} again: {exc}")
+        return False
+    if box is None or action.kind == "drag":
+        return False
+    x, y = round(box["x"] + box["width"] / 2), round(box["y"] + box["height"] / 2)
+    if not _same_element(element, await element_at(page, x, y)):
+        return False
+    action.args.update(x=x, y=y)
+    return True
+
+
+async def perform(page: Any, action: Action) -> None:
+    """Execute an action on a Playwright page (viewport coordinates)."""
+    args = action.args
+    if action.kind == "click":
+        await page.mouse.click(args["x"], args["y"], button=args.get("button", "left"))
+    elif action.kind == "double_click":
+        await page.mouse.dblclick(args["x"], args["y"])
+    elif action.kind == "scroll":
+        await page.mouse.move(args["x"], args["y"])
+        await page.evaluate(f"window.scrollBy({args['scroll_x']}, {args['scroll_y']})")
+    elif action.kind == "type":
+        await page.keyboard.type(args["text"])
+    elif action.kind == "move":
+        await page.mouse.move(args["x"], args["y"])
+    elif action.kind == "keypress":
+        for key in args["keys"]:
+            await page.keyboard.down(key)
+        for key in reversed(args["keys"]):
+            await page.keyboard.up(key)
+    elif action.kind == "drag":
+        path = args["path"]
+        await page.mouse.move(*path[0])
+        await page.mouse.down()
+        for x, y in path[1:]:
+            await page.mouse.move(x, y)
+        await page.mouse.up()
+    elif action.kind == "wait":
+        # Replays don't wait for the model's pace; `settle` waits for the page.
+        await asyncio.sleep(0)
+    else:
+        raise ValueError(f"Unknown action: {action.kind}")
+
+
+def create_trajectory_store() -> Optional[TrajectoryStore]:
+    """Build the trajectory store configured through the environment, if enabled."""
+    if os.getenv("TRAJECTORY_REPLAY", "0") not in ("1", "true", "yes"):
+        return None
+    return TrajectoryStore(
+        os.getenv("TRAJECTORY_STORE_PATH", "trajectories.json"),
+        max_entries=int(os.getenv("TRAJECTORY_MAX_ENTRIES", "200")),
+    )
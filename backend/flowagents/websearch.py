@@ -0,0 +1,21 @@
+from flowagents.base import BaseAgent
+from agents import WebSearchTool
+from agents.result import RunResultBase
+
+# Hosted tool without per-run state, shared by every web search step.
+_web_search = WebSearchTool()
+
+
+class WebSearchAgent(BaseAgent):
+    display_name = "Web Search Assistant"
+
+    def __init__(self, name: str):
+        super().__init__(
+            name=name,
+            instructions="You are a web search agent. Use the web search tool to find up-to-date information and cite the sources you used.",
+            tools=[_web_search],
+        )
+
+    def cache_dependencies(self, result: RunResultBase) -> list[str] | None:
+        # Search results change over time and the cache has no expiry.
+        return None
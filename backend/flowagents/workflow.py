@@ -0,0 +1,420 @@
+"""Dependency-aware execution of an `AgentWorkflow`.
+
+Steps declare the steps they need through `AgentDefinition.depends_on`. A
+step without the field depends on the step listed just before it, so plans
+that don't use it keep running one after another as they always did. Steps
+whose dependencies are satisfied run concurrently, bounded by
+`max_concurrency`, and their output is multiplexed into a single event
+stream tagged with the step name. The stream goes through an
+`EventChannel`, which coalesces deltas and applies backpressure.
+
+A step is only handed the instructions and output of the steps it
+consumes (`AgentDefinition.consumes`, by default all of its direct and
+transitive dependencies), not the whole run so far. When it declares an `input_schema`, consumed
+outputs that are JSON objects are trimmed to the properties the schema
+names.
+
+A step with `for_each` runs in batch mode: the output of the named step is
+split into items (a JSON array, or one per line), and the agent runs once
+per item, concurrently (`BaseAgent.execute_batch`). Each item's result is
+streamed as it completes, and the step's output aggregates them in order.
+
+The run state (`AgentExecutionResult`) is handed to a `checkpoint`
+callback whenever a step starts, completes, fails or is cancelled. Passing
+a saved state back in resumes the run: completed steps are replayed from
+it and only the others run again.
+
+Closing the stream (the client went away) cancels the steps still
+running: their model runs are stopped and the resources they hold are
+released through the agents' `__aexit__`.
+
+An agent can also complete a step without the model (`BaseAgent.replay`:
+computer use replays recorded trajectories).
+
+With a `StepCache`, a step whose type, instructions and input match an
+earlier run is answered from the cache, as a single delta, without
+acquiring its resources or calling the model.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from agents import RunResultStreaming
+from openai.types.responses import ResponseTextDeltaEvent
+
+from flowagents.base import AgentExecutionResult, BaseAgent
+from flowagents.conductor import AgentDefinition, AgentWorkflow
+from flowagents.metrics import STEP_CACHE_REQUESTS, record_cancelled_step
+from flowagents.registry import registry
+from flowagents.step_cache import StepCache
+from flowagents.streaming import EventChannel
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("WORKFLOW_MAX_CONCURRENCY", "4"))
+
+# (agent name, event kind, payload). Kinds are "result" when a step starts,
+# "delta" for streamed text and "end" when a step has completed.
+WorkflowEvent = Tuple[str, str, Optional[str]]
+
+
+class WorkflowError(ValueError):
+    """Raised when a workflow's dependency graph is invalid."""
+
+
+class BatchError(RuntimeError):
+    """Raised when items of a batch step failed; the others are checkpointed."""
+
+
+def resolve_dependencies(workflow: AgentWorkflow) -> Dict[str, List[str]]:
+    """Return the direct dependencies of every step, keyed by step name.
+
+    Raises `WorkflowError` for duplicate names, unknown agent types,
+    unknown dependencies and cycles.
+    """
+    names = [step.name for step in workflow.agents]
+    if len(set(names)) != len(names):
+        raise WorkflowError("Agent names must be unique within a workflow")
+    unknown_types = sorted({step.type for step in workflow.agents if step.type not in registry})
+    if unknown_types:
+        raise WorkflowError(f"Unknown agent types: {unknown_types}")
+
+    dependencies: Dict[str, List[str]] = {}
+    previous: Optional[str] = None
+    for step in workflow.agents:
+        if step.depends_on is None:
+            dependencies[step.name] = [previous] if previous else []
+        else:
+            unknown = [dep for dep in step.depends_on if dep not in names]
+            if unknown:
+                raise WorkflowError(f"Agent {step.name!r} depends on unknown agents: {unknown}")
+            dependencies[step.name] = list(dict.fromkeys(step.depends_on))
+        if step.consumes:
+            unknown = [name for name in step.consumes if name not in names]
+            if unknown:
+                raise WorkflowError(f"Agent {step.name!r} consumes unknown agents: {unknown}")
+            # An output can only be read once it exists.
+            dependencies[step.name] = list(dict.fromkeys(dependencies[step.name] + step.consumes))
+        if step.for_each is not None:
+            if step.for_each not in names:
+                raise WorkflowError(f"Agent {step.name!r} runs for each item of an unknown agent: {step.for_each!r}")
+            dependencies[step.name] = list(dict.fromkeys(dependencies[step.name] + [step.for_each]))
+        previous = step.name
+
+    # Kahn's algorithm; anything left unvisited sits on a cycle.
+    remaining = {name: len(deps) for name, deps in dependencies.items()}
+    ready = [name for name, count in remaining.items() if count == 0]
+    visited = 0
+    while ready:
+        current = ready.pop()
+        visited += 1
+        for name, deps in dependencies.items():
+            if current in deps:
+                remaining[name] -= 1
+                if remaining[name] == 0:
+                    ready.append(name)
+    if visited != len(names):
+        cyclic = [name for name, count in remaining.items() if count > 0]
+        raise WorkflowError(f"Workflow has a dependency cycle between: {cyclic}")
+
+    return dependencies
+
+
+def schema_fields(schema: Optional[str]) -> Optional[List[str]]:
+    """Property names of a serialized JSON Schema, or None if it names none."""
+    if not schema:
+        return None
+    try:
+        properties = json.loads(schema).get("properties")
+    except (ValueError, AttributeError):
+        logger.warning(f"Ignoring invalid input schema: {schema[:80]!r}")
+        return None
+    return list(properties) if isinstance(properties, dict) and properties else None
+
+
+def trim_output(output: Optional[str], fields: Optional[List[str]]) -> Optional[str]:
+    """Keep only `fields` of an output holding a JSON object; leave anything else as is."""
+    if not output or not fields:
+        return output
+    text = output.strip()
+    if text.startswith("```"):
+        # A fenced block, optionally tagged with its language.
+        text = text.split("\n", 1)[-1].rsplit("```", 1)[0]
+    try:
+        value = json.loads(text)
+    except ValueError:
+        return output
+    if not isinstance(value, dict):
+        return output
+    return json.dumps({key: value[key] for key in fields if key in value}, ensure_ascii=False)
+
+
+def parse_items(output: Optional[str]) -> List[str]:
+    """Items listed in a step's output: a JSON array, or one item per line."""
+    text = (output or "").strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[-1].rsplit("```", 1)[0].strip()
+    try:
+        value = json.loads(text)
+    except ValueError:
+        value = None
+    if isinstance(value, dict) and len(value) == 1:
+        # {"expenses": [...]}
+        value = next(iter(value.values()))
+    if isinstance(value, list):
+        return [item if isinstance(item, str) else json.dumps(item, ensure_ascii=False) for item in value]
+    # A plain or markdown list: drop bullets and numbering.
+    lines = (re.sub(r"^\s*(?:[-*+]|\d+[.)])\s+", "", line).strip() for line in text.splitlines())
+    return [line for line in lines if line]
+
+
+class WorkflowExecutor:
+    """Schedule the steps of a workflow as a DAG and stream their output."""
+
+    def __init__(
+        self,
+        workflow: AgentWorkflow,
+        max_concurrency: Optional[int] = None,
+        state: Optional[AgentExecutionResult] = None,
+        checkpoint: Optional[Callable[[AgentExecutionResult], None]] = None,
+        step_cache: Optional[StepCache] = None,
+    ):
+        self.workflow = workflow
+        self.dependencies = resolve_dependencies(workflow)
+        self.max_concurrency = max(1, max_concurrency or DEFAULT_MAX_CONCURRENCY)
+        self.checkpoint = checkpoint
+        self.step_cache = step_cache
+        self.result = state.model_copy(deep=True) if state is not None else AgentExecutionResult()
+        for step in workflow.agents:
+            if self.result.status.get(step.name) != "completed":
+                self.result.status[step.name] = "planned"
+                self.result.response[step.name] = None
+                self.result.input.pop(step.name, None)
+                if step.for_each is None or self.result.status.get(step.for_each) != "completed":
+                    # Items come from an output that will be produced again.
+                    self.result.items.pop(step.name, None)
+
+        self._order = {step.name: index for index, step in enumerate(workflow.agents)}
+        self._done: Dict[str, asyncio.Event] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._queue: Optional[EventChannel] = None
+
+    def ancestors(self, name: str) -> List[str]:
+        """Transitive dependencies of a step, in workflow order."""
+        seen: set[str] = set()
+        stack = list(self.dependencies[name])
+        while stack:
+            current = stack.pop()
+            if current not in seen:
+                seen.add(current)
+                stack.extend(self.dependencies[current])
+        return sorted(seen, key=self._order.__getitem__)
+
+    def consumed(self, name: str) -> List[str]:
+        """Steps whose output is handed to a step, in workflow order.
+
+        Without `consumes`, that's every ancestor, as for plans made before
+        the field existed.
+        """
+        step = self.workflow.agents[self._order[name]]
+        if step.consumes is None:
+            return self.ancestors(name)
+        return sorted(set(step.consumes), key=self._order.__getitem__)
+
+    def build_input(self, step: AgentDefinition, item: Optional[str] = None) -> List[dict]:
+        """Conversation handed to a step: the instructions and output of the steps it consumes.
+
+        For one `item` of a batch step, the list of items is left out and the
+        item is appended to the instructions.
+        """
+        steps = {s.name: s for s in self.workflow.agents}
+        fields = schema_fields(step.input_schema)
+        input: List[dict] = []
+        for name in self.consumed(step.name):
+            if item is not None and name == step.for_each:
+                continue
+            input.append({"role": "user", "content": steps[name].instructions})
+            input.append({"role": "assistant", "content": trim_output(self.result.response[name], fields)})
+        instructions = step.instructions
+        if item is not None:
+            instructions += f"\n\nItem to process:\n{item}"
+        if step.output_schema:
+            instructions += f"\n\nReply with a JSON object matching this JSON schema:\n{step.output_schema}"
+        input.append({"role": "user", "content": instructions})
+        return input
+
+    def completed(self) -> List[str]:
+        """Steps already completed (by an earlier attempt, when resuming)."""
+        return [step.name for step in self.workflow.agents if self.result.status[step.name] == "completed"]
+
+    def save(self) -> None:
+        """Hand the current state to the checkpoint callback, if any."""
+        if self.checkpoint is None:
+            return
+        try:
+            self.checkpoint(self.result)
+        except Exception:
+            logger.exception("Failed to checkpoint the workflow run")
+
+    async def stream(self) -> AsyncIterator[WorkflowEvent]:
+        """Run every step and yield their events as they are produced.
+
+        Steps completed by an earlier attempt are replayed first, as a single
+        delta holding their whole output.
+        """
+        completed = self.completed()
+        self._done = {step.name: asyncio.Event() for step in self.workflow.agents}
+        for name in completed:
+            self._done[name].set()
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._queue = EventChannel()
+
+        tasks = [
+            asyncio.create_task(self._run_step_guarded(step))
+            for step in self.workflow.agents
+            if step.name not in completed
+        ]
+        pending = len(tasks)
+        try:
+            for name in completed:
+                yield name, "result", None
+                yield name, "delta", self.result.response[name]
+                yield name, "end", None
+            while pending:
+                name, kind, payload = await self._queue.get()
+                if kind == "finished":
+                    pending -= 1
+                elif kind == "error":
+                    raise payload  # type: ignore[misc]
+                else:
+                    yield name, kind, payload
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _complete(self, step: AgentDefinition, output: Optional[str]) -> None:
+        self.result.response[step.name] = output
+        self.result.status[step.name] = "completed"
+        self.save()
+
+    async def _run_step_guarded(self, step: AgentDefinition) -> None:
+        try:
+            await self._run_step(step)
+        except asyncio.CancelledError:
+            if self.result.status[step.name] == "running":
+                self.result.status[step.name] = "cancelled"
+                self.save()
+            raise
+        except Exception as exc:
+            logger.exception(f"Agent {step.name!r} failed")
+            self.result.status[step.name] = "failed"
+            self.save()
+            await self._queue.put((step.name, "error", exc))
+        await self._queue.put((step.name, "finished", None))
+
+    async def _run_batch(self, step: AgentDefinition, agent: BaseAgent) -> None:
+        """Run a batch step: one agent per item, each result streamed as it completes.
+
+        Every completed item is checkpointed; when resuming, only the items
+        that didn't complete run again. If any item fails, the step fails
+        once the others are done.
+        """
+        items = parse_items(self.result.response[step.for_each])
+        done = self.result.items.setdefault(step.name, {})
+        pending = [index for index in range(len(items)) if index not in done]
+        logger.info(f"Agent {step.name!r} runs a batch of {len(items)} items ({len(items) - len(pending)} already done)")
+
+        def render(index: int, text: str) -> str:
+            label = (items[index].splitlines() or [""])[0][:80]
+            return f"**{index + 1}/{len(items)}: {label}**\n\n{text}\n\n"
+
+        results: List[str] = [""] * len(items)
+        for index in sorted(i for i in done if i < len(items)):
+            results[index] = render(index, done[index])
+            await self._queue.put((step.name, "delta", results[index]))
+        errors: List[Exception] = []
+        async for position, output, error in agent.execute_batch([self.build_input(step, items[i]) for i in pending]):
+            index = pending[position]
+            if error is None:
+                done[index] = str(output)
+                self.save()
+            else:
+                logger.warning(f"Item {index} of {step.name!r} failed: {error}")
+                errors.append(error)
+            results[index] = render(index, str(output) if error is None else f"Failed: {error}")
+            await self._queue.put((step.name, "delta", results[index]))
+        if errors:
+            raise BatchError(f"{len(errors)} of {len(items)} items of {step.name!r} failed; resume the run to retry them") from errors[0]
+        self._complete(step, "".join(results) or "No items to process.")
+
+    async def _run_step(self, step: AgentDefinition) -> None:
+        for dependency in self.dependencies[step.name]:
+            await self._done[dependency].wait()
+
+        async with self._semaphore:
+            logger.info(f"Agent Name: {step.name}")
+            logger.info(f"Agent Type: {step.type}")
+            logger.info(f"Agent Instructions: {step.instructions}")
+
+            input = self.build_input(step)
+            self.result.status[step.name] = "running"
+            self.result.input[step.name] = input
+            self.save()
+            await self._queue.put((step.name, "result", None))
+
+            agent = registry.create(step.type, step.name)
+            key = cached = None
+            if self.step_cache is not None and not agent.side_effects and step.for_each is None:
+                key = self.step_cache.key(step.type, str(agent.definition.model), step.instructions, input)
+                cached = await self.step_cache.get(key)
+                STEP_CACHE_REQUESTS.labels(step.type, "hit" if cached is not None else "miss").inc()
+
+            if cached is not None:
+                logger.info(f"Agent {step.name!r} served from the step cache ({key[:12]})")
+                await self._queue.put((step.name, "delta", cached))
+                self._complete(step, cached)
+            else:
+                started = time.perf_counter()
+                try:
+                    if step.for_each is not None:
+                        await self._run_batch(step, agent)
+                    else:
+                        # Resources are released by `__aexit__`, cancelled or not.
+                        async with agent:
+                            output = await agent.replay(input)
+                            if output is not None:
+                                await self._queue.put((step.name, "delta", output))
+                                self._complete(step, output)
+                            else:
+                                result: RunResultStreaming = await agent.execute_stream(input)
+                                try:
+                                    async for event in result.stream_events():
+                                        if event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
+                                            await self._queue.put((step.name, "delta", event.data.delta))
+                                except BaseException:
+                                    # The SDK only stops the run by itself when
+                                    # interrupted while waiting for an event.
+                                    result.cancel()
+                                    raise
+
+                                self._complete(step, result.final_output)
+                                if key is not None and isinstance(result.final_output, str):
+                                    paths = agent.cache_dependencies(result)
+                                    if paths is not None:
+                                        await self.step_cache.set(key, result.final_output, paths)
+                except asyncio.CancelledError:
+                    elapsed = time.perf_counter() - started
+                    saved = record_cancelled_step(step.type, agent.resources, elapsed)
+                    logger.info(f"Agent {step.name!r} cancelled after {elapsed:.1f}s (~{saved:.1f}s of work saved)")
+                    raise
+            await self._queue.put((step.name, "end", None))
+
+        self._done[step.name].set()
@@ -0,0 +1,211 @@
+"""Token-budgeted compaction of `/chat` session history.
+
+Sending the whole conversation to the Conductor on every turn makes prompt
+size and latency grow with the length of the session. `HistoryCompactor`
+builds the model input for a turn within a token budget:
+
+* the last `keep_turns` turns (a turn starts at a user message) are kept
+  verbatim, except that bulky tool outputs are replaced by a placeholder;
+* older turns are replaced by a rolling summary, kept by the compactor in
+  its own LRU, apart from the session store: a process that doesn't have
+  it (or lost it) builds it again in the background;
+* reasoning items of turns that left the verbatim window are dropped, with
+  the ids that pair the messages and tool calls of those turns with them.
+
+Summaries are produced off the request path: `refresh()` is meant to run
+as a background task once the response has been sent. Turns that left the
+verbatim window but are not summarised yet are sent (stripped) until the
+summary catches up, so a request never waits for the summariser. When
+they don't fit in the budget, they are dropped instead.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from agents import Agent, Runner
+
+from flowagents.base import run_config
+from flowagents.metrics import record_run
+from flowagents.rate_limit import priority_lane
+
+try:
+    import tiktoken
+
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:  # pragma: no cover – tiktoken is optional
+    _encoding = None
+
+logger = logging.getLogger(__name__)
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "8000"))
+HISTORY_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "4"))
+HISTORY_MAX_TOOL_OUTPUT_CHARS = int(os.getenv("HISTORY_MAX_TOOL_OUTPUT_CHARS", "2000"))
+HISTORY_SUMMARY_MODEL = os.getenv("HISTORY_SUMMARY_MODEL", "gpt-4.1-mini")
+HISTORY_MAX_SUMMARIES = int(os.getenv("HISTORY_MAX_SUMMARIES", "10000"))
+
+_TOOL_OUTPUT_TYPES = {"function_call_output", "computer_call_output", "local_shell_call_output", "mcp_call"}
+
+
+def count_tokens(items: List[dict]) -> int:
+    """Approximate the number of prompt tokens used by a list of input items."""
+    text = json.dumps(items, separators=(",", ":"), default=str)
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return len(text) // 4
+
+
+def turn_starts(items: List[dict]) -> List[int]:
+    """Indexes of the items that start a turn (user messages)."""
+    return [index for index, item in enumerate(items) if item.get("role") == "user"]
+
+
+def strip_tool_output(item: dict, max_chars: int = HISTORY_MAX_TOOL_OUTPUT_CHARS) -> dict:
+    """Replace the payload of a large tool output with a short placeholder.
+
+    The item itself is kept so that every tool call still has its output.
+    """
+    if item.get("type") not in _TOOL_OUTPUT_TYPES:
+        return item
+    output = item.get("output")
+    if not isinstance(output, str) or len(output) <= max_chars:
+        return item
+    return {**item, "output": f"[tool output omitted: {len(output)} characters]"}
+
+
+def drop_reasoning(items: List[dict]) -> List[dict]:
+    """Drop reasoning items, and the ids of the other items.
+
+    Reasoning models (o3, o4-mini) reject a message or tool call whose id
+    belongs to a response item sent without its reasoning item. Without an
+    id, an item stands on its own; tool calls stay paired with their
+    outputs by `call_id`.
+    """
+    return [
+        item if item.get("type") == "item_reference" else {key: value for key, value in item.items() if key != "id"}
+        for item in items
+        if item.get("type") != "reasoning"
+    ]
+
+
+class HistoryCompactor:
+    """Build budgeted model input from a session's history."""
+
+    def __init__(
+        self,
+        token_budget: int = HISTORY_TOKEN_BUDGET,
+        keep_turns: int = HISTORY_KEEP_TURNS,
+        summary_model: str = HISTORY_SUMMARY_MODEL,
+        max_summaries: int = HISTORY_MAX_SUMMARIES,
+    ):
+        self.max_summaries = max_summaries
+        # session_id -> (history items covered, summary)
+        self._summaries: OrderedDict[str, Tuple[int, str]] = OrderedDict()
+        self.token_budget = token_budget
+        self.keep_turns = max(1, keep_turns)
+        self.summarizer = Agent(
+            name="History Summarizer",
+            instructions="You maintain a running summary of a conversation between a user and an assistant that plans and runs teams of agents. "
+            "Given the current summary and the next part of the conversation, return an updated summary. "
+            "Keep the user's goals, decisions, file names, URLs, identifiers and any plan that was agreed on; leave out pleasantries. "
+            "Answer with the summary only.",
+            model=summary_model,
+        )
+        self._refreshing: set[str] = set()
+
+    def load_summary(self, session_id: str, history: List[dict]) -> Tuple[int, Optional[str]]:
+        """Number of history items covered by the cached summary, and the summary."""
+        cached = self._summaries.get(session_id)
+        if cached is None:
+            return 0, None
+        if cached[0] > len(history):
+            # The session was dropped and started again under the same id.
+            del self._summaries[session_id]
+            return 0, None
+        self._summaries.move_to_end(session_id)
+        return cached
+
+    def save_summary(self, session_id: str, covered: int, summary: str) -> None:
+        self._summaries[session_id] = (covered, summary)
+        self._summaries.move_to_end(session_id)
+        while len(self._summaries) > self.max_summaries:
+            self._summaries.popitem(last=False)
+
+    def boundary(self, history: List[dict], keep_turns: int) -> int:
+        """Index of the first item of the last `keep_turns` turns."""
+        starts = turn_starts(history)
+        if len(starts) <= keep_turns:
+            return 0
+        return starts[-keep_turns]
+
+    def compact(self, session_id: str, history: List[dict], new_items: List[dict]) -> List[dict]:
+        """Return the input for the next turn: compacted history plus `new_items`."""
+        if not history:
+            return list(new_items)
+
+        covered, summary = self.load_summary(session_id, history)
+        keep_turns = self.keep_turns
+        truncate = False
+        while True:
+            boundary = self.boundary(history, keep_turns)
+            # Only what the cached summary already covers is left out, until
+            # even a single verbatim turn is over budget: then the turns the
+            # summary doesn't cover yet are dropped too.
+            cut = boundary if truncate else min(boundary, covered) if summary else 0
+            prefix = [{"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"}] if summary and cut else []
+            kept = [strip_tool_output(item) for item in [*drop_reasoning(history[cut:boundary]), *history[boundary:]]]
+            compacted = [*prefix, *kept, *new_items]
+            tokens = count_tokens(compacted)
+            if tokens <= self.token_budget or truncate:
+                break
+            if keep_turns > 1:
+                keep_turns -= 1
+            elif boundary > cut:
+                truncate = True
+            else:
+                break
+
+        if truncate:
+            logger.info(f"Session {session_id}: dropped {boundary - min(boundary, covered)} history items not summarised yet")
+        if tokens > self.token_budget:
+            logger.warning(f"Session {session_id}: compacted input still uses ~{tokens} tokens (budget {self.token_budget})")
+        logger.info(
+            f"Session {session_id}: {len(history)} history items compacted to {len(compacted) - len(new_items)} (~{tokens} tokens)"
+        )
+        return compacted
+
+    async def refresh(self, session_id: str, history: List[dict]) -> None:
+        """Fold turns that left the verbatim window into the rolling summary.
+
+        Runs after the response has been sent; concurrent refreshes of the
+        same session are skipped.
+        """
+        if session_id in self._refreshing:
+            return
+        self._refreshing.add(session_id)
+        try:
+            covered, summary = self.load_summary(session_id, history)
+            boundary = self.boundary(history, self.keep_turns)
+            if boundary <= covered:
+                return
+
+            pending = [strip_tool_output(item, max_chars=500) for item in drop_reasoning(history[covered:boundary])]
+            prompt = (
+                f"Current summary:\n{summary or '(none)'}\n\n"
+                f"Next part of the conversation (JSON):\n{json.dumps(pending, default=str)}"
+            )
+            started = time.perf_counter()
+            with priority_lane("background"):
+                result = await Runner.run(self.summarizer, input=prompt, run_config=run_config())
+            record_run("summarizer", result, started)
+            self.save_summary(session_id, boundary, result.final_output)
+            logger.info(f"Session {session_id}: summary now covers {boundary} history items")
+        except Exception:
+            logger.exception(f"Failed to refresh the history summary of session {session_id}")
+        finally:
+            self._refreshing.discard(session_id)
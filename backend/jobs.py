@@ -0,0 +1,292 @@
+"""Background execution of workflows.
+
+`/run` executes a workflow inside the HTTP response: the run holds the
+connection for its whole duration and dies with it. A job runs the same
+`WorkflowExecutor` on a worker of the `JobManager` instead:
+
+* `submit()` queues a job and returns at once. Jobs are picked up by a
+  fixed number of workers, highest priority first, then in submission
+  order. When `max_queued` jobs are already waiting, new jobs are rejected
+  with `QueueFull`, so the backlog stays bounded;
+* the events a job produces are kept on the job, so clients can attach to
+  its stream at any time, replay it from any offset, and detach without
+  affecting the run. Past `max_events`, the events every attached client
+  has read are compacted to one result, delta and end per step; attaching
+  at an offset inside a compacted delta replays it whole;
+* finished jobs are forgotten after `retention` seconds. Their steps stay
+  in the run checkpoints.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+import time
+from bisect import bisect_left
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from flowagents.metrics import JOBS_QUEUED, JOBS_REJECTED, JOBS_RUNNING, RUNS_CANCELLED
+from flowagents.workflow import WorkflowEvent, WorkflowExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """Raised by `JobManager.submit` when the queue is saturated."""
+
+
+class JobInfo(BaseModel):
+    job_id: str
+    status: str
+    priority: int
+    position: Optional[int] = None
+    events: int
+    error: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    steps: Dict[str, str]
+
+
+class Job:
+    """A workflow run with its recorded event stream."""
+
+    def __init__(self, job_id: str, executor: WorkflowExecutor, priority: int = 0, max_events: int = 20000):
+        self.id = job_id
+        self.executor = executor
+        self.priority = priority
+        # queued -> running -> completed | failed | cancelled
+        self.status = "queued"
+        self.error: Optional[str] = None
+        # (offset, event), by offset. Compaction leaves gaps between offsets.
+        self.events: List[Tuple[int, WorkflowEvent]] = []
+        self.offset = 0
+        self.max_events = max(100, max_events)
+        self._compact_at = self.max_events
+        # Next offset of each attached client.
+        self._followers: Dict[object, int] = {}
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed", "cancelled")
+
+    async def record(self, event: WorkflowEvent) -> None:
+        async with self._changed:
+            self.events.append((self.offset, event))
+            self.offset += 1
+            if len(self.events) > self._compact_at:
+                self._compact()
+            self._changed.notify_all()
+
+    def _compact(self) -> None:
+        """Merge the deltas of each step among the events all followers have read."""
+        horizon = min(self._followers.values(), default=self.offset)
+        end = bisect_left(self.events, horizon, key=lambda entry: entry[0])
+        deltas: Dict[str, Tuple[int, List[str]]] = {}
+        kept: List[Tuple[int, WorkflowEvent]] = []
+        for offset, (name, kind, payload) in self.events[:end]:
+            if kind == "delta":
+                # The merged delta takes the offset of the last one.
+                texts = deltas[name][1] if name in deltas else []
+                texts.append(payload or "")
+                deltas[name] = (offset, texts)
+            else:
+                kept.append((offset, (name, kind, payload)))
+        kept.extend((offset, (name, "delta", "".join(texts))) for name, (offset, texts) in deltas.items())
+        kept.sort(key=lambda entry: entry[0])
+        self.events[:end] = kept
+        # Compacting again before the buffer has grown would mostly redo the same work.
+        self._compact_at = max(self.max_events, 2 * len(self.events))
+
+    async def finish(self, status: str, error: Optional[str] = None) -> None:
+        async with self._changed:
+            self.status = status
+            self.error = error
+            self.finished_at = time.time()
+            self._changed.notify_all()
+
+    async def follow(self, offset: int = 0) -> AsyncIterator[WorkflowEvent]:
+        """Yield the job's events from `offset`, then live ones until it finishes."""
+        token = object()
+        self._followers[token] = offset
+        try:
+            while True:
+                async with self._changed:
+                    if offset >= self.offset:
+                        if self.finished:
+                            return
+                        await self._changed.wait()
+                        continue
+                    # Events past our offset are never compacted, so the copy stays valid.
+                    pending = self.events[bisect_left(self.events, offset, key=lambda entry: entry[0]):]
+                for event_offset, event in pending:
+                    yield event
+                    offset = event_offset + 1
+                    self._followers[token] = offset
+        finally:
+            del self._followers[token]
+            if len(self.events) > self.max_events:
+                # This client may have held back the compaction of a finished job.
+                self._compact()
+
+
+class JobManager:
+    """Bounded pool of workers running queued jobs by priority."""
+
+    def __init__(self, workers: int = 2, max_queued: int = 32, retention: float = 3600, max_events: int = 20000):
+        self.workers = max(1, workers)
+        self.max_queued = max_queued
+        self.max_events = max_events
+        self.retention = retention
+        self.jobs: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._sequence = itertools.count()
+        self._workers: List[asyncio.Task] = []
+
+    @property
+    def queue(self) -> asyncio.PriorityQueue:
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+        return self._queue
+
+    @property
+    def queued(self) -> List[Job]:
+        """Queued jobs, in the order they will run."""
+        return sorted(
+            (job for job in self.jobs.values() if job.status == "queued"),
+            key=lambda job: (-job.priority, job.created_at),
+        )
+
+    @property
+    def running(self) -> int:
+        return sum(1 for job in self.jobs.values() if job.status == "running")
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    async def start(self) -> None:
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+            logger.info(f"Job manager started with {self.workers} worker(s)")
+
+    async def close(self) -> None:
+        """Stop the workers, cancelling running jobs (their checkpoints remain)."""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        for job in self.jobs.values():
+            if not job.finished:
+                await job.finish("cancelled")
+        self._update_gauges()
+
+    # ------------------------------------------------------------------
+    # Jobs
+    # ------------------------------------------------------------------
+
+    def check_capacity(self) -> None:
+        """Raise `QueueFull` when `max_queued` jobs are waiting."""
+        self._purge()
+        if len(self.queued) >= self.max_queued:
+            JOBS_REJECTED.inc()
+            raise QueueFull(f"{self.max_queued} jobs are already queued")
+
+    def submit(self, job_id: str, executor: WorkflowExecutor, priority: int = 0) -> Job:
+        """Queue a job. Raises `QueueFull` when `max_queued` jobs are waiting."""
+        self.check_capacity()
+        job = Job(job_id, executor, priority, self.max_events)
+        self.jobs[job_id] = job
+        self.queue.put_nowait((-priority, next(self._sequence), job))
+        self._update_gauges()
+        logger.info(f"Queued job {job_id} (priority {priority})")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    async def cancel(self, job_id: str) -> Optional[Job]:
+        job = self.jobs.get(job_id)
+        if job is None or job.finished:
+            return job
+        if job.status == "queued":
+            # The worker skips it when it comes out of the queue.
+            await job.finish("cancelled")
+        elif job.task is not None:
+            job.task.cancel()
+            await asyncio.gather(job.task, return_exceptions=True)
+        self._update_gauges()
+        return job
+
+    def info(self, job: Job) -> JobInfo:
+        queued = self.queued
+        return JobInfo(
+            job_id=job.id,
+            status=job.status,
+            priority=job.priority,
+            position=queued.index(job) if job in queued else None,
+            events=job.offset,
+            error=job.error,
+            created_at=job.created_at,
+            started_at=job.started_at,
+            finished_at=job.finished_at,
+            steps=dict(job.executor.result.status),
+        )
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    async def _work(self) -> None:
+        while True:
+            _, _, job = await self.queue.get()
+            if job.status != "queued":
+                continue
+            job.status = "running"
+            job.started_at = time.time()
+            self._update_gauges()
+            job.task = asyncio.create_task(self._run(job))
+            try:
+                await asyncio.shield(job.task)
+            except asyncio.CancelledError:
+                if not job.task.done():
+                    # The worker itself is being stopped.
+                    job.task.cancel()
+                    await asyncio.gather(job.task, return_exceptions=True)
+                    raise
+            finally:
+                self._update_gauges()
+
+    async def _run(self, job: Job) -> None:
+        try:
+            async for event in job.executor.stream():
+                await job.record(event)
+        except asyncio.CancelledError:
+            RUNS_CANCELLED.labels("job").inc()
+            await job.finish("cancelled")
+            logger.info(f"Job {job.id} cancelled")
+            raise
+        except Exception as exc:
+            logger.exception(f"Job {job.id} failed")
+            await job.finish("failed", str(exc))
+        else:
+            await job.finish("completed")
+            logger.info(f"Job {job.id} completed in {job.finished_at - job.started_at:.1f}s")
+
+    def _purge(self) -> None:
+        now = time.time()
+        expired = [job_id for job_id, job in self.jobs.items() if job.finished and now - job.finished_at > self.retention]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    def _update_gauges(self) -> None:
+        JOBS_QUEUED.set(len(self.queued))
+        JOBS_RUNNING.set(self.running)
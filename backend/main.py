@@ -7,32 +7,60 @@ back to the caller as Server-Sent Events.
 
 from __future__ import annotations
 
-from typing import Any, Dict, List
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
 
-from agents import RunResult
-from openai.types.responses import ResponseTextDeltaEvent
+# First, so the report's clock starts with the process.
+from flowagents.startup import startup_report
+
+# Heavy dependencies are imported one at a time, so the startup report shows
+# what each costs. Agent modules (Playwright, MCP...) aren't among them: the
+# registry loads them when a step first needs them, or when prewarmed.
+for _module in ("agents", "fastapi", "prometheus_client", "flowagents.conductor", "flowagents.workflow", "history", "jobs", "run_store", "session_store"):
+    startup_report.import_module(_module)
 
 # Conductor class wraps the Agents SDK.
 # Attempt relative import when running as a package (e.g., `uvicorn backend.main:app`).
 # Fallback to a same-directory import when executing directly.
-from flowagents.base import AgentExecutionResult, BaseAgent
-from flowagents.assistant import AssistantAgent
-from flowagents.computerUse import ComputerUseAgent
-from flowagents.filesystem import FileSystemAgent
-from flowagents.conductor import AgentWorkflow, ConductorAgent, ConductorResponse  # type: ignore
-
-# Single, long-lived instance reused across requests.
-_conductor = ConductorAgent()
-
-from fastapi import FastAPI, HTTPException
+from flowagents.conductor import AgentWorkflow, ConductorAgent, ConductorResponse, PlanResult  # type: ignore
+from flowagents.base import run_config
+from flowagents.metrics import RUNS_CANCELLED
+from flowagents.plan_cache import create_plan_cache
+from flowagents.rate_limit import priority_lane
+from flowagents.registry import registry
+from flowagents.step_cache import create_step_cache
+from flowagents.workflow import WorkflowError, WorkflowEvent, WorkflowExecutor
+from history import HistoryCompactor
+from jobs import JobManager, QueueFull
+from run_store import RunCheckpoint, RunStore, create_run_store
+from session_store import SessionStore, create_session_store
+from singleflight import KeyedLocks, SingleFlight
+
+# Single, long-lived instance reused across requests, built on first use
+# (or by the "conductor" prewarm hook).
+_conductor: Optional[ConductorAgent] = None
+
+
+def conductor() -> ConductorAgent:
+    global _conductor
+    if _conductor is None:
+        with startup_report.measure("init", "conductor"):
+            _conductor = ConductorAgent(plan_cache=create_plan_cache())
+    return _conductor
+
+from fastapi import BackgroundTasks, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from starlette.background import BackgroundTask
 import asyncio
 
 import logging
 import json
+import os
+import time
+import uuid
 
 logging.basicConfig(
     format="%(asctime)s %(levelname)s %(name)s: %(message)s",
@@ -65,27 +93,85 @@ class ChatResponse(BaseModel):
     role: str
     content: Any
 
+async def _prewarm_conductor() -> None:
+    """Build the Conductor and the model client its first plan would create."""
+    agent = conductor().agent
+    run_config().model_provider.get_model(agent.model)
+
+
+def _prewarm_hooks() -> Dict[str, Callable[[], Awaitable[None]]]:
+    """Hooks selectable with STARTUP_PREWARM: "conductor" and one per agent type."""
+    hooks: Dict[str, Callable[[], Awaitable[None]]] = {"conductor": _prewarm_conductor}
+    for type in registry.types:
+        hooks[type] = lambda type=type: registry.prewarm(type)
+    return hooks
+
+
+# Comma-separated hooks run before the worker accepts requests, e.g.
+# "conductor,filesystem,computeruse" or "all". Nothing is prewarmed by
+# default: pools and agent modules start on first use.
+STARTUP_PREWARM = [name.strip() for name in os.getenv("STARTUP_PREWARM", "").split(",") if name.strip()]
+
 app = FastAPI(title="CatGPT Backend")
 @app.on_event("startup")
 async def startup_event():
-    """Log on application startup."""
+    """Log on application startup, run the prewarm hooks and start the job workers."""
     logger.info("Starting CatGPT Backend")
+    hooks = _prewarm_hooks()
+    for name in list(hooks) if STARTUP_PREWARM == ["all"] else STARTUP_PREWARM:
+        if name not in hooks:
+            logger.warning(f"Unknown prewarm hook {name!r}, expected one of {', '.join(hooks)}")
+            continue
+        try:
+            with startup_report.measure("prewarm", name):
+                await hooks[name]()
+        except Exception:
+            # A worker that can't prewarm can still serve; the resource starts on first use.
+            logger.exception(f"Prewarming {name} failed")
+    await jobs.start()
+    startup_report.mark_ready()
+    startup_report.log()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the job workers and the processes kept alive by the loaded agent modules."""
+    await jobs.close()
+    await registry.shutdown()
 
 # ---------------------------------------------------------------------------
-# In-memory session store
+# Session store
 # ---------------------------------------------------------------------------
 # Maps a `session_id` string to the list of messages exchanged so far
-# (excluding the system prompt).
-
-sessions: Dict[str, List[dict[str, str]]] = {}
+# (excluding the system prompt). Bounded in memory by default, or shared
+# between workers through SQLite (see `session_store.py`).
+
+with startup_report.measure("init", "session store"):
+    sessions: SessionStore = create_session_store()
+_compactor = HistoryCompactor()
+
+# Checkpoints of /run workflows, so an interrupted run can be resumed (see
+# `run_store.py`).
+with startup_report.measure("init", "run store"):
+    runs: RunStore = create_run_store()
+# Outputs of workflow steps, reused when a step runs again with the same input.
+with startup_report.measure("init", "step cache"):
+    _step_cache = create_step_cache()
+# Workers running /jobs in the background.
+jobs = JobManager(
+    workers=int(os.getenv("JOB_WORKERS", "2")),
+    max_queued=int(os.getenv("JOB_QUEUE_SIZE", "32")),
+    retention=float(os.getenv("JOB_RETENTION", "3600")),
+    max_events=int(os.getenv("JOB_MAX_EVENTS", "20000")),
+)
 
 # Allow any origin (for demo purposes). In production, restrict this.
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
-    allow_methods=["POST"],
+    allow_methods=["GET", "POST", "DELETE"],
     allow_headers=["*"],
+    expose_headers=["X-Plan-Cache", "X-Run-Id"],
 )
 
 
@@ -94,16 +180,8 @@ app.add_middleware(
 # ---------------------------------------------------------------------------
 
 
-@app.post("/chat")
-async def chat(req: ChatRequest):
-    """Chat endpoint that keeps per-session conversation state in memory.
-
-    The frontend sends only the latest user message together with a
-    `session_id`. The backend looks up the previous history for that session,
-    appends the new user message, forwards everything to OpenAI, streams the
-    assistant's answer back to the client, and finally stores the assistant
-    message in the session history.
-    """
+def _parse_chat(req: ChatRequest) -> tuple[str, dict[str, str]]:
+    """Validate a chat request; return the session id and the user message."""
 
     # Log incoming request
     logger.info(
@@ -126,83 +204,322 @@ async def chat(req: ChatRequest):
 
     if user_message["role"] not in {"user", "assistant"}:
         raise HTTPException(status_code=400, detail="invalid role")
+    return session_id, user_message
+
 
+def _load_input(session_id: str, user_message: dict[str, str]) -> tuple[List[dict], List[dict]]:
+    """Return the stored history of a session and the (compacted) Conductor input for the next turn."""
     # Retrieve the stored history (if any) for this session (no system prompt).
-    history = sessions.get(session_id, [])
+    history = sessions.get(session_id) or []
     logger.debug(f"Session {session_id} history length: {len(history)}")
 
-    # Build input for the agent SDK (history + latest user message).
-    agent_input: List[dict[str, str]] = [*history, user_message]
+    # Build input for the agent SDK (history + latest user message), keeping
+    # recent turns verbatim and older ones summarised within the token budget.
+    agent_input: List[dict] = _compactor.compact(session_id, history, [user_message])
+    return history, agent_input
+
+
+def _persist_turn(session_id: str, history: List[dict], user_message: dict[str, str], plan: PlanResult) -> List[dict]:
+    """Append a planned turn to the session history and store it."""
+    logger.info(f"Accumulating full response for session {session_id} (plan cache {'hit' if plan.cache_hit else 'miss'})")
+
+    # The full history is kept (not the compacted input) so it can be
+    # summarised later.
+    history = [*history, user_message, *plan.new_items]
+    sessions.set(session_id, history)
+    logger.info(
+        f"Persisted {len(history)} messages for session {session_id}"
+    )
+    return history
+
+
+# Turns of a session are applied one at a time, in arrival order, and
+# identical turns in flight (double submits, retries) share one Conductor
+# call (see `singleflight.py`).
+_session_locks = KeyedLocks()
+_turns: SingleFlight[tuple[PlanResult, List[dict]]] = SingleFlight()
+
+
+def _turn_key(session_id: str, user_message: dict[str, str]) -> str:
+    return json.dumps([session_id, user_message["role"], user_message["content"]])
+
+
+async def _chat_turn(
+    session_id: str, user_message: dict[str, str], on_event: Optional[Callable[[str, Any], None]] = None
+) -> tuple[PlanResult, List[dict]]:
+    """Plan one turn of a session and persist it; return the plan and the new history.
+
+    With `on_event`, the plan is streamed and every ("message", str) and
+    ("agent", AgentDefinition) event is passed to it as it arrives.
+    """
+    # A user is waiting for the plan: it gets model budget before workflow steps.
+    async with _session_locks.hold(session_id):
+        with priority_lane("interactive"):
+            history, agent_input = _load_input(session_id, user_message)
+            if on_event is None:
+                # Invoke the Conductor asynchronously (or reuse a cached plan)
+                logger.info(f"Calling Conductor.plan with {len(agent_input)} messages for session {session_id}")
+                plan = await conductor().plan(agent_input)
+            else:
+                logger.info(f"Calling Conductor.plan_stream with {len(agent_input)} messages for session {session_id}")
+                async for kind, value in conductor().plan_stream(agent_input):
+                    if kind == "done":
+                        plan = value
+                    else:
+                        on_event(kind, value)
+            return plan, _persist_turn(session_id, history, user_message, plan)
+
+
+@app.post("/chat")
+async def chat(req: ChatRequest, background_tasks: BackgroundTasks):
+    """Chat endpoint that keeps per-session conversation state.
+
+    The frontend sends only the latest user message together with a
+    `session_id`. The backend looks up the previous history for that session,
+    appends the new user message, forwards everything to OpenAI, returns the
+    assistant's plan to the client, and finally stores the assistant
+    message in the session history.
+    """
+    session_id, user_message = _parse_chat(req)
 
-    # Invoke the Conductor asynchronously
-    logger.info(f"Calling Conductor.run_async with {len(agent_input)} messages for session {session_id}")
     try:
-        result = await _conductor.run_async(agent_input)
+        plan, history = await _turns.do(_turn_key(session_id, user_message), lambda: _chat_turn(session_id, user_message))
     except Exception as exc:  # pragma: no cover – catch any SDK error
         logger.exception("Conductor.run failed")
         raise HTTPException(status_code=500, detail=str(exc)) from exc
 
-    # Accumulate full assistant response
-    logger.info(f"Accumulating full response for session {session_id}")
-    assistant_content: ConductorResponse = result.final_output
-    _workflow = assistant_content.flow
+    assistant_content: ConductorResponse = plan.response
 
-    # After receiving the full response, persist the conversation
-    sessions[session_id] = result.to_input_list()
-    logger.info(
-        f"Persisted {len(sessions[session_id])} messages for session {session_id}"
-    )
+    # Fold turns that left the verbatim window into the summary once the
+    # response has been sent.
+    background_tasks.add_task(_compactor.refresh, session_id, history)
 
     # Return the full assistant message as JSON
-    return JSONResponse(json.loads(assistant_content.model_dump_json()))
+    return JSONResponse(
+        {**json.loads(assistant_content.model_dump_json()), "cache_hit": plan.cache_hit},
+        headers={"X-Plan-Cache": "hit" if plan.cache_hit else "miss"},
+    )
     # return JSONResponse(content = json.loads(ChatResponse(role = "assistant", content = assistant_content).model_dump_json()))
 
-@app.post("/run")
-async def run(workflow: AgentWorkflow):
-    """Run a workflow of agents and stream the results as server-sent events (SSE)."""
-    async def message_stream():
-        agent: BaseAgent = None
-        result: RunResult = None
-        agentExecution: AgentExecutionResult = AgentExecutionResult()
-        for agentStep in workflow.agents:
-            agentExecution.status[agentStep.name] = "planned"
-            agentExecution.response[agentStep.name] = None
-
-        for agentStep in workflow.agents:
-            logger.info(f"Agent Name: {agentStep.name}")
-            logger.info(f"Agent Type: {agentStep.type}")
-            logger.info(f"Agent Instructions: {agentStep.instructions}")
-
-            yield f"::result::{agentStep.name}::<newline>"
-
-            if(agentStep.type == "filesystem"):
-                agent = FileSystemAgent(name = agentStep.name)
-            elif(agentStep.type == "assistant"):
-                agent = AssistantAgent(name = agentStep.name)
-            elif(agentStep.type == "computeruse"):
-                agent = ComputerUseAgent(name = agentStep.name)
-            else:
-                raise ValueError(f"Unknown agent type: {agentStep.type}")
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest):
+    """Streaming variant of /chat that sends the plan while it is generated.
 
-            async with agent:
+    Events use the same framing as /run, each terminated by `<newline>`:
 
-                if(result == None):
-                    input = [{"role": "user", "content": agentStep.instructions}]
-                else:
-                    input.append({"role": "user", "content": agentStep.instructions})
+    * `::message::{json string}` – the friendly message, once complete;
+    * `::agent::{json object}` – each `AgentDefinition`, once complete;
+    * `::done::{json object}` – the full response plus `cache_hit`;
+    * `::error::{text}` – planning failed.
 
-                # logger.info(f"Agent Input: {input}")
-                result = await agent.execute_stream(input)
+    A request joining an identical turn already in flight gets the same
+    events once that turn's plan is complete.
+    """
+    session_id, user_message = _parse_chat(req)
+    events: asyncio.Queue = asyncio.Queue()
+    turn, leader = _turns.join(
+        _turn_key(session_id, user_message),
+        lambda: _chat_turn(session_id, user_message, lambda *event: events.put_nowait(event)),
+    )
+    # Wake up the event loop below when the turn ends, successfully or not.
+    turn.add_done_callback(lambda _: events.put_nowait(None))
+    completed: List[List[dict]] = []
+
+    async def plan_stream():
+        try:
+            if leader:
+                while (event := await events.get()) is not None:
+                    kind, value = event
+                    if kind == "message":
+                        yield f"::message::{json.dumps(value)}<newline>"
+                    else:
+                        yield f"::agent::{value.model_dump_json()}<newline>"
+            plan, history = await asyncio.shield(turn)
+            completed.append(history)
+            if not leader:
+                yield f"::message::{json.dumps(plan.response.message)}<newline>"
+                for step in plan.response.flow.agents:
+                    yield f"::agent::{step.model_dump_json()}<newline>"
+            payload = {**json.loads(plan.response.model_dump_json()), "cache_hit": plan.cache_hit}
+            yield f"::done::{json.dumps(payload)}<newline>"
+        except Exception as exc:  # pragma: no cover – catch any SDK error
+            logger.exception("Conductor.run_streamed failed")
+            yield f"::error::{exc}<newline>"
+
+    async def refresh_summary():
+        if completed:
+            await _compactor.refresh(session_id, completed[0])
+
+    return StreamingResponse(plan_stream(), media_type="text/event-stream", background=BackgroundTask(refresh_summary))
+
+@app.get("/sessions/stats")
+async def sessions_stats():
+    """Counters of the session store (hits, misses, evictions, size)."""
+    return sessions.stats
+
+@app.get("/startup")
+async def startup_stats():
+    """Time spent importing, initialising and prewarming each part of the backend."""
+    return startup_report.summary()
+
+@app.get("/metrics")
+async def metrics():
+    """Agent, pool and browser metrics in the Prometheus text format."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/runs/{run_id}")
+async def run_state(run_id: str):
+    """Latest checkpoint of a workflow run: the workflow and each step's status and output."""
+    checkpoint = runs.get(run_id)
+    if checkpoint is None:
+        raise HTTPException(status_code=404, detail=f"Unknown run: {run_id}")
+    return checkpoint
+
+# Run ids a /run stream is executing. A run id is executed by one stream or
+# job at a time: two executors would overwrite each other's checkpoints.
+_streaming_runs: set[str] = set()
+
+
+def _check_run_free(run_id: str) -> None:
+    """Reject (409) a run id that a /run stream or an unfinished job is already executing."""
+    job = jobs.get(run_id)
+    if run_id in _streaming_runs or (job is not None and not job.finished):
+        raise HTTPException(status_code=409, detail=f"Run {run_id} is already in progress")
+
+
+def _create_executor(workflow: AgentWorkflow, run_id: str, max_concurrency: Optional[int] = None) -> WorkflowExecutor:
+    """Executor for a run, checkpointed under `run_id` and resuming from an earlier checkpoint."""
+    checkpoint = runs.get(run_id)
+    if checkpoint is not None and checkpoint.workflow != workflow:
+        raise HTTPException(status_code=409, detail=f"Run {run_id} was started with a different workflow")
+
+    def save(result):
+        runs.save(RunCheckpoint(run_id=run_id, workflow=workflow, result=result))
+
+    try:
+        executor = WorkflowExecutor(
+            workflow,
+            max_concurrency=max_concurrency,
+            state=checkpoint.result if checkpoint is not None else None,
+            checkpoint=save,
+            step_cache=_step_cache,
+        )
+    except WorkflowError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    if checkpoint is not None:
+        logger.info(f"Resuming run {run_id}: {len(executor.completed())}/{len(workflow.agents)} steps already completed")
+    executor.save()
+    return executor
+
+
+async def _render_events(events: AsyncIterator[WorkflowEvent]) -> AsyncIterator[str]:
+    """Frame workflow events for the /run protocol.
+
+    A `::result::{name}::` header is emitted whenever the stream switches to
+    another agent, then the agent's text deltas, and `::end::` once it
+    completes.
+    """
+    current: Optional[str] = None
+    async for name, kind, payload in events:
+        if name != current:
+            yield f"::result::{name}::<newline>"
+            current = name
+        if kind == "delta":
+            yield f"{payload}<newline>"
+        elif kind == "end":
+            yield f"::end::<newline>"
 
-                async for event in result.stream_events():
-                    if event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
-                        yield f"{event.data.delta}<newline>"
-                        await asyncio.sleep(0.2)
 
-                yield f"::end::<newline>"
+@app.post("/run")
+async def run(workflow: AgentWorkflow, max_concurrency: Optional[int] = None, run_id: Optional[str] = None):
+    """Run a workflow of agents and stream the results as server-sent events (SSE).
 
-                input.append({"role": "assistant", "content": result.final_output})
-                await asyncio.sleep(3)
+    Independent steps run concurrently (up to `max_concurrency` at a time).
+    Their output is multiplexed on a single stream: a `::result::{name}::`
+    header is emitted whenever the stream switches to another agent.
 
+    The run is checkpointed after every step under the id returned in the
+    `X-Run-Id` header. Posting the same workflow again with `run_id` resumes
+    it: completed steps are replayed and the others run again.
+    """
+    run_id = run_id or uuid.uuid4().hex
+    _check_run_free(run_id)
+    executor = _create_executor(workflow, run_id, max_concurrency)
+    _streaming_runs.add(run_id)
 
-    return StreamingResponse(message_stream(), media_type="text/event-stream")
+    async def message_stream():
+        started = time.perf_counter()
+        try:
+            async for chunk in _render_events(executor.stream()):
+                yield chunk
+        except (asyncio.CancelledError, GeneratorExit):
+            # The client disconnected (Starlette cancels the response, or the
+            # stream is closed): the executor stops the steps still running.
+            RUNS_CANCELLED.labels("disconnect").inc()
+            logger.info(f"Run {run_id} cancelled after {time.perf_counter() - started:.1f}s: client disconnected")
+            raise
+        except Exception as exc:
+            # The failed step is checkpointed; the client can resume the run.
+            logger.exception(f"Run {run_id} failed")
+            yield f"::error::{exc}<newline>"
+        finally:
+            _streaming_runs.discard(run_id)
+
+    return StreamingResponse(message_stream(), media_type="text/event-stream", headers={"X-Run-Id": run_id})
+
+# ---------------------------------------------------------------------------
+# Background jobs
+# ---------------------------------------------------------------------------
+# Workflows can also run detached from any connection, on a bounded pool of
+# workers (see `jobs.py`). A job id is also its run id.
+
+@app.post("/jobs", status_code=202)
+async def submit_job(workflow: AgentWorkflow, priority: int = 0, max_concurrency: Optional[int] = None, run_id: Optional[str] = None):
+    """Queue a workflow; higher priorities run first. Answers 429 when the queue is full."""
+    job_id = run_id or uuid.uuid4().hex
+    _check_run_free(job_id)
+    try:
+        # Before the executor saves its first checkpoint, so a rejected job leaves none behind.
+        jobs.check_capacity()
+    except QueueFull as exc:
+        raise HTTPException(status_code=429, detail=str(exc), headers={"Retry-After": "30"}) from exc
+    executor = _create_executor(workflow, job_id, max_concurrency)
+    job = jobs.submit(job_id, executor, priority)
+    return jobs.info(job)
+
+@app.get("/jobs/{job_id}")
+async def job_info(job_id: str):
+    """Status of a job, its position in the queue and the status of each step."""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return jobs.info(job)
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, offset: int = 0):
+    """Attach to a job's event stream (same framing as /run), from event `offset`.
+
+    Disconnecting only detaches: the job keeps running. A job that fails
+    ends its stream with `::error::{text}`.
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+
+    async def message_stream():
+        async for chunk in _render_events(job.follow(max(0, offset))):
+            yield chunk
+        if job.status == "failed":
+            yield f"::error::{job.error}<newline>"
+        elif job.status == "cancelled":
+            yield f"::error::Job {job_id} was cancelled<newline>"
+
+    return StreamingResponse(message_stream(), media_type="text/event-stream", headers={"X-Run-Id": job_id})
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job. Completed steps stay checkpointed."""
+    job = await jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return jobs.info(job)
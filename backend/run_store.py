@@ -0,0 +1,167 @@
+"""Checkpoints of `/run` workflow runs.
+
+A workflow can take minutes, and its computeruse steps are slow and not
+free to repeat. `WorkflowExecutor` reports its `AgentExecutionResult` after
+every state change; `RunStore` keeps it, with the workflow itself, under a
+run id. When `/run` is called again with that id, completed steps are
+replayed from the checkpoint and only the remaining ones run.
+
+Two backends, selected with `RUN_STORE=memory|sqlite`:
+
+* `InMemoryRunStore` – a per-process LRU bounded by number of runs, with a
+  time-to-live;
+* `SQLiteRunStore` – a local SQLite database in WAL mode, so checkpoints
+  survive restarts and are shared by the workers of a host.
+
+Checkpoints are stored as zlib-compressed JSON.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from pydantic import BaseModel
+
+from flowagents.base import AgentExecutionResult
+from flowagents.conductor import AgentWorkflow
+
+logger = logging.getLogger(__name__)
+
+
+class RunCheckpoint(BaseModel):
+    run_id: str
+    workflow: AgentWorkflow
+    result: AgentExecutionResult
+
+
+def encode_checkpoint(checkpoint: RunCheckpoint) -> bytes:
+    return zlib.compress(checkpoint.model_dump_json().encode("utf-8"))
+
+
+def decode_checkpoint(blob: bytes) -> RunCheckpoint:
+    return RunCheckpoint.model_validate_json(zlib.decompress(blob))
+
+
+class RunStore(ABC):
+    """Maps a run id to the latest checkpoint of that run."""
+
+    @abstractmethod
+    def get(self, run_id: str) -> Optional[RunCheckpoint]:
+        """Return the checkpoint of a run, or `None` if unknown or expired."""
+
+    @abstractmethod
+    def save(self, checkpoint: RunCheckpoint) -> None:
+        """Replace the checkpoint of `checkpoint.run_id`."""
+
+    @abstractmethod
+    def delete(self, run_id: str) -> None:
+        """Forget a run."""
+
+
+class InMemoryRunStore(RunStore):
+    """LRU + TTL store living in the current process."""
+
+    def __init__(self, max_entries: int = 10_000, ttl: float = 24 * 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # run_id -> (compressed checkpoint, expiry timestamp)
+        self._entries: OrderedDict[str, Tuple[bytes, float]] = OrderedDict()
+
+    def get(self, run_id: str) -> Optional[RunCheckpoint]:
+        entry = self._entries.get(run_id)
+        if entry is None:
+            return None
+        blob, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[run_id]
+            return None
+        self._entries.move_to_end(run_id)
+        return decode_checkpoint(blob)
+
+    def save(self, checkpoint: RunCheckpoint) -> None:
+        self._entries.pop(checkpoint.run_id, None)
+        self._entries[checkpoint.run_id] = (encode_checkpoint(checkpoint), time.monotonic() + self.ttl)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def delete(self, run_id: str) -> None:
+        self._entries.pop(run_id, None)
+
+
+class SQLiteRunStore(RunStore):
+    """Store backed by a local SQLite database, shareable between workers.
+
+    Expired rows are ignored on read and purged, together with the least
+    recently updated rows above `max_entries`, every `purge_every` writes.
+    """
+
+    def __init__(self, path: str, max_entries: int = 100_000, ttl: float = 24 * 3600, purge_every: int = 100):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.purge_every = purge_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            " run_id TEXT PRIMARY KEY,"
+            " checkpoint BLOB NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS runs_updated_at ON runs (updated_at)")
+
+    def get(self, run_id: str) -> Optional[RunCheckpoint]:
+        with self._lock:
+            row = self._conn.execute("SELECT checkpoint, updated_at FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        if row is None or row[1] + self.ttl <= time.time():
+            return None
+        return decode_checkpoint(row[0])
+
+    def save(self, checkpoint: RunCheckpoint) -> None:
+        blob = encode_checkpoint(checkpoint)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO runs (run_id, checkpoint, updated_at) VALUES (?, ?, ?)"
+                " ON CONFLICT(run_id) DO UPDATE SET checkpoint = excluded.checkpoint, updated_at = excluded.updated_at",
+                (checkpoint.run_id, blob, time.time()),
+            )
+            self._writes += 1
+            if self._writes % self.purge_every == 0:
+                self._purge()
+
+    def delete(self, run_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+
+    def _purge(self) -> None:
+        expired = self._conn.execute("DELETE FROM runs WHERE updated_at <= ?", (time.time() - self.ttl,)).rowcount
+        overflow = self._conn.execute(
+            "DELETE FROM runs WHERE run_id IN (SELECT run_id FROM runs ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        ).rowcount
+        if expired or overflow:
+            logger.info(f"Purged {expired} expired and {overflow} least recently updated run checkpoint(s)")
+
+
+def create_run_store() -> RunStore:
+    """Build the run checkpoint store configured through the environment."""
+    backend = os.getenv("RUN_STORE", "memory").lower()
+    ttl = float(os.getenv("RUN_TTL", str(24 * 3600)))
+    if backend == "sqlite":
+        path = os.getenv("RUN_STORE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "runs.db"))
+        return SQLiteRunStore(path, max_entries=int(os.getenv("RUN_MAX_ENTRIES", "100000")), ttl=ttl)
+    elif backend == "memory":
+        return InMemoryRunStore(max_entries=int(os.getenv("RUN_MAX_ENTRIES", "10000")), ttl=ttl)
+    else:
+        raise ValueError(f"Unknown run store: {backend}")
@@ -0,0 +1,218 @@
+"""Storage for per-session conversation history.
+
+`/chat` keeps the `to_input_list()` of every session so the next turn has
+the full context. Two interchangeable backends are provided:
+
+* `InMemorySessionStore` – a per-process LRU bounded by number of entries
+  and total size, with a time-to-live;
+* `SQLiteSessionStore` – a local SQLite database in WAL mode, which several
+  uvicorn workers on the same host can share.
+
+Histories are stored as zlib-compressed compact JSON in both. Pick one with
+`SESSION_STORE=memory|sqlite` (see `create_session_store`).
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStoreStats(BaseModel):
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    entries: int = 0
+    bytes: int = 0
+
+
+def encode_history(history: List[dict]) -> bytes:
+    return zlib.compress(json.dumps(history, separators=(",", ":"), default=str).encode("utf-8"))
+
+
+def decode_history(blob: bytes) -> List[dict]:
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+class SessionStore(ABC):
+    """Maps a `session_id` to the list of messages exchanged so far."""
+
+    def __init__(self):
+        self._stats = SessionStoreStats()
+
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[List[dict]]:
+        """Return the history of a session, or `None` if unknown or expired."""
+
+    @abstractmethod
+    def set(self, session_id: str, history: List[dict]) -> None:
+        """Replace the history of a session."""
+
+    @abstractmethod
+    def delete(self, session_id: str) -> None:
+        """Forget a session."""
+
+    @property
+    def stats(self) -> SessionStoreStats:
+        return self._stats
+
+
+class InMemorySessionStore(SessionStore):
+    """LRU + TTL store living in the current process."""
+
+    def __init__(self, max_entries: int = 10_000, max_bytes: int = 256 * 1024 * 1024, ttl: float = 24 * 3600):
+        super().__init__()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # session_id -> (compressed history, expiry timestamp)
+        self._entries: OrderedDict[str, Tuple[bytes, float]] = OrderedDict()
+        self._bytes = 0
+
+    def get(self, session_id: str) -> Optional[List[dict]]:
+        entry = self._entries.get(session_id)
+        if entry is None:
+            self._stats.misses += 1
+            return None
+        blob, expires_at = entry
+        if expires_at <= time.monotonic():
+            self._remove(session_id)
+            self._stats.evictions += 1
+            self._stats.misses += 1
+            return None
+        self._entries.move_to_end(session_id)
+        self._stats.hits += 1
+        return decode_history(blob)
+
+    def set(self, session_id: str, history: List[dict]) -> None:
+        blob = encode_history(history)
+        self._remove(session_id)
+        self._entries[session_id] = (blob, time.monotonic() + self.ttl)
+        self._bytes += len(blob)
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            oldest = next(iter(self._entries))
+            if oldest == session_id and len(self._entries) == 1:
+                break
+            self._remove(oldest)
+            self._stats.evictions += 1
+        self._update_size()
+
+    def delete(self, session_id: str) -> None:
+        self._remove(session_id)
+        self._update_size()
+
+    def _remove(self, session_id: str) -> None:
+        entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            self._bytes -= len(entry[0])
+
+    def _update_size(self) -> None:
+        self._stats.entries = len(self._entries)
+        self._stats.bytes = self._bytes
+
+
+class SQLiteSessionStore(SessionStore):
+    """Store backed by a local SQLite database, shareable between workers.
+
+    Expired rows are ignored on read and purged, together with the least
+    recently used rows above `max_entries`, every `purge_every` writes.
+    The hit/miss/eviction counters are per process.
+    """
+
+    def __init__(self, path: str, max_entries: int = 100_000, ttl: float = 24 * 3600, purge_every: int = 100):
+        super().__init__()
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.purge_every = purge_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " session_id TEXT PRIMARY KEY,"
+            " history BLOB NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_accessed_at ON sessions (accessed_at)")
+
+    def get(self, session_id: str) -> Optional[List[dict]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT history, accessed_at FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None or row[1] + self.ttl <= now:
+                self._stats.misses += 1
+                return None
+            self._conn.execute("UPDATE sessions SET accessed_at = ? WHERE session_id = ?", (now, session_id))
+        self._stats.hits += 1
+        return decode_history(row[0])
+
+    def set(self, session_id: str, history: List[dict]) -> None:
+        blob = encode_history(history)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sessions (session_id, history, accessed_at) VALUES (?, ?, ?)"
+                " ON CONFLICT(session_id) DO UPDATE SET history = excluded.history, accessed_at = excluded.accessed_at",
+                (session_id, blob, time.time()),
+            )
+            self._writes += 1
+            if self._writes % self.purge_every == 0:
+                self._purge()
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    @property
+    def stats(self) -> SessionStoreStats:
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(history)), 0) FROM sessions"
+            ).fetchone()
+        self._stats.entries = entries
+        self._stats.bytes = size
+        return self._stats
+
+    def _purge(self) -> None:
+        expired = self._conn.execute("DELETE FROM sessions WHERE accessed_at <= ?", (time.time() - self.ttl,)).rowcount
+        overflow = self._conn.execute(
+            "DELETE FROM sessions WHERE session_id IN ("
+            " SELECT session_id FROM sessions ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        ).rowcount
+        if expired or overflow:
+            self._stats.evictions += expired + overflow
+            logger.info(f"Evicted {expired} expired and {overflow} least recently used session(s)")
+
+
+def create_session_store() -> SessionStore:
+    """Build the session store configured through the environment."""
+    backend = os.getenv("SESSION_STORE", "memory").lower()
+    ttl = float(os.getenv("SESSION_TTL", str(24 * 3600)))
+    if backend == "sqlite":
+        path = os.getenv("SESSION_STORE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "sessions.db"))
+        return SQLiteSessionStore(path, max_entries=int(os.getenv("SESSION_MAX_ENTRIES", "100000")), ttl=ttl)
+    elif backend == "memory":
+        return InMemorySessionStore(
+            max_entries=int(os.getenv("SESSION_MAX_ENTRIES", "10000")),
+            max_bytes=int(os.getenv("SESSION_MAX_BYTES", str(256 * 1024 * 1024))),
+            ttl=ttl,
+        )
+    else:
+        raise ValueError(f"Unknown session store: {backend}")
@@ -0,0 +1,88 @@
+"""Serialization and de-duplication of concurrent requests.
+
+`/chat` reads a session's history, plans, and writes the history back. Two
+concurrent turns of one session would both read the same history, both pay
+for a Conductor call, and the last write would win. Two helpers prevent
+that:
+
+* `KeyedLocks` – one FIFO `asyncio.Lock` per key (the session id), created
+  on demand and dropped once nobody holds or waits for it;
+* `SingleFlight` – identical in-flight calls (double submits, client
+  retries) share one execution. The call runs in its own task, so a caller
+  going away doesn't cancel it for the others.
+
+Both are per process: with several workers, route a session to one worker
+(sticky sessions) to keep its turns ordered.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, Generic, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class KeyedLocks:
+    """Lazily created per-key locks, released when unused."""
+
+    def __init__(self):
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._users: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def hold(self, key: str) -> AsyncIterator[None]:
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._users[key] = self._users.get(key, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._users[key] -= 1
+            if not self._users[key]:
+                del self._users[key]
+                del self._locks[key]
+
+
+class SingleFlight(Generic[T]):
+    """Coalesce concurrent calls with the same key into one execution."""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+        self.coalesced = 0
+
+    def join(self, key: str, fn: Callable[[], Awaitable[T]]) -> Tuple["asyncio.Task[T]", bool]:
+        """Return the in-flight call for `key`, starting `fn()` if there is none.
+
+        The boolean tells whether this caller started the call. Await the
+        task through `asyncio.shield` so cancelling one caller leaves it
+        running for the others.
+        """
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+            logger.info(f"Joining in-flight call {key[:40]!r}")
+            return task, False
+
+        task = asyncio.ensure_future(fn())
+        self._calls[key] = task
+
+        def done(task: asyncio.Task) -> None:
+            self._calls.pop(key, None)
+            # Nobody may be left to await a failed call; don't warn about it.
+            if not task.cancelled():
+                task.exception()
+
+        task.add_done_callback(done)
+        return task, True
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        task, _ = self.join(key, fn)
+        return await asyncio.shield(task)
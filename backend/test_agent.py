@@ -2,11 +2,11 @@ import asyncio
 
 from agents import RunResult, trace
 
-from flowagents.computerUse import ComputerUseAgent
+from flowagents.computerUse import browser_pool
 from flowagents.base import BaseAgent
 from flowagents.conductor import AgentWorkflow, ConductorAgent
-from flowagents.assistant import AssistantAgent
-from flowagents.filesystem import FileSystemAgent
+from flowagents.filesystem import filesystem_pool
+from flowagents.registry import registry
 
 import logging
 
@@ -50,14 +50,7 @@ async def main():
             logger.info(f"Agent Type: {agentStep.type}")
             logger.info(f"Agent Instructions: {agentStep.instructions}")
 
-            if(agentStep.type == "filesystem"):
-                agent = FileSystemAgent(name = agentStep.name)
-            elif(agentStep.type == "assistant"):
-                agent = AssistantAgent(name = agentStep.name)
-            elif(agentStep.type == "computeruse"):
-                agent = ComputerUseAgent(name = agentStep.name)
-            else:
-                raise ValueError(f"Unknown agent type: {agentStep.type}")
+            agent = registry.create(agentStep.type, agentStep.name)
 
             async with agent:
 
@@ -73,5 +66,9 @@ async def main():
 
             logger.info(f"*******************************************************")
 
+        await filesystem_pool.close()
+        if browser_pool is not None:
+            await browser_pool.close()
+
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -1,36 +1,19 @@
 import { useEffect, useRef, useState, useId } from "react";
 import ReactMarkdown from "react-markdown";
-import { Message, chat, FlowResponse, run, FlowExecutionResult } from "./api";
+import { Message, chatStream, FlowResponse, run, FlowExecutionResult, TYPEWRITER_MS } from "./api";
 
-// Renderer for a linear flow of agents
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms));
+
+// Renderer for a flow of agents. Steps appear as the plan streams in.
 function FlowRenderer({ flow, result }: { flow: FlowResponse | null , result: FlowExecutionResult | null }) {
   const uniquePrefix = useId();
-  const [visibleSteps, setVisibleSteps] = useState(0);
-
-  useEffect(() => {
-    if (!flow || !flow.agents.length) {
-      setVisibleSteps(0);
-      return;
-    }
-    setVisibleSteps(1);
-    let step = 1;
-    const interval = setInterval(() => {
-      step++;
-      if (step > flow.agents.length) {
-        clearInterval(interval);
-      } else {
-        setVisibleSteps(step);
-      }
-    }, 1000);
-    return () => clearInterval(interval);
-  }, [flow]);
 
   return (
     <div
       className="flow-cards overflow-auto"
       id={`flowCards-${uniquePrefix}`}
     >
-      {flow && flow.agents.slice(0, visibleSteps).map((agent, idx) => (
+      {flow && flow.agents.map((agent, idx) => (
         <div key={idx} className="card mb-3">
           <div className="card-header d-flex align-items-center">
             <span className="fw-bold">{agent.name}</span>
@@ -45,6 +28,8 @@ function FlowRenderer({ flow, result }: { flow: FlowResponse | null , result: Fl
                   ? "bg-secondary"
                   : result.status[agent.name] === "running"
                   ? "bg-warning text-dark"
+                  : result.status[agent.name] === "failed"
+                  ? "bg-danger"
                   : "bg-light text-dark"
               }`}
             >
@@ -166,11 +151,14 @@ export function ChatMessagesPanel({ messages, loading, input, setInput, send }:
 export default function Chat({ sessionId, messages, setMessages }: ChatProps) {
   const [input, setInput] = useState("");
   const [loading, setLoading] = useState(false);
+  const [planning, setPlanning] = useState(false);
   const [flow, setFlow] = useState<FlowResponse | null>(null);
   const [executionResults, setExecutionResults] = useState<FlowExecutionResult | null>(null);
 
   // --- Run button state ---
   const [isRunning, setIsRunning] = useState(false);
+  // Id of the last run that didn't complete; running again resumes it.
+  const [runId, setRunId] = useState<string | null>(null);
 
   async function handleRun() {
     if(flow) {
@@ -186,70 +174,95 @@ export default function Chat({ sessionId, messages, setMessages }: ChatProps) {
         status: { ...currentStatus }
       });
 
-      const response = await run(flow);
-      if (!response.body) {
-        setIsRunning(false);
-        return;
-      }
-      const reader = response.body.getReader();
-      const decoder = new TextDecoder();
-      let buffer = "";
       let currentAgent: string | null = null;
-      while (true) {
-        const { value, done } = await reader.read();
-        if (done) {
-          if(currentAgent) {
-            currentStatus[currentAgent] = "completed";
-            setExecutionResults({
-              response: { ...currentResult },
-              status: { ...currentStatus }
-            });
-          }
-          break;
+      try {
+        const response = await run(flow, runId);
+        if (!response.body) {
+          return;
         }
-        buffer += decoder.decode(value, { stream: true });
-        let eventBoundary = buffer.indexOf("<newline>");
-        while (eventBoundary !== -1) {
-          const eventStr = buffer.slice(0, eventBoundary);
-          buffer = buffer.slice(eventBoundary + "<newline>".length);
-          const dataStr = eventStr;
-          // Custom streaming format: ::result::, {agentName}::, then data
-          if (dataStr.startsWith("::result::")) {
-            // New result for an agent
-            const rest = dataStr.slice("::result::".length);
-            const agentSepIdx = rest.indexOf("::");
-            if (agentSepIdx !== -1) {
-              currentAgent = rest.slice(0, agentSepIdx);
-              // Start new result for this agent
-              if (!(currentAgent in currentResult)) {
-                currentResult[currentAgent] = "";
-                currentStatus[currentAgent] = "running";
-                setExecutionResults({
-                  response: { ...currentResult },
-                  status: { ...currentStatus }
-                });
-              }
-            }
-          } else if (dataStr.startsWith("::end::")) {
-            if(currentAgent) {
+        setRunId(response.headers.get("X-Run-Id"));
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+        while (true) {
+          const { value, done } = await reader.read();
+          if (done) {
+            if(currentAgent && currentStatus[currentAgent] === "running") {
               currentStatus[currentAgent] = "completed";
               setExecutionResults({
                 response: { ...currentResult },
                 status: { ...currentStatus }
               });
             }
-          } else if (currentAgent) {
-            // Append streamed data to the current agent's result
-            currentResult[currentAgent] = (currentResult[currentAgent] || "") + dataStr;
-            setExecutionResults({
-              response: { ...currentResult },
-              status: { ...currentStatus }
-            });
+            break;
+          }
+          buffer += decoder.decode(value, { stream: true });
+          let eventBoundary = buffer.indexOf("<newline>");
+          while (eventBoundary !== -1) {
+            const eventStr = buffer.slice(0, eventBoundary);
+            buffer = buffer.slice(eventBoundary + "<newline>".length);
+            const dataStr = eventStr;
+            // Custom streaming format: ::result::, {agentName}::, then data
+            if (dataStr.startsWith("::result::")) {
+              // New result for an agent
+              const rest = dataStr.slice("::result::".length);
+              const agentSepIdx = rest.indexOf("::");
+              if (agentSepIdx !== -1) {
+                currentAgent = rest.slice(0, agentSepIdx);
+                // Start new result for this agent
+                if (!(currentAgent in currentResult)) {
+                  currentResult[currentAgent] = "";
+                  currentStatus[currentAgent] = "running";
+                  setExecutionResults({
+                    response: { ...currentResult },
+                    status: { ...currentStatus }
+                  });
+                }
+              }
+            } else if (dataStr.startsWith("::error::")) {
+              // A step failed: the run stopped and can be resumed.
+              Object.keys(currentStatus).forEach(name => {
+                if (currentStatus[name] === "running") {
+                  currentStatus[name] = "failed";
+                }
+              });
+              setExecutionResults({
+                response: { ...currentResult },
+                status: { ...currentStatus }
+              });
+            } else if (dataStr.startsWith("::end::")) {
+              if(currentAgent) {
+                currentStatus[currentAgent] = "completed";
+                setExecutionResults({
+                  response: { ...currentResult },
+                  status: { ...currentStatus }
+                });
+              }
+            } else if (currentAgent) {
+              // Append streamed data to the current agent's result, optionally
+              // revealing it word by word when typewriter pacing is enabled.
+              const pieces = TYPEWRITER_MS > 0 ? dataStr.split(/(?<=\s)/) : [dataStr];
+              for (const piece of pieces) {
+                currentResult[currentAgent] = (currentResult[currentAgent] || "") + piece;
+                setExecutionResults({
+                  response: { ...currentResult },
+                  status: { ...currentStatus }
+                });
+                if (TYPEWRITER_MS > 0) {
+                  await sleep(TYPEWRITER_MS);
+                }
+              }
+            }
+            eventBoundary = buffer.indexOf("<newline>");
           }
-          eventBoundary = buffer.indexOf("<newline>");
         }
+        // Start over next time once every step completed.
+        if (Object.values(currentStatus).every(status => status === "completed")) {
+          setRunId(null);
+        }
+      } finally {
+        setIsRunning(false);
       }
-      setIsRunning(false);
     }
   }
 
@@ -263,8 +276,26 @@ export default function Chat({ sessionId, messages, setMessages }: ChatProps) {
     setInput("");
 
     setLoading(true);
+    setPlanning(true);
+    setFlow({ agents: [] });
+    setExecutionResults(null);
+    setRunId(null);
     try {
-      const chatResponse = await chat(sessionId, userMessage);
+      const streamedAgents: FlowResponse["agents"] = [];
+      const chatResponse = await chatStream(
+        sessionId,
+        userMessage,
+        (message) => {
+          // Show the assistant message as soon as it is complete
+          setMessages([...messages, userMessage, { role: "assistant", content: message }]);
+          setLoading(false);
+        },
+        (agent) => {
+          // Render each step of the plan while the rest is being generated
+          streamedAgents.push(agent);
+          setFlow({ agents: [...streamedAgents] });
+        }
+      );
       setFlow(chatResponse.flow);
       // Append assistant message to the messages array
       const assistantMessage: Message = { role: "assistant", content: chatResponse.message };
@@ -273,6 +304,7 @@ export default function Chat({ sessionId, messages, setMessages }: ChatProps) {
       console.error(err);
     } finally {
       setLoading(false);
+      setPlanning(false);
     }
   }
 
@@ -280,9 +312,9 @@ export default function Chat({ sessionId, messages, setMessages }: ChatProps) {
     <div className="container-fluid chat d-flex flex-column flex-grow-1 vh-100">
       <div className="row flex-grow-1 overflow-hidden">
         <div className="col-8 pe-2">
-          {flow && (
+          {flow && flow.agents.length > 0 && (
             <div className="run-section mt-3 mb-3">
-              <button className="btn btn-success" onClick={handleRun} disabled={isRunning}>
+              <button className="btn btn-success" onClick={handleRun} disabled={isRunning || planning}>
                 {isRunning ? "Running..." : "Run"}
               </button>
             </div>
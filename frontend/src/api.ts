@@ -1,6 +1,12 @@
 const BASE_URL =
   import.meta.env.VITE_API_URL ?? "http://localhost:8000";
 
+/**
+ * Optional "typewriter" pacing for streamed agent output, in milliseconds
+ * per word. The backend forwards text as fast as it is read; 0 disables it.
+ */
+export const TYPEWRITER_MS = Number(import.meta.env.VITE_TYPEWRITER_MS ?? 0);
+
 /**
  * JSON Schema definition (input/output schema)
  */
@@ -15,8 +21,11 @@ export interface Agent {
   name: string;
   type: string;
   instructions: string;
-  input_schema: string;
-  output_schema: string;
+  input_schema?: string | null;
+  output_schema?: string | null;
+  depends_on?: string[] | null;
+  consumes?: string[] | null;
+  for_each?: string | null;
 }
 
 /**
@@ -45,6 +54,7 @@ export interface Message {
 export interface ChatResponse {
   message: string;
   flow: FlowResponse;
+  cache_hit?: boolean;
 }
 
 /**
@@ -68,11 +78,61 @@ export async function chat(
   return data as ChatResponse;
 }
 
+/**
+ * Send a chat message to /chat/stream and report the plan while the
+ * Conductor is still writing it: `onMessage` receives the friendly message
+ * and `onAgent` each agent of the flow as soon as they are complete.
+ * Resolves with the full response.
+ */
+export async function chatStream(
+  sessionId: string,
+  message: Message,
+  onMessage: (message: string) => void,
+  onAgent: (agent: Agent) => void
+): Promise<ChatResponse> {
+  const res = await fetch(`${BASE_URL}/chat/stream`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ session_id: sessionId, message }),
+  });
+  if (!res.ok || !res.body) {
+    throw new Error(`Unexpected response ${res.status}`);
+  }
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) {
+      break;
+    }
+    buffer += decoder.decode(value, { stream: true });
+    let eventBoundary = buffer.indexOf("<newline>");
+    while (eventBoundary !== -1) {
+      const eventStr = buffer.slice(0, eventBoundary);
+      buffer = buffer.slice(eventBoundary + "<newline>".length);
+      if (eventStr.startsWith("::message::")) {
+        onMessage(JSON.parse(eventStr.slice("::message::".length)));
+      } else if (eventStr.startsWith("::agent::")) {
+        onAgent(JSON.parse(eventStr.slice("::agent::".length)));
+      } else if (eventStr.startsWith("::done::")) {
+        return JSON.parse(eventStr.slice("::done::".length)) as ChatResponse;
+      } else if (eventStr.startsWith("::error::")) {
+        throw new Error(eventStr.slice("::error::".length));
+      }
+      eventBoundary = buffer.indexOf("<newline>");
+    }
+  }
+  throw new Error("Stream ended before the plan was complete");
+}
+
 /**
  * Call the backend /run endpoint and return the streamed response as text.
+ * Pass the `X-Run-Id` of an interrupted run to resume it.
  */
-export async function run(workflow: FlowResponse): Promise<Response> {
-  const res = await fetch(`${BASE_URL}/run`, {
+export async function run(workflow: FlowResponse, runId?: string | null): Promise<Response> {
+  const query = runId ? `?run_id=${encodeURIComponent(runId)}` : "";
+  const res = await fetch(`${BASE_URL}/run${query}`, {
     method: "POST",
     headers: { "Content-Type": "application/json" },
     body: JSON.stringify(workflow),